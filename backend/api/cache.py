@@ -0,0 +1,60 @@
+"""
+Small in-process caches for hot read paths.
+
+Each API worker keeps its own copy, so every entry also carries a TTL:
+explicit invalidation keeps this process fresh, the TTL bounds staleness
+after writes made by another process (e.g. the bot importing Excel).
+"""
+import time
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    """Dict with per-entry expiry and a size cap (oldest entry evicted first)."""
+
+    def __init__(self, ttl: float, maxsize: int = 1024):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data: Dict[Hashable, Tuple[float, Any]] = {}
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None:
+            return default
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            self._data.pop(key, None)
+            return default
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        if key not in self._data and len(self._data) >= self.maxsize:
+            # dicts keep insertion order, so the first key is the oldest
+            self._data.pop(next(iter(self._data)))
+        self._data[key] = (time.monotonic() + (ttl or self.ttl), value)
+
+    def pop(self, key: Hashable) -> None:
+        self._data.pop(key, None)
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+# Active product totals per (category_id, subcategory_id) filter
+product_counts = TTLCache(ttl=300)
+
+# Price/stock snapshots for the cart validation the Mini App polls
+cart_products = TTLCache(ttl=5, maxsize=10000)
+
+# Telegram file_id -> file_path from getFile. Telegram keeps a path valid
+# for at least an hour; stay safely below that.
+telegram_file_paths = TTLCache(ttl=50 * 60, maxsize=50000)
+
+
+def invalidate_products() -> None:
+    """Drop every cached value derived from the products table."""
+    product_counts.clear()
+    cart_products.clear()
@@ -45,5 +45,8 @@ async def get_db():
 
 async def init_db():
     """Initialize database tables."""
+    from .migrations import run_migrations
+
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await run_migrations(conn)
@@ -1,93 +1,357 @@
+"""
+Bulk import of supplier price lists (Excel or CSV) into the catalog.
+
+The file is parsed by api.price_list as a stream of normalized batches,
+in a separate process (jobs.stream_in_process) whose bounded queue keeps
+memory flat for lists of any length. Categories, subcategories and
+products are looked up in dicts loaded once per import, and each batch is
+written with one INSERT ... ON CONFLICT DO UPDATE statement: rows matching
+an existing product carry its id and update it, the rest are inserted.
+Rows match products by article (Артикул, unique in the catalog) and, for
+rows without one or with an article the catalog doesn't know yet, by
+category and name; a product matched by article can be renamed or moved.
+A row without an article leaves the product's own article in place.
+
+Each batch is diffed against the current values of the matched products
+in one vectorized pass: new rows are inserted, changed ones updated, and
+unchanged ones not written at all, so their updated_at stays put. A dry
+run computes the same diff (plus products missing from the file) without
+writing anything and returns it as the job result.
+
+Every batch is committed on its own as soon as it is parsed, so checkouts
+can write in between. Re-running an interrupted import is safe.
+"""
+import os
+from contextlib import aclosing
+from itertools import islice
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
 import pandas as pd
-from sqlalchemy import select
+from sqlalchemy import insert, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from api import jobs, search_index
+from api.cache import invalidate_products
 from api.database import AsyncSessionLocal
+from api.price_list import MAX_REPORTED_ERRORS, PriceList, read_batches
 from api.models import Category, Subcategory, Product
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-async def process_excel_import(file_path: str):
+# Columns an import overwrites on products that already exist
+UPDATED_COLUMNS = (
+    'name', 'category_id', 'subcategory_id', 'sku', 'price_per_unit', 'pieces_per_pack', 'description', 'updated_at'
+)
+# Of those, the ones that come from the file and are compared by the diff
+DIFF_COLUMNS = UPDATED_COLUMNS[:-1]
+
+# Examples of each kind of change listed in the report
+REPORT_SAMPLES = 20
+
+
+class CatalogIds:
+    """
+    Ids the import matches rows against, and the current values of matched
+    products, loaded with one query per table. Kept up to date as batches
+    create categories, subcategories and products; a dry run hands out
+    provisional (negative) ids instead of creating anything.
+    """
+
+    def __init__(self, dry_run: bool = False):
+        self.dry_run = dry_run
+        self.categories: Dict[str, int] = {}
+        self.subcategories: Dict[Tuple[int, str], int] = {}
+        # (name, category_id) -> id, the oldest product for duplicates
+        self.products: Dict[Tuple[str, int], int] = {}
+        self.skus: Dict[str, int] = {}
+        # id -> values of DIFF_COLUMNS, as last written (or as a dry run would write them)
+        self.values: Dict[int, Tuple] = {}
+        # Ids of the products in the catalog before the import, and those the file listed
+        self.existing: Set[int] = set()
+        self.seen: Set[int] = set()
+        self.new_categories: List[str] = []
+        self.new_subcategories: List[str] = []
+        self._next_provisional = -1
+
+    def provisional_id(self) -> int:
+        """Stand-in id for something a dry run would create."""
+        self._next_provisional -= 1
+        return self._next_provisional + 1
+
+    @classmethod
+    async def load(cls, session, dry_run: bool = False) -> "CatalogIds":
+        ids = cls(dry_run)
+        for name, category_id in await session.execute(select(Category.name, Category.id).order_by(Category.id)):
+            ids.categories.setdefault(name, category_id)
+        result = await session.execute(
+            select(Subcategory.category_id, Subcategory.name, Subcategory.id).order_by(Subcategory.id)
+        )
+        for category_id, name, subcategory_id in result:
+            ids.subcategories.setdefault((category_id, name), subcategory_id)
+        result = await session.execute(
+            select(Product.id, *(getattr(Product, column) for column in DIFF_COLUMNS)).order_by(Product.id)
+        )
+        for product_id, *values in result:
+            row = dict(zip(DIFF_COLUMNS, values))
+            row['price_per_unit'] = float(row['price_per_unit'])
+            ids.remember(product_id, row)
+        ids.existing = set(ids.values)
+        return ids
+
+    async def category_ids(self, session, names: Iterable[str]) -> Dict[str, int]:
+        """Category name -> id, creating the missing ones in one statement."""
+        missing = [name for name in dict.fromkeys(names) if name not in self.categories]
+        self.new_categories.extend(missing)
+        if missing and self.dry_run:
+            self.categories.update((name, self.provisional_id()) for name in missing)
+        elif missing:
+            result = await session.execute(
+                insert(Category).returning(Category.name, Category.id), [{'name': name} for name in missing]
+            )
+            self.categories.update(result.all())
+        return self.categories
+
+    async def subcategory_ids(self, session, keys: Iterable[Tuple[int, str]]) -> Dict[Tuple[int, str], int]:
+        """(category_id, name) -> subcategory id, creating the missing ones in one statement."""
+        missing = [key for key in dict.fromkeys(keys) if key not in self.subcategories]
+        self.new_subcategories.extend(name for _, name in missing)
+        if missing and self.dry_run:
+            self.subcategories.update((key, self.provisional_id()) for key in missing)
+        elif missing:
+            result = await session.execute(
+                insert(Subcategory).returning(Subcategory.category_id, Subcategory.name, Subcategory.id),
+                [{'category_id': category_id, 'name': name} for category_id, name in missing]
+            )
+            self.subcategories.update({(category_id, name): sub_id for category_id, name, sub_id in result})
+        return self.subcategories
+
+    def remember(self, product_id: int, row: Dict[str, Any]) -> None:
+        """Current values of a product, as loaded or written."""
+        self.values[product_id] = tuple(row[column] for column in DIFF_COLUMNS)
+        self.products.setdefault((row['name'], row['category_id']), product_id)
+        if row['sku'] is not None:
+            self.skus.setdefault(row['sku'], product_id)
+
+    def match(self, sku: Optional[str], name: str, category_id: int, claimed: Dict[int, Optional[str]]) -> Optional[int]:
+        """
+        Id of the product a row updates: by article, else by category and name.
+        `claimed` maps the products matched so far in the batch to the article
+        of the row that took them.
+        """
+        if sku is not None and sku in self.skus:
+            product_id = self.skus[sku]
+        else:
+            product_id = self.products.get((name, category_id))
+            if product_id is not None and sku is not None:
+                current = self.values[product_id][DIFF_COLUMNS.index('sku')]
+                # Same name but another article: a different product. A product without
+                # an article goes to the first row naming it, the next articles are new
+                if current not in (None, sku) or claimed.get(product_id, sku) != sku:
+                    return None
+        if product_id is not None:
+            claimed.setdefault(product_id, sku)
+        return product_id
+
+    def missing_names(self) -> List[str]:
+        """Names of catalog products the file didn't list (shown: REPORT_SAMPLES)."""
+        name = DIFF_COLUMNS.index('name')
+        return [self.values[product_id][name] for product_id in sorted(self.existing - self.seen)]
+
+
+class ImportReport:
+    """What an import changed, or would change in a dry run."""
+
+    def __init__(self, dry_run: bool):
+        self.dry_run = dry_run
+        self.rows = self.added = self.updated = self.unchanged = self.skipped = 0
+        self.changed_fields: Dict[str, int] = dict.fromkeys(DIFF_COLUMNS, 0)
+        self.samples: Dict[str, List] = {'added': [], 'changed': []}
+
+    def sample(self, kind: str, items: Iterable) -> None:
+        room = REPORT_SAMPLES - len(self.samples[kind])
+        if room > 0:
+            self.samples[kind].extend(islice(items, room))
+
+    def result(self, catalog: CatalogIds) -> Dict[str, Any]:
+        missing = catalog.missing_names()
+        if self.dry_run:
+            message = (
+                f"🔍 Проверка файла, ничего не записано\nНовых товаров: {self.added}\n"
+                f"Изменится: {self.updated}\nБез изменений: {self.unchanged}"
+            )
+        else:
+            message = (
+                f"✅ Импорт завершен!\nДобавлено: {self.added}\nОбновлено: {self.updated}\n"
+                f"Без изменений: {self.unchanged}"
+            )
+        if missing:
+            message += f"\nНет в файле: {len(missing)}"
+        if catalog.new_categories:
+            message += f"\nНовых категорий: {len(catalog.new_categories)}"
+        if self.skipped:
+            message += f"\nПропущено строк: {self.skipped}"
+        return {
+            "dry_run": self.dry_run,
+            "rows": self.rows,
+            "added": self.added,
+            "updated": self.updated,
+            "unchanged": self.unchanged,
+            "skipped": self.skipped,
+            "missing": len(missing),
+            "changed_fields": self.changed_fields,
+            "new_categories": catalog.new_categories[:REPORT_SAMPLES],
+            "new_subcategories": len(catalog.new_subcategories),
+            "samples": {**self.samples, "missing": missing[:REPORT_SAMPLES]},
+            "message": message,
+        }
+
+
+def _upsert_statement():
+    stmt = sqlite_insert(Product.__table__)
+    return stmt.on_conflict_do_update(
+        index_elements=[Product.__table__.c.id],
+        set_={column: stmt.excluded[column] for column in UPDATED_COLUMNS}
+    ).returning(*(Product.__table__.c[column] for column in ('id', 'sku', 'name', 'category_id')))
+
+
+def _same(new: pd.Series, old: pd.Series) -> pd.Series:
+    """Element-wise equality where two missing values are equal too."""
+    return new.eq(old) | (new.isna() & old.isna())
+
+
+async def import_batch(session, catalog: CatalogIds, report: ImportReport, frame: pd.DataFrame) -> None:
+    """
+    Diff one batch of normalized rows against the catalog and write the new
+    and changed ones (nothing in a dry run), then commit.
+    """
+    if frame.empty:
+        return
+    category_ids = await catalog.category_ids(session, frame['category'])
+    frame = frame.assign(category_id=frame['category'].map(category_ids))
+
+    with_sub = frame[frame['subcategory'].notna()]
+    subcategory_ids = await catalog.subcategory_ids(session, zip(with_sub['category_id'], with_sub['subcategory']))
+    frame = frame.assign(subcategory_id=[
+        subcategory_ids[(category_id, name)] if not pd.isna(name) else None
+        for category_id, name in zip(frame['category_id'], frame['subcategory'])
+    ])
+    # One lookup for the whole batch against the preloaded article and name maps
+    claimed: Dict[int, Optional[str]] = {}
+    frame = frame.assign(id=[
+        catalog.match(None if pd.isna(sku) else sku, name, category_id, claimed)
+        for sku, name, category_id in zip(frame['sku'], frame['name'], frame['category_id'])
+    ])
+
+    values = frame[['id', 'name', 'category_id', 'subcategory_id', 'sku', 'price', 'pack', 'description']].rename(
+        columns={'price': 'price_per_unit', 'pack': 'pieces_per_pack'}
+    ).astype(object)
+    values = values.where(values.notna(), None)
+
+    # Set-based diff: current values of the matched products, lined up with the rows
+    existing = values['id'].notna()
+    current = pd.DataFrame(
+        [catalog.values[product_id] for product_id in values.loc[existing, 'id']],
+        columns=list(DIFF_COLUMNS), index=values.index[existing], dtype=object
+    )
+    # A row without an article (or a file without the column) keeps the product's own
+    keep_sku = existing & values['sku'].isna()
+    values['sku'] = values['sku'].where(~keep_sku, current['sku'].reindex(values.index))
+    changed = pd.DataFrame({
+        column: ~_same(values.loc[existing, column], current[column]) for column in DIFF_COLUMNS
+    }, index=current.index)
+    is_changed = changed.any(axis=1)
+    catalog.seen.update(values.loc[existing, 'id'])
+
+    report.added += int((~existing).sum())
+    report.updated += int(is_changed.sum())
+    report.unchanged += int((~is_changed).sum())
+    for column in DIFF_COLUMNS:
+        report.changed_fields[column] += int(changed[column].sum())
+    report.sample('added', values.loc[~existing, 'name'])
+    if len(report.samples['changed']) < REPORT_SAMPLES:
+        # (Sub)categories by name: ids mean nothing to a reader (and are made up in a dry run)
+        names = {
+            'category_id': {category_id: name for name, category_id in catalog.categories.items()},
+            'subcategory_id': {sub_id: name for (_, name), sub_id in catalog.subcategories.items()},
+        }
+
+        def shown(column, value):
+            return names[column].get(value) if column in names else value
+
+        report.sample('changed', (
+            {
+                'name': values.at[i, 'name'],
+                'fields': {
+                    column: [shown(column, current.at[i, column]), shown(column, values.at[i, column])]
+                    for column in DIFF_COLUMNS if changed.at[i, column]
+                },
+            }
+            for i in is_changed[is_changed].index
+        ))
+
+    # Unchanged rows are not written: no write amplification, no updated_at churn
+    to_write = values[~existing | is_changed.reindex(values.index, fill_value=False)]
+    rows = to_write.to_dict('records')
+    if catalog.dry_run:
+        for row in rows:
+            if row['id'] is None:
+                row['id'] = catalog.provisional_id()
+    elif rows:
+        result = await session.execute(_upsert_statement(), rows)
+        # New products get their ids here, so a later batch listing them again updates them.
+        # RETURNING order isn't the rows' order (asking for it costs a statement per row),
+        # but the key normalize() deduplicated on is unique within the batch.
+        written = {sku if sku is not None else (name, category_id): product_id
+                   for product_id, sku, name, category_id in result}
+        for row in rows:
+            if row['id'] is None:
+                row['id'] = written[row['sku'] if row['sku'] is not None else (row['name'], row['category_id'])]
+        await session.commit()
+    for row in rows:
+        catalog.remember(row['id'], row)
+
+
+async def import_job(job: jobs.Job, file_path: str, dry_run: bool = False) -> Dict[str, Any]:
     """
-    Обработка Excel файла и импорт в БД.
+    Импорт прайс-листа как фоновая задача (jobs.start). Файл удаляется в конце.
+    С dry_run ничего не записывает и только возвращает отчет об изменениях.
     Колонки: Категория, Подкатегория, Наименование, Артикул, Цена (за 1 шт/₽), Кол-во в пачке (шт), Описание
     """
+    report = ImportReport(dry_run)
     try:
-        df = pd.read_excel(file_path)
-        # Очистка названий колонок от лишних пробелов
-        df.columns = [c.strip() for c in df.columns]
-        
+        job.report(0, stage="parsing")
         async with AsyncSessionLocal() as session:
-            count_added = 0
-            count_updated = 0
-            
-            for _, row in df.iterrows():
-                cat_name = str(row.get('Категория', '')).strip()
-                sub_name = str(row.get('Подкатегория', '')).strip()
-                name = str(row.get('Наименование', '')).strip()
-                article = str(row.get('Артикул', '')).strip()
-                price = row.get('Цена (за 1 шт/₽)', 0)
-                pack_size = row.get('Кол-во в пачке (шт)', 1)
-                desc = str(row.get('Описание', '')).strip()
-                
-                if not name or name == 'nan':
-                    continue
-                
-                # 1. Поиск категории
-                res = await session.execute(select(Category).where(Category.name == cat_name))
-                category = res.scalars().first()
-                if not category:
-                    category = Category(name=cat_name)
-                    session.add(category)
-                    await session.flush()
-                
-                # 2. Поиск подкатегории (если есть)
-                subcategory_id = None
-                if sub_name and sub_name != 'nan':
-                    res = await session.execute(
-                        select(Subcategory).where(
-                            Subcategory.category_id == category.id,
-                            Subcategory.name == sub_name
-                        )
-                    )
-                    subcategory = res.scalars().first()
-                    if not subcategory:
-                        subcategory = Subcategory(category_id=category.id, name=sub_name)
-                        session.add(subcategory)
-                        await session.flush()
-                    subcategory_id = subcategory.id
-                
-                # 3. Поиск и обновление/создание товара
-                res = await session.execute(
-                    select(Product).where(
-                        Product.name == name,
-                        Product.category_id == category.id
-                    )
-                )
-                product = res.scalars().first()
-                
-                if product:
-                    product.price_per_unit = price
-                    product.pieces_per_pack = int(pack_size)
-                    product.description = desc if desc != 'nan' else None
-                    product.subcategory_id = subcategory_id
-                    count_updated += 1
-                else:
-                    product = Product(
-                        name=name,
-                        category_id=category.id,
-                        subcategory_id=subcategory_id,
-                        price_per_unit=price,
-                        pieces_per_pack=int(pack_size),
-                        description=desc if desc != 'nan' else None,
-                        active=True
-                    )
-                    session.add(product)
-                    count_added += 1
-            
+            catalog = await CatalogIds.load(session, dry_run)
             await session.commit()
-            return f"✅ Импорт завершен!\nДобавлено: {count_added}\nОбновлено: {count_updated}"
-            
-    except Exception as e:
-        logger.error(f"Excel import error: {e}")
-        return f"❌ Ошибка при обработке файла: {str(e)}"
+            async with aclosing(jobs.stream_in_process(read_batches, file_path)) as batches:
+                async for batch in batches:
+                    if not isinstance(batch, PriceList):
+                        # Row count estimate, ahead of the first batch
+                        job.report(0, total=batch, stage="comparing" if dry_run else "writing")
+                        continue
+                    await import_batch(session, catalog, report, batch.rows)
+                    report.rows += batch.total
+                    report.skipped += batch.skipped
+                    job.errors.extend(batch.errors[:MAX_REPORTED_ERRORS - len(job.errors)])
+                    job.report(job.done + batch.total)
+    finally:
+        if not dry_run:
+            invalidate_products()
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        # Also after a failure midway: the batches before it are committed.
+        # Re-indexing everything at once beats thousands of single upserts;
+        # the new index is swapped in, so searches meanwhile use the old one.
+        # Read search_index.index each time: a rebuild replaces the object
+        if not dry_run and (report.added or report.updated):
+            job.report(job.done, total=job.done, stage="indexing")
+            if search_index.index.ready:
+                await search_index.build_index()
+
+    result = report.result(catalog)
+    logger.info(
+        f"Price list import{' (dry run)' if dry_run else ''}: {job.done} rows, {report.added} added, "
+        f"{report.updated} updated, {report.unchanged} unchanged, {result['missing']} missing, {report.skipped} skipped"
+    )
+    return result
@@ -0,0 +1,37 @@
+"""
+Shared outbound HTTP client of the API process.
+
+Every call to Telegram (getFile, file downloads, admin notifications)
+goes through one pooled httpx.AsyncClient, so connections and their TLS
+sessions are reused instead of being set up again for each request. With
+HTTP/2, concurrent calls to api.telegram.org share a single connection.
+The client is opened in the app lifespan and closed on shutdown.
+"""
+import os
+from typing import Optional
+
+import httpx
+
+# Overridable for a self-hosted Bot API server
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", "https://api.telegram.org")
+
+# api.telegram.org is the only host we talk to; HTTP/2 multiplexes on top
+LIMITS = httpx.Limits(max_connections=50, max_keepalive_connections=20, keepalive_expiry=60)
+TIMEOUT = httpx.Timeout(10.0, connect=5.0)
+
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """The shared client, created on first use outside the app lifespan (scripts)."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(http2=True, limits=LIMITS, timeout=TIMEOUT)
+    return _client
+
+
+async def close() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
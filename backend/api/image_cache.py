@@ -0,0 +1,297 @@
+"""
+Persistent on-disk cache for proxied Telegram images.
+
+Files live under /data/image_cache (the persistent volume) or
+backend/data/image_cache locally, named by a hash of their key. The
+cache keeps total size under a byte budget by evicting the least
+recently used files. Writes go to a temp file first and are renamed into
+place, so readers never see a partial image. Concurrent misses for the
+same key share one upstream fetch.
+
+Downloads are streamed: chunks are appended to the temp file as they
+arrive, and every client waiting for that file reads along from it.
+Clients get the first bytes right away and nothing is held in memory.
+"""
+import asyncio
+import hashlib
+import logging
+import mimetypes
+import os
+import tempfile
+from collections import OrderedDict
+from pathlib import Path
+from typing import AsyncIterator, Awaitable, BinaryIO, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# Largest read a streaming client does from the temp file at once
+READ_CHUNK_SIZE = 64 * 1024
+
+# (file path, content type)
+Entry = Tuple[Path, str]
+
+# What a download opener returns: (content type, body chunks, close callback)
+Upstream = Tuple[str, AsyncIterator[bytes], Callable[[], Awaitable[None]]]
+
+
+def _default_dir() -> Path:
+    if os.getenv("IMAGE_CACHE_DIR"):
+        return Path(os.getenv("IMAGE_CACHE_DIR"))
+    if os.path.exists("/data"):
+        return Path("/data/image_cache")
+    return Path(__file__).resolve().parent.parent / "data" / "image_cache"
+
+
+def _extension(content_type: str) -> str:
+    if content_type == "image/jpeg":
+        return ".jpg"
+    return mimetypes.guess_extension(content_type) or ".bin"
+
+
+def _content_type(path: Path) -> str:
+    return mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+
+
+class ImageCache:
+    """Size-bounded LRU of files on disk."""
+
+    def __init__(self, directory: Path, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        # file stem (key hash) -> (path, size), least recently used first
+        self._files: "OrderedDict[str, Tuple[Path, int]]" = OrderedDict()
+        self._size = 0
+        self._inflight: Dict[str, "asyncio.Task[Entry]"] = {}
+        self._downloads: Dict[str, "Download"] = {}
+        self._loaded = False
+
+    def _load(self) -> None:
+        """Index files left by previous runs, oldest access first."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        found = []
+        for path in self.directory.iterdir():
+            if path.name.startswith("."):
+                # Temp file of an interrupted write
+                path.unlink(missing_ok=True)
+                continue
+            stat = path.stat()
+            found.append((stat.st_mtime, path, stat.st_size))
+        for _, path, size in sorted(found, key=lambda f: f[0]):
+            self._files[path.stem] = (path, size)
+            self._size += size
+        self._loaded = True
+        logger.info(f"Image cache: {len(self._files)} files, {self._size} bytes in {self.directory}")
+
+    @staticmethod
+    def _hash(key: str) -> str:
+        return hashlib.sha256(key.encode()).hexdigest()
+
+    def __contains__(self, key: str) -> bool:
+        """Whether key is cached, without counting as an access."""
+        if not self._loaded:
+            self._load()
+        return self._hash(key) in self._files
+
+    def get(self, key: str) -> Optional[Entry]:
+        """Cached file for key, marking it recently used."""
+        if not self._loaded:
+            self._load()
+        name = self._hash(key)
+        entry = self._files.get(name)
+        if entry is None:
+            return None
+        path = entry[0]
+        try:
+            # mtime doubles as last access time across restarts
+            os.utime(path)
+        except FileNotFoundError:
+            self._forget(name)
+            return None
+        self._files.move_to_end(name)
+        return path, _content_type(path)
+
+    def _forget(self, name: str) -> None:
+        entry = self._files.pop(name, None)
+        if entry is not None:
+            self._size -= entry[1]
+
+    def _write(self, name: str, data: bytes, content_type: str) -> Path:
+        """Atomically place data under its final name (runs in a thread)."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.directory / f"{name}{_extension(content_type)}"
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix=".")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
+        return path
+
+    async def put(self, key: str, data: bytes, content_type: str) -> Entry:
+        """Store data for key and evict old files over the budget."""
+        if not self._loaded:
+            self._load()
+        name = self._hash(key)
+        path = await asyncio.to_thread(self._write, name, data, content_type)
+        self._register(name, path, len(data))
+        return path, content_type
+
+    def _register(self, name: str, path: Path, size: int) -> None:
+        """Account for a file just placed at path and evict over the budget."""
+        old = self._files.get(name)
+        if old is not None and old[0] != path:
+            old[0].unlink(missing_ok=True)
+        self._forget(name)
+        self._files[name] = (path, size)
+        self._size += size
+        self._evict()
+
+    def _evict(self) -> None:
+        while self._size > self.max_bytes and len(self._files) > 1:
+            name, (path, _) = next(iter(self._files.items()))
+            self._forget(name)
+            path.unlink(missing_ok=True)
+
+    async def fetch(self, key: str, loader: Callable[[], Awaitable[Tuple[bytes, str]]]) -> Entry:
+        """
+        Cached file for key, calling loader() -> (data, content_type) on a miss.
+        Concurrent misses for one key wait on a single loader call; the load
+        is shielded so a disconnecting client doesn't cancel it for the rest.
+        """
+        entry = self.get(key)
+        if entry is not None:
+            return entry
+
+        task = self._inflight.get(key)
+        if task is None:
+            async def load() -> Entry:
+                try:
+                    data, content_type = await loader()
+                    return await self.put(key, data, content_type)
+                finally:
+                    self._inflight.pop(key, None)
+
+            task = asyncio.create_task(load())
+            self._inflight[key] = task
+        return await asyncio.shield(task)
+
+    def download(self, key: str, opener: Callable[[], Awaitable[Upstream]]) -> "Download":
+        """The running download of key, started with opener() if there is none."""
+        if not self._loaded:
+            self._load()
+        download = self._downloads.get(key)
+        if download is None:
+            download = Download(self, key, opener)
+            self._downloads[key] = download
+        return download
+
+
+class Download:
+    """One upstream file being written into the cache while clients read along."""
+
+    def __init__(self, cache: ImageCache, key: str, opener: Callable[[], Awaitable[Upstream]]):
+        self.cache = cache
+        self.key = key
+        self.content_type: Optional[str] = None
+        self.entry: Optional[Entry] = None
+        self.error: Optional[BaseException] = None
+        self.done = False
+        self._written = 0
+        self._tmp: Optional[str] = None
+        self._started = asyncio.Event()
+        self._changed = asyncio.Event()
+        self._task = asyncio.create_task(self._run(opener))
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def _run(self, opener) -> None:
+        name = ImageCache._hash(self.key)
+        close = None
+        try:
+            content_type, chunks, close = await opener()
+            self.cache.directory.mkdir(parents=True, exist_ok=True)
+            fd, self._tmp = tempfile.mkstemp(dir=self.cache.directory, prefix=".")
+            self.content_type = content_type
+            self._started.set()
+            with os.fdopen(fd, "wb") as f:
+                async for chunk in chunks:
+                    # Small sequential writes land in the page cache; readers
+                    # follow with their own file handles
+                    f.write(chunk)
+                    f.flush()
+                    self._written += len(chunk)
+                    self._notify()
+            # Rename and mark done with no await in between, so a reader
+            # either opens the temp file before the rename or sees done
+            path = self.cache.directory / f"{name}{_extension(content_type)}"
+            os.replace(self._tmp, path)
+            self.cache._register(name, path, self._written)
+            self.entry = (path, content_type)
+        except BaseException as e:
+            self.error = e
+            if self._tmp:
+                # Never cache a partial file; the next request starts over
+                Path(self._tmp).unlink(missing_ok=True)
+            if isinstance(e, asyncio.CancelledError):
+                raise
+            if self.content_type is not None:
+                # Clients reading along already got a 200 and part of the body
+                logger.warning(f"Download of {self.key} failed after {self._written} bytes: {e!r}")
+        finally:
+            self.done = True
+            self._started.set()
+            self._notify()
+            self.cache._downloads.pop(self.key, None)
+            if close is not None:
+                await close()
+
+    async def started(self) -> str:
+        """Content type once the upstream answered; raises what the opener raised."""
+        await self._started.wait()
+        if self.content_type is None:
+            raise self.error
+        return self.content_type
+
+    async def result(self) -> Entry:
+        """The cached file once the download has finished."""
+        await asyncio.shield(self._task)
+        if self.error is not None:
+            raise self.error
+        return self.entry
+
+    def reader(self) -> AsyncIterator[bytes]:
+        """
+        Chunks of the file from the start, following the download as it grows.
+        Opens the temp file right away, so call it before the download is done.
+        """
+        f = open(self._tmp, "rb")
+        return self._follow(f)
+
+    async def _follow(self, f: BinaryIO) -> AsyncIterator[bytes]:
+        with f:
+            position = 0
+            while True:
+                if position < self._written:
+                    chunk = f.read(min(self._written - position, READ_CHUNK_SIZE))
+                    position += len(chunk)
+                    yield chunk
+                    continue
+                if self.done:
+                    if self.error is not None:
+                        # Abort the response: ending it here would pass
+                        # the truncated body off as the whole image
+                        raise self.error
+                    return
+                await self._changed.wait()
+
+
+cache = ImageCache(
+    _default_dir(),
+    max_bytes=int(os.getenv("IMAGE_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES)),
+)
@@ -0,0 +1,164 @@
+"""
+Pillow image processing for the image routes.
+
+Decoding, resizing and WebP encoding are CPU-bound, so they never run on
+the event loop: callers go through run(), which hands the work to a
+small thread pool (Pillow releases the GIL in its C code). The pool's
+queue is bounded; when it is full run() fails fast with ImagingBusy
+instead of letting a bulk upload delay everything queued behind it.
+"""
+import asyncio
+import base64
+import io
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from pathlib import Path
+from typing import Callable, Dict, List, Sequence, TypeVar
+
+from PIL import Image, features
+
+T = TypeVar("T")
+
+# Longest side in pixels for each ?size= of the image proxy
+IMAGE_SIZES = {
+    "small": 300,    # catalog tiles, cart
+    "medium": 600,
+    "large": 1200,   # product page
+}
+VARIANT_QUALITY = 80
+
+# Uploaded photos: a ladder of sizes (longest side, px) for srcset. The
+# largest rung is the main image, THUMB_SIDE the catalog preview.
+UPLOAD_WIDTHS = sorted(
+    int(w) for w in os.getenv("IMAGE_WIDTHS", "150,300,600,1200").split(",") if w.strip()
+)
+UPLOAD_QUALITY = 85
+THUMB_SIDE = 300
+THUMB_QUALITY = 80
+
+# AVIF copies of every rung, when enabled and this Pillow build can encode it
+UPLOAD_AVIF = os.getenv("IMAGE_AVIF", "false").lower() == "true" and features.check("avif")
+AVIF_QUALITY = 60
+
+# Inline blurred preview shown while a product image loads (longest side, px)
+LQIP_SIDE = 16
+LQIP_QUALITY = 30
+
+MAX_WORKERS = min(4, os.cpu_count() or 1)
+# Jobs running or waiting for a worker before run() starts refusing
+MAX_PENDING = MAX_WORKERS * 4
+
+_executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix="imaging")
+# Released from the worker thread when a job finishes, even if its caller is gone
+_slots = threading.BoundedSemaphore(MAX_PENDING)
+
+
+class ImageProcessingError(ValueError):
+    """The data could not be decoded or encoded as an image."""
+
+
+class ImagingBusy(RuntimeError):
+    """The processing queue is full; retry later."""
+
+
+def to_rgb(img: Image.Image) -> Image.Image:
+    """Flatten transparency onto white and convert to RGB for WebP/JPEG output."""
+    if img.mode in ('RGBA', 'LA', 'P'):
+        background = Image.new('RGB', img.size, (255, 255, 255))
+        if img.mode == 'P':
+            img = img.convert('RGBA')
+        background.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
+        return background
+    if img.mode != 'RGB':
+        return img.convert('RGB')
+    return img
+
+
+def webp_variant(source: Path, max_side: int, quality: int = VARIANT_QUALITY) -> bytes:
+    """WebP copy of the image at source, scaled down to fit max_side (never up)."""
+    try:
+        with Image.open(source) as img:
+            # JPEG can decode straight at a reduced scale, much cheaper than full size
+            img.draft("RGB", (max_side, max_side))
+            img = to_rgb(img)
+            img.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+            output = io.BytesIO()
+            img.save(output, "WEBP", quality=quality, method=4)
+            return output.getvalue()
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise ImageProcessingError(str(e)) from e
+
+
+def lqip(img: Image.Image) -> str:
+    """A tiny WebP of img as a data URI, a few hundred bytes."""
+    small = to_rgb(img).copy()
+    small.thumbnail((LQIP_SIDE, LQIP_SIDE), Image.Resampling.BOX)
+    output = io.BytesIO()
+    small.save(output, "WEBP", quality=LQIP_QUALITY)
+    return "data:image/webp;base64," + base64.b64encode(output.getvalue()).decode()
+
+
+def describe_image(source: Path) -> Dict:
+    """Width, height and LQIP placeholder of the image at source."""
+    try:
+        with Image.open(source) as img:
+            width, height = img.size
+            # Only the placeholder needs pixels, and it is tiny
+            img.draft("RGB", (LQIP_SIDE * 4, LQIP_SIDE * 4))
+            return {"width": width, "height": height, "lqip": lqip(img)}
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise ImageProcessingError(str(e)) from e
+
+
+def save_image_set(contents: bytes, upload_dir: Path, name: str, widths: Sequence[int] = None) -> List[Dict]:
+    """
+    Decode an uploaded photo once and store every rung of the width ladder
+    as WebP (plus AVIF if enabled). Rungs larger than the photo are skipped;
+    the photo itself is never scaled up. The largest rung is saved as
+    `{name}.webp`, the others as `{name}_{width}.webp`.
+
+    Returns one dict per file: filename, width, height, type.
+    """
+    widths = sorted(widths or UPLOAD_WIDTHS, reverse=True)
+    try:
+        img = Image.open(io.BytesIO(contents))
+        img = to_rgb(img)
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        raise ImageProcessingError(str(e)) from e
+
+    longest = max(img.size)
+    ladder = [w for w in widths if w < longest]
+    if widths[0] >= longest:
+        # Small photo: keep it at full size as the top rung
+        ladder.insert(0, longest)
+
+    variants = []
+    current = img
+    for i, width in enumerate(ladder):
+        # Each rung is scaled from the previous one, not from the original
+        current = current.copy()
+        current.thumbnail((width, width), Image.Resampling.LANCZOS)
+        stem = name if i == 0 else f"{name}_{width}"
+        quality = UPLOAD_QUALITY if i == 0 else THUMB_QUALITY
+
+        current.save(upload_dir / f"{stem}.webp", "WEBP", quality=quality, optimize=True)
+        variants.append({"filename": f"{stem}.webp", "width": current.width, "height": current.height, "type": "image/webp"})
+        if UPLOAD_AVIF:
+            current.save(upload_dir / f"{stem}.avif", "AVIF", quality=AVIF_QUALITY)
+            variants.append({"filename": f"{stem}.avif", "width": current.width, "height": current.height, "type": "image/avif"})
+    return variants
+
+
+async def run(fn: Callable[..., T], *args, **kwargs) -> T:
+    """Run a processing function in the imaging pool; ImagingBusy if it is full."""
+    if not _slots.acquire(blocking=False):
+        raise ImagingBusy()
+    try:
+        future = _executor.submit(partial(fn, *args, **kwargs))
+    except BaseException:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+    return await asyncio.wrap_future(future)
@@ -0,0 +1,170 @@
+"""
+Background jobs of the API process (Excel imports).
+
+A route starts a job and answers with its id right away; clients poll
+GET /api/admin/jobs/{id} for its progress and result. Jobs of the same
+kind run one at a time, in arrival order. CPU-heavy producers (parsing a
+workbook) run in a separate process through stream_in_process(), so they
+neither block the event loop nor hold the GIL the API threads need, and
+hand their output over a bounded queue as they go.
+
+The registry lives in memory: a restart forgets jobs, and only the last
+KEEP_FINISHED finished jobs are kept.
+"""
+import asyncio
+import logging
+import multiprocessing
+import queue
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Set, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+KEEP_FINISHED = 50
+# Items a producer process may run ahead of its consumer
+STREAM_QUEUE_SIZE = 4
+# How often a consumer waiting on the queue checks that the producer is alive
+STREAM_POLL_INTERVAL = 1.0
+
+_jobs: "OrderedDict[str, Job]" = OrderedDict()
+_locks: Dict[str, asyncio.Lock] = {}
+_tasks: Dict[str, "asyncio.Task[None]"] = {}
+_processes: Set[multiprocessing.process.BaseProcess] = set()
+
+
+class Job:
+    """State of one background job, as returned by the jobs endpoint."""
+
+    def __init__(self, kind: str):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = "queued"  # queued, running, done, failed
+        self.stage: Optional[str] = None
+        self.done = 0
+        self.total: Optional[int] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.errors: List[str] = []
+        self.error: Optional[str] = None
+        self.created_at = datetime.utcnow()
+        self.finished_at: Optional[datetime] = None
+
+    @property
+    def progress(self) -> float:
+        if self.status == "done":
+            return 1.0
+        if not self.total:
+            return 0.0
+        return min(1.0, self.done / self.total)
+
+    def report(self, done: int, total: Optional[int] = None, stage: Optional[str] = None) -> None:
+        """Progress update from the job function."""
+        self.done = done
+        if total is not None:
+            self.total = total
+        if stage is not None:
+            self.stage = stage
+
+
+def get(job_id: str) -> Optional[Job]:
+    return _jobs.get(job_id)
+
+
+def start(kind: str, fn: Callable[[Job], Awaitable[Dict[str, Any]]]) -> Job:
+    """Register a job and run fn(job) in the background; fn returns the result dict."""
+    job = Job(kind)
+    _jobs[job.id] = job
+    _tasks[job.id] = asyncio.create_task(_run(job, fn))
+    _forget_old()
+    return job
+
+
+async def _run(job: Job, fn: Callable[[Job], Awaitable[Dict[str, Any]]]) -> None:
+    lock = _locks.setdefault(job.kind, asyncio.Lock())
+    try:
+        async with lock:
+            job.status = "running"
+            try:
+                job.result = await fn(job)
+                job.status = "done"
+            except Exception as e:
+                logger.exception(f"Job {job.kind} {job.id} failed")
+                job.status = "failed"
+                job.error = str(e)
+            finally:
+                job.finished_at = datetime.utcnow()
+    finally:
+        _tasks.pop(job.id, None)
+
+
+def _forget_old() -> None:
+    finished = [job_id for job_id, job in _jobs.items() if job.finished_at is not None]
+    for job_id in finished[:max(0, len(finished) - KEEP_FINISHED)]:
+        del _jobs[job_id]
+
+
+def _produce(items: "multiprocessing.Queue", stop, fn: Callable[..., Iterable], args: tuple) -> None:
+    """Producer process body: put fn(*args)'s items on the queue, then a marker."""
+    try:
+        for item in fn(*args):
+            if stop.is_set():
+                break
+            items.put(("item", item))
+    except Exception as e:
+        items.put(("error", str(e) or type(e).__name__))
+    else:
+        items.put(("done", None))
+
+
+def _next(items: "multiprocessing.Queue", process) -> tuple:
+    while True:
+        try:
+            return items.get(timeout=STREAM_POLL_INTERVAL)
+        except queue.Empty:
+            if not process.is_alive():
+                raise RuntimeError(f"Процесс обработки завершился аварийно (код {process.exitcode})")
+
+
+async def stream_in_process(fn: Callable[..., Iterable[T]], *args) -> AsyncIterator[T]:
+    """
+    Iterate a picklable generator function run in its own process. The
+    producer blocks once STREAM_QUEUE_SIZE items are waiting, so memory
+    stays bounded whatever the consumer's pace. Closing the iterator early
+    (contextlib.aclosing) stops it.
+    """
+    # spawn: forking a process that runs an event loop and threads is unsafe
+    context = multiprocessing.get_context("spawn")
+    items = context.Queue(STREAM_QUEUE_SIZE)
+    stop = context.Event()
+    process = context.Process(target=_produce, args=(items, stop, fn, args), daemon=True)
+    process.start()
+    _processes.add(process)
+    finished = False
+    try:
+        while True:
+            kind, value = await asyncio.to_thread(_next, items, process)
+            if kind != "item":
+                finished = True
+                if kind == "error":
+                    raise RuntimeError(value)
+                break
+            yield value
+    finally:
+        if not finished:
+            stop.set()
+            # It may be blocked on a full queue nobody will read any more
+            process.terminate()
+        await asyncio.to_thread(process.join)
+        items.close()
+        _processes.discard(process)
+
+
+async def shutdown() -> None:
+    """Cancel running jobs and stop their worker processes. Called on app shutdown."""
+    for task in list(_tasks.values()):
+        task.cancel()
+    for process in list(_processes):
+        process.terminate()
@@ -1,14 +1,18 @@
 """
 FastAPI main application entry point.
 """
+import asyncio
 import os
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
 
+from . import http_client, jobs, outbox
 from .database import init_db
+from .search_index import build_index
 from .routes import categories, products, orders, images, admin
+from .routes.images import describe_product_images, prewarm_file_paths
 
 load_dotenv()
 
@@ -27,8 +31,29 @@ async def lifespan(app: FastAPI):
         await seed_categories()
     except Exception as e:
         print(f"Error seeding categories: {e}")
+    
+    try:
+        await build_index()
+    except Exception as e:
+        print(f"Error building search index: {e}")
+    
+    # One pooled client for all calls to Telegram, closed on shutdown
+    http_client.get_client()
+    
+    # Resolve Telegram image paths in the background; startup doesn't wait
+    prewarm = asyncio.create_task(prewarm_file_paths())
+    # Fill in dimensions/placeholders of images saved before they were recorded
+    describe = asyncio.create_task(describe_product_images())
+    # Deliver queued admin notifications, including those left by a restart
+    dispatcher = asyncio.create_task(outbox.run_dispatcher())
         
     yield
+    
+    prewarm.cancel()
+    describe.cancel()
+    dispatcher.cancel()
+    await jobs.shutdown()
+    await http_client.close()
 
 
 app = FastAPI(
@@ -49,13 +74,15 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Disable Caching for Local Development
+# Disable Caching for Local Development (routes that set their own
+# Cache-Control, like the image proxy, keep it)
 @app.middleware("http")
 async def add_no_cache_header(request, call_next):
     response = await call_next(request)
-    response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
-    response.headers["Pragma"] = "no-cache"
-    response.headers["Expires"] = "0"
+    if "Cache-Control" not in response.headers:
+        response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
+        response.headers["Pragma"] = "no-cache"
+        response.headers["Expires"] = "0"
     return response
 
 from fastapi.staticfiles import StaticFiles
@@ -0,0 +1,58 @@
+"""
+Idempotent schema upgrades that Base.metadata.create_all() can't express.
+Run on every startup right after create_all().
+"""
+import logging
+
+from sqlalchemy import inspect
+from sqlalchemy.exc import IntegrityError
+
+from . import models  # noqa: F401  (registers every table on Base.metadata)
+from .database import Base
+from .search import ensure_fts
+from .stats import backfill as backfill_stats
+
+logger = logging.getLogger(__name__)
+
+
+def _add_missing_columns(sync_conn) -> None:
+    """create_all() never alters existing tables; add nullable columns declared since."""
+    inspector = inspect(sync_conn)
+    for table in Base.metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            if not column.nullable:
+                raise RuntimeError(f"Cannot add NOT NULL column {table.name}.{column.name} automatically")
+            column_type = column.type.compile(dialect=sync_conn.dialect)
+            sync_conn.exec_driver_sql(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}')
+
+
+def _clear_blank_skus(sync_conn) -> None:
+    """Empty articles mean "no article": store NULL so the unique SKU index ignores them."""
+    sync_conn.exec_driver_sql("UPDATE products SET sku = NULL WHERE trim(sku) = ''")
+
+
+def _create_missing_indexes(sync_conn) -> None:
+    """create_all() only indexes new tables; add indexes declared since."""
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            if not index.unique:
+                index.create(sync_conn, checkfirst=True)
+                continue
+            # Existing rows may break a new unique index: leave it out until they are fixed
+            try:
+                with sync_conn.begin_nested():
+                    index.create(sync_conn, checkfirst=True)
+            except IntegrityError:
+                logger.warning(f"Index {index.name} not created: {table.name} has duplicate values, fix them and restart")
+
+
+async def run_migrations(conn) -> None:
+    """Apply all migrations on an open (transactional) connection."""
+    await conn.run_sync(_add_missing_columns)
+    await conn.run_sync(_clear_blank_skus)
+    await conn.run_sync(_create_missing_indexes)
+    await ensure_fts(conn)
+    await conn.run_sync(backfill_stats)
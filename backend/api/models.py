@@ -1,9 +1,9 @@
 """
 SQLAlchemy ORM models for the shop database.
 """
-from datetime import datetime
+from datetime import date, datetime
 from typing import Optional, List
-from sqlalchemy import String, Text, Integer, Numeric, Boolean, ForeignKey, DateTime, BigInteger
+from sqlalchemy import String, Text, Integer, Numeric, Boolean, ForeignKey, DateTime, Date, BigInteger, Index, JSON, text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from .database import Base
 
@@ -33,7 +33,7 @@ class Subcategory(Base):
     __tablename__ = "subcategories"
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-    category_id: Mapped[int] = mapped_column(Integer, ForeignKey("categories.id"), nullable=False)
+    category_id: Mapped[int] = mapped_column(Integer, ForeignKey("categories.id"), nullable=False, index=True)
     name: Mapped[str] = mapped_column(String(255), nullable=False)
     order: Mapped[int] = mapped_column(Integer, default=0)
 
@@ -52,11 +52,23 @@ class ProductImage(Base):
     __tablename__ = "product_images"
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-    product_id: Mapped[int] = mapped_column(Integer, ForeignKey("products.id"), nullable=False)
+    product_id: Mapped[int] = mapped_column(Integer, ForeignKey("products.id"), nullable=False, index=True)
     
     file_id: Mapped[str] = mapped_column(String(255), nullable=True)  # Telegram file_id
     image_url: Mapped[Optional[str]] = mapped_column(String(1000), nullable=True) # External URL
     
+    # Resized copies of uploaded photos (see api.uploads), for srcset
+    thumb_url: Mapped[Optional[str]] = mapped_column(String(1000), nullable=True)
+    variants: Mapped[Optional[list]] = mapped_column(JSON, nullable=True)  # [{url, width, height, type}]
+    
+    # Size of the main image and a tiny inline preview, so the catalog can lay
+    # out tiles and show something before the image itself arrives
+    width: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    height: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    lqip: Mapped[Optional[str]] = mapped_column(Text, nullable=True)  # data:image/webp;base64,...
+    # Failed tries at filling those in; rows that ran out of tries are skipped
+    describe_attempts: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    
     is_main: Mapped[bool] = mapped_column(Boolean, default=False)
     created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
 
@@ -70,6 +82,21 @@ class ProductImage(Base):
 class Product(Base):
     """Product model with wholesale logic."""
     __tablename__ = "products"
+    # One index per catalog listing shape: (active[, category|subcategory], sort key).
+    # SQLite appends the rowid to every index, which covers the id tie-breaker.
+    __table_args__ = (
+        Index("ix_products_active_created", "active", "created_at"),
+        Index("ix_products_active_price", "active", "price_per_unit"),
+        Index("ix_products_active_name", "active", "name"),
+        Index("ix_products_category_created", "active", "category_id", "created_at"),
+        Index("ix_products_category_price", "active", "category_id", "price_per_unit"),
+        Index("ix_products_category_name", "active", "category_id", "name"),
+        Index("ix_products_subcategory_created", "active", "subcategory_id", "created_at"),
+        Index("ix_products_subcategory_price", "active", "subcategory_id", "price_per_unit"),
+        Index("ix_products_subcategory_name", "active", "subcategory_id", "name"),
+        # One product per article; most products have none
+        Index("ux_products_sku", "sku", unique=True, sqlite_where=text("sku IS NOT NULL")),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     category_id: Mapped[int] = mapped_column(Integer, ForeignKey("categories.id"), nullable=False)
@@ -111,6 +138,11 @@ class Product(Base):
 class Order(Base):
     """Customer order model."""
     __tablename__ = "orders"
+    __table_args__ = (
+        Index("ix_orders_user_created", "telegram_user_id", "created_at"),
+        Index("ix_orders_status_created", "status", "created_at"),
+        Index("ix_orders_created", "created_at"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     telegram_user_id: Mapped[int] = mapped_column(BigInteger, nullable=False, index=True)
@@ -138,8 +170,8 @@ class OrderItem(Base):
     __tablename__ = "order_items"
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
-    order_id: Mapped[int] = mapped_column(Integer, ForeignKey("orders.id"), nullable=False)
-    product_id: Mapped[int] = mapped_column(Integer, ForeignKey("products.id"), nullable=False)
+    order_id: Mapped[int] = mapped_column(Integer, ForeignKey("orders.id"), nullable=False, index=True)
+    product_id: Mapped[int] = mapped_column(Integer, ForeignKey("products.id"), nullable=False, index=True)
     
     quantity_packs: Mapped[int] = mapped_column(Integer, nullable=False)
     quantity_pieces: Mapped[int] = mapped_column(Integer, nullable=False)
@@ -152,3 +184,56 @@ class OrderItem(Base):
 
     def __repr__(self):
         return f"<OrderItem(order={self.order_id}, product={self.product_id}, packs={self.quantity_packs})>"
+
+
+class OrderStatsDaily(Base):
+    """Per-day, per-status order rollup maintained by api.stats."""
+    __tablename__ = "order_stats_daily"
+
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    status: Mapped[str] = mapped_column(String(20), primary_key=True)
+
+    orders: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    revenue: Mapped[float] = mapped_column(Numeric(14, 2), default=0, nullable=False)
+
+    def __repr__(self):
+        return f"<OrderStatsDaily(day={self.day}, status='{self.status}', orders={self.orders})>"
+
+
+class ProductSales(Base):
+    """Per-product, per-status sales rollup maintained by api.stats."""
+    __tablename__ = "product_sales"
+
+    product_id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    status: Mapped[str] = mapped_column(String(20), primary_key=True)
+
+    orders: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    quantity_packs: Mapped[int] = mapped_column(Integer, default=0, nullable=False)
+    revenue: Mapped[float] = mapped_column(Numeric(14, 2), default=0, nullable=False)
+
+    def __repr__(self):
+        return f"<ProductSales(product={self.product_id}, status='{self.status}', packs={self.quantity_packs})>"
+
+
+class OutboxMessage(Base):
+    """Telegram message waiting to be sent by api.outbox, one row per recipient."""
+    __tablename__ = "outbox_messages"
+    __table_args__ = (
+        # The dispatcher only ever looks for due pending rows
+        Index("ix_outbox_pending_due", "status", "next_attempt_at"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    chat_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    text: Mapped[str] = mapped_column(Text, nullable=False)
+
+    status: Mapped[str] = mapped_column(String(20), default="pending")  # pending, sent, failed
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    last_error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+    sent_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+
+    def __repr__(self):
+        return f"<OutboxMessage(id={self.id}, chat={self.chat_id}, status='{self.status}')>"
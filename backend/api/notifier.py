@@ -1,12 +1,16 @@
 """
 Notification utility to send messages to Telegram admins.
-Refactored to use httpx instead of aiogram to avoid dependency issues in API.
+
+Messages are not sent here: they are written to the outbox table in the
+caller's transaction (one row per admin) and delivered by api.outbox, so
+a notification is stored if and only if its order is, and survives restarts.
 """
 import os
-import httpx
-import logging
 from typing import List
 from dotenv import load_dotenv
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import OutboxMessage
 
 load_dotenv()
 
@@ -18,16 +22,8 @@ except ValueError:
     print("Error parsing ADMIN_IDS")
     ADMIN_IDS = []
 
-async def notify_new_order(order_data: dict, items: List[dict]):
-    """
-    Send notification about new order to all admins using raw Telegram API.
-    This avoids threading/event loop issues with aiogram in BackgroundTasks.
-    """
-    if not BOT_TOKEN or not ADMIN_IDS:
-        print("Warning: BOT_TOKEN or ADMIN_IDS not set. Notification skipped.")
-        return
-
-    # Format message
+def format_new_order(order_data: dict, items: List[dict]) -> str:
+    """HTML text of the new order message."""
     items_text = ""
     for item in items:
         # Escape HTML special chars if needed, but basic replacement is usually enough for these fields
@@ -43,7 +39,7 @@ async def notify_new_order(order_data: dict, items: List[dict]):
     # Safe getters
     c_name = str(order_data.get('customer_name', 'Unknown')).replace("<", "&lt;")
     
-    message = (
+    return (
         f"🆕 <b>Новый заказ #{order_data.get('id')}</b>\n"
         f"👤 {c_name}{org_text}\n"
         f"📱 {order_data.get('customer_phone')}\n\n"
@@ -51,18 +47,15 @@ async def notify_new_order(order_data: dict, items: List[dict]):
         f"<b>💰 Итого: {order_data.get('total_amount')}₽</b>"
     )
 
-    api_url = f"https://api.telegram.org/bot{BOT_TOKEN}/sendMessage"
 
-    async with httpx.AsyncClient(timeout=10.0) as client:
-        for admin_id in ADMIN_IDS:
-            try:
-                payload = {
-                    "chat_id": admin_id,
-                    "text": message,
-                    "parse_mode": "HTML"
-                }
-                response = await client.post(api_url, json=payload)
-                if response.status_code != 200:
-                    print(f"Failed to send to admin {admin_id}: {response.text}")
-            except Exception as e:
-                print(f"Error sending notification to {admin_id}: {e}")
+def notify_new_order(db: AsyncSession, order_data: dict, items: List[dict]) -> None:
+    """
+    Queue a new order notification for every admin. Adds outbox rows to db
+    without committing: they are saved together with the order.
+    """
+    if not BOT_TOKEN or not ADMIN_IDS:
+        print("Warning: BOT_TOKEN or ADMIN_IDS not set. Notification skipped.")
+        return
+
+    message = format_new_order(order_data, items)
+    db.add_all([OutboxMessage(chat_id=admin_id, text=message) for admin_id in ADMIN_IDS])
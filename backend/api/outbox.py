@@ -0,0 +1,198 @@
+"""
+Delivery of queued Telegram messages (the outbox table).
+
+Rows are added by api.notifier in the same transaction as the order they
+are about. A single dispatcher task, started in the app lifespan, sends
+due rows concurrently through a token bucket that keeps the bot under
+Telegram's ~30 messages/s limit. A 429 answer is retried after its
+`retry_after` and pauses the whole bucket for that long; network errors
+and 5xx answers are retried with exponential backoff; other errors (bot
+blocked, chat not found) fail the row for good.
+
+Delivery is at-least-once: a crash between sending and marking a row
+sent resends it on the next start.
+"""
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+
+import httpx
+from sqlalchemy import delete, func, select, update
+
+from . import http_client
+from .database import AsyncSessionLocal
+from .models import OutboxMessage
+from .notifier import BOT_TOKEN
+
+logger = logging.getLogger(__name__)
+
+# Messages per second across all chats, and how many may go at once
+SEND_RATE = float(os.getenv("NOTIFY_RATE", "25"))
+SEND_BURST = 3
+SEND_CONCURRENCY = 10
+
+BATCH_SIZE = 100
+MAX_ATTEMPTS = 8
+# Backoff after the n-th failed attempt: 5s, 10s, 20s ... capped at an hour
+BACKOFF_BASE = 5
+BACKOFF_MAX = 3600
+# Fallback poll for retries coming due; new rows wake the dispatcher at once
+POLL_INTERVAL = 30
+# Sent and failed rows are kept this long for inspection
+RETENTION_DAYS = 7
+
+_wake = asyncio.Event()
+
+
+class TokenBucket:
+    """Rate limiter: acquire() waits until a token is available."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def pause(self, seconds: float) -> None:
+        """Hand out nothing for `seconds` (Telegram asked us to back off)."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0.0
+
+    async def acquire(self) -> None:
+        # Waiters queue on the lock, so tokens go out in arrival order
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+bucket = TokenBucket(SEND_RATE, SEND_BURST)
+
+
+def wake() -> None:
+    """Tell the dispatcher new rows were committed."""
+    _wake.set()
+
+
+def _backoff(attempts: int) -> timedelta:
+    return timedelta(seconds=min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX))
+
+
+async def _send(message: OutboxMessage) -> Dict:
+    """Send one message; returns the column values to store on its row."""
+    attempts = message.attempts + 1
+    now = datetime.utcnow()
+    await bucket.acquire()
+    try:
+        response = await http_client.get_client().post(
+            f"{http_client.TELEGRAM_API_URL}/bot{BOT_TOKEN}/sendMessage",
+            json={"chat_id": message.chat_id, "text": message.text, "parse_mode": "HTML"}
+        )
+    except httpx.HTTPError as e:
+        error, retry_after = f"{type(e).__name__}: {e}", None
+    else:
+        if response.status_code == 200:
+            return {"id": message.id, "status": "sent", "attempts": attempts, "sent_at": now, "last_error": None}
+        error = f"{response.status_code}: {response.text[:500]}"
+        if response.status_code == 429:
+            try:
+                retry_after = float(response.json()["parameters"]["retry_after"])
+            except (ValueError, KeyError, TypeError):
+                retry_after = float(BACKOFF_BASE)
+            bucket.pause(retry_after)
+        elif response.status_code >= 500:
+            retry_after = None
+        else:
+            # Blocked by the admin, chat not found, bad markup: retrying won't help
+            logger.warning(f"Outbox message {message.id} to {message.chat_id} failed: {error}")
+            return {"id": message.id, "status": "failed", "attempts": attempts, "last_error": error}
+
+    if retry_after is None and attempts >= MAX_ATTEMPTS:
+        logger.warning(f"Outbox message {message.id} to {message.chat_id} gave up: {error}")
+        return {"id": message.id, "status": "failed", "attempts": attempts, "last_error": error}
+    # Flood waits don't count as attempts: the message itself is fine
+    delay = timedelta(seconds=retry_after) if retry_after is not None else _backoff(attempts)
+    return {
+        "id": message.id,
+        "attempts": message.attempts if retry_after is not None else attempts,
+        "next_attempt_at": now + delay,
+        "last_error": error,
+    }
+
+
+async def drain() -> Optional[float]:
+    """Send every due message; seconds until the next retry is due, or None."""
+    semaphore = asyncio.Semaphore(SEND_CONCURRENCY)
+
+    async def send(message: OutboxMessage) -> Dict:
+        async with semaphore:
+            return await _send(message)
+
+    while True:
+        async with AsyncSessionLocal() as session:
+            result = await session.execute(
+                select(OutboxMessage)
+                .where(OutboxMessage.status == "pending", OutboxMessage.next_attempt_at <= datetime.utcnow())
+                .order_by(OutboxMessage.next_attempt_at, OutboxMessage.id)
+                .limit(BATCH_SIZE)
+            )
+            batch = result.scalars().all()
+            if not batch:
+                next_due = await session.scalar(
+                    select(func.min(OutboxMessage.next_attempt_at)).where(OutboxMessage.status == "pending")
+                )
+                if next_due is None:
+                    return None
+                return max(0.0, (next_due - datetime.utcnow()).total_seconds())
+
+            outcomes = await asyncio.gather(*(send(message) for message in batch))
+            # Bulk UPDATE by primary key, one statement per set of columns
+            await session.execute(update(OutboxMessage), list(outcomes))
+            await session.commit()
+
+
+async def prune() -> None:
+    """Delete sent and failed rows older than RETENTION_DAYS."""
+    async with AsyncSessionLocal() as session:
+        await session.execute(
+            delete(OutboxMessage).where(
+                OutboxMessage.status != "pending",
+                OutboxMessage.created_at < datetime.utcnow() - timedelta(days=RETENTION_DAYS)
+            )
+        )
+        await session.commit()
+
+
+async def run_dispatcher() -> None:
+    """Deliver outbox messages until cancelled. Started in the app lifespan."""
+    if not BOT_TOKEN:
+        return
+    await prune()
+    while True:
+        _wake.clear()
+        try:
+            next_due = await drain()
+        except Exception:
+            logger.exception("Outbox dispatch failed")
+            next_due = POLL_INTERVAL
+        timeout = POLL_INTERVAL if next_due is None else min(next_due, POLL_INTERVAL)
+        try:
+            await asyncio.wait_for(_wake.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
@@ -0,0 +1,77 @@
+"""
+Keyset (cursor) pagination helpers.
+
+A cursor is an opaque url-safe token holding the sort key and id of the
+last row of the previous page. The next page seeks past that position
+through the index instead of skipping rows with OFFSET.
+"""
+import base64
+import json
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, List, Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import tuple_
+
+
+def _to_json(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    if isinstance(value, Decimal):
+        return {"dec": str(value)}
+    return value
+
+
+def _from_json(value: Any) -> Any:
+    if isinstance(value, dict):
+        if "dt" in value:
+            return datetime.fromisoformat(value["dt"])
+        if "dec" in value:
+            return Decimal(value["dec"])
+    return value
+
+
+def encode_cursor(*values: Any) -> str:
+    """Pack sort key values into an opaque cursor string."""
+    raw = json.dumps([_to_json(v) for v in values], separators=(",", ":"), ensure_ascii=False)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, size: int) -> List[Any]:
+    """Unpack a cursor produced by encode_cursor(), 400 on garbage."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != size:
+            raise ValueError
+        return [_from_json(v) for v in values]
+    except (ValueError, TypeError, KeyError):
+        raise HTTPException(status_code=400, detail="Некорректный курсор")
+
+
+def keyset_condition(column, id_column, value: Any, last_id: int, descending: bool):
+    """
+    WHERE clause selecting rows strictly after (value, last_id)
+    in ORDER BY column, id_column (both in the same direction).
+
+    A row-value comparison: SQLite turns it into a range seek on the sort
+    column's index, where the equivalent OR of two conditions makes it
+    walk the index from its start and deep pages get slower.
+    """
+    position = tuple_(column, id_column)
+    if descending:
+        return position < tuple_(value, last_id)
+    return position > tuple_(value, last_id)
+
+
+def split_page(rows: list, limit: int, key) -> Tuple[list, Optional[str]]:
+    """
+    Trim a `limit + 1` fetch to one page and build the cursor for the next.
+    The cursor is None when there is nothing after this page.
+    """
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(key(last), last.id)
@@ -0,0 +1,208 @@
+"""
+Parsing of supplier price lists (Excel or CSV) for the catalog import.
+
+Files are read as a stream of validated batches of BATCH_SIZE rows, so
+memory stays flat however long the list is: .xlsx through openpyxl's
+read-only mode, .csv through the csv module (delimiter and encoding are
+detected), legacy .xls through pandas. Each batch is normalized with
+vectorized pandas operations. Nothing here touches the database, so
+the parser can run in a separate process (see api.jobs.stream_in_process).
+"""
+import codecs
+import csv
+import os
+import re
+from itertools import islice
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Sequence, Union
+
+import pandas as pd
+
+# Sheet column -> internal name
+COLUMNS = {
+    'Категория': 'category',
+    'Подкатегория': 'subcategory',
+    'Наименование': 'name',
+    'Артикул': 'sku',
+    'Цена (за 1 шт/₽)': 'price',
+    'Кол-во в пачке (шт)': 'pack',
+    'Описание': 'description',
+}
+TEXT_COLUMNS = ('category', 'subcategory', 'name', 'sku', 'description')
+
+
+def _header_key(header) -> str:
+    # Letters and digits only: a cp1251 CSV export turns "₽" into "?"
+    return re.sub(r'[\W_]', '', str(header)).lower()
+
+
+HEADER_KEYS = {_header_key(header): name for header, name in COLUMNS.items()}
+
+SUPPORTED_EXTENSIONS = ('.xlsx', '.xls', '.csv')
+
+# Rows without a category go here instead of a category literally named "nan"
+DEFAULT_CATEGORY = 'Без категории'
+
+# Rows per batch, which is also one upsert statement (~10 bound parameters a row)
+BATCH_SIZE = 1000
+
+# Row problems listed per batch; the rest are only counted
+MAX_REPORTED_ERRORS = 50
+
+# Bytes sniffed for a CSV file's encoding and delimiter
+CSV_SAMPLE_SIZE = 64 * 1024
+
+
+class PriceList(NamedTuple):
+    """Parsed price list rows plus what was wrong with the others."""
+    rows: pd.DataFrame
+    total: int          # data rows read from the sheet
+    skipped: int        # rows left out (no name)
+    errors: List[str]   # first MAX_REPORTED_ERRORS problems, by sheet row
+
+
+def _column(df: pd.DataFrame, name: str) -> pd.Series:
+    if name in df:
+        return df[name]
+    return pd.Series(pd.NA, index=df.index, dtype=object)
+
+
+def _text(series: pd.Series) -> pd.Series:
+    """Stripped strings; empty cells become NA."""
+    values = series.astype('string').str.strip()
+    return values.mask(values.isin(['', 'nan', 'None']))
+
+
+def _number(series: pd.Series) -> pd.Series:
+    """Numbers, accepting text like '1 250,50' from CSV exports; NaN if not a number."""
+    if pd.api.types.is_numeric_dtype(series):
+        return series.astype(float)
+    text = _text(series).str.replace(r'[\s ]', '', regex=True).str.replace(',', '.', regex=False)
+    return pd.to_numeric(text, errors='coerce')
+
+
+def _sheet_rows(mask: pd.Series) -> List[int]:
+    """Spreadsheet row numbers (header is row 1) where mask is true."""
+    return [int(i) + 2 for i in mask[mask].index[:MAX_REPORTED_ERRORS]]
+
+
+def normalize(df: pd.DataFrame) -> PriceList:
+    """
+    Price list rows with clean typed columns: category, subcategory, name,
+    sku, description (str or NA), price (float), pack (int). Blank rows are
+    ignored, rows without a name are dropped, and a product listed twice
+    (same article, or same category and name when there is none) keeps its
+    last row. Prices and pack sizes that aren't numbers become
+    0 and 1 and are reported. The index of df is the 0-based data row.
+    """
+    df = df.rename(columns=lambda c: HEADER_KEYS.get(_header_key(c), c))
+    df = df[df.notna().any(axis=1)]
+    frame = pd.DataFrame(index=df.index)
+    for name in TEXT_COLUMNS:
+        frame[name] = _text(_column(df, name))
+    frame['category'] = frame['category'].fillna(DEFAULT_CATEGORY)
+    price = _number(_column(df, 'price'))
+    pack = _number(_column(df, 'pack'))
+    frame['price'] = price.fillna(0).round(2)
+    frame['pack'] = pack.fillna(1).astype(int)
+
+    named = frame['name'].notna()
+    # Filled in, but not a number (empty cells just take the default)
+    bad_price = named & price.isna() & _text(_column(df, 'price')).notna()
+    bad_pack = named & pack.isna() & _text(_column(df, 'pack')).notna()
+    errors = (
+        [f"Строка {row}: нет наименования, пропущена" for row in _sheet_rows(~named)]
+        + [f"Строка {row}: цена не число, записана 0" for row in _sheet_rows(bad_price)]
+        + [f"Строка {row}: кол-во в пачке не число, записано 1" for row in _sheet_rows(bad_pack)]
+    )
+    rows = frame[named]
+    key = rows['sku'].fillna('\0' + rows['category'] + '\0' + rows['name'])
+    rows = rows[~key.duplicated(keep='last')]
+    return PriceList(rows, total=len(frame), skipped=int((~named).sum()), errors=errors[:MAX_REPORTED_ERRORS])
+
+
+def _xlsx_rows(file_path: str) -> Iterator[Sequence]:
+    """Cell values row by row, header first; the first item is the row count estimate."""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.active
+        # From the sheet's stored dimensions: may be missing or include blank rows
+        yield max(0, (sheet.max_row or 1) - 1) if sheet.max_row else None
+        yield from sheet.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def _csv_encoding(sample: bytes) -> str:
+    if sample.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    try:
+        sample.decode('utf-8')
+        return 'utf-8'
+    except UnicodeDecodeError as e:
+        # A multi-byte character cut off at the end of the sample is still UTF-8
+        if e.start >= len(sample) - 3:
+            return 'utf-8'
+        return 'cp1251'  # Russian Excel's "CSV" export
+
+
+def _csv_rows(file_path: str) -> Iterator[Sequence]:
+    """Like _xlsx_rows, for a CSV file with ; , or tab as the delimiter."""
+    with open(file_path, 'rb') as f:
+        sample = f.read(CSV_SAMPLE_SIZE)
+        # Line count is cheap to get and close enough for progress
+        lines = sample.count(b'\n') + sum(chunk.count(b'\n') for chunk in iter(lambda: f.read(1 << 20), b''))
+    encoding = _csv_encoding(sample)
+    text = sample.decode(encoding, errors='ignore')
+    try:
+        dialect = csv.Sniffer().sniff(text, delimiters=';,\t')
+    except csv.Error:
+        dialect = csv.excel
+
+    yield max(0, lines - 1)
+    with open(file_path, newline='', encoding=encoding, errors='replace') as f:
+        for row in csv.reader(f, dialect):
+            yield [cell if cell != '' else None for cell in row]
+
+
+def _xls_rows(file_path: str) -> Iterator[Sequence]:
+    """Legacy .xls has no streaming reader: load it with pandas and replay the rows."""
+    df = pd.read_excel(file_path, header=None, dtype=object)
+    yield max(0, len(df) - 1)
+    for row in df.itertuples(index=False):
+        yield [None if pd.isna(v) else v for v in row]
+
+
+def _rows(file_path: str) -> Iterator[Union[Optional[int], Sequence]]:
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension == '.csv':
+        return _csv_rows(file_path)
+    if extension == '.xls':
+        return _xls_rows(file_path)
+    return _xlsx_rows(file_path)
+
+
+def read_batches(file_path: str, batch_size: int = BATCH_SIZE) -> Iterator[Union[Optional[int], PriceList]]:
+    """
+    Stream a price list as normalized batches. The first item is an estimate
+    of the number of data rows (or None), every following one a PriceList.
+    """
+    rows = _rows(file_path)
+    yield next(rows)
+    header = next(rows, None)
+    if header is None:
+        return
+    header = [str(c).strip() if c is not None else f'_{i}' for i, c in enumerate(header)]
+    width = len(header)
+
+    start = 0
+    while True:
+        batch: List[Iterable] = list(islice(rows, batch_size))
+        if not batch:
+            return
+        # CSV rows can be ragged: pad or cut them to the header
+        batch = [(list(row) + [None] * width)[:width] for row in batch]
+        df = pd.DataFrame(batch, columns=header, index=range(start, start + len(batch)), dtype=object)
+        start += len(batch)
+        yield normalize(df)
@@ -2,13 +2,18 @@
 Admin API routes.
 """
 import os
-from fastapi import APIRouter, HTTPException, Header
+from fastapi import APIRouter, Depends, HTTPException, Header, Query
 from fastapi.responses import Response
 from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
 import pandas as pd
 import io
 
+from .. import jobs, stats
+from ..database import get_db
+from ..schemas import JobResponse, StatsResponse
+
 router = APIRouter(prefix="/api/admin", tags=["admin"])
 
 ADMIN_IDS = [int(x.strip()) for x in os.getenv("ADMIN_IDS", "").split(",") if x.strip()]
@@ -23,6 +28,23 @@ async def check_admin(data: AdminCheckRequest):
         raise HTTPException(status_code=403, detail="Not authorized")
     return {"status": "ok", "is_admin": True}
 
+@router.get("/stats", response_model=StatsResponse)
+async def get_stats(
+    days: int = Query(30, ge=1, le=366, description="Days of daily/weekly revenue"),
+    top: int = Query(10, ge=1, le=50, description="Number of top products"),
+    db: AsyncSession = Depends(get_db)
+):
+    """Order counts, revenue by status, top products and revenue per day/week."""
+    return await stats.get_stats(db, days=days, top=top)
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_job(job_id: str):
+    """Progress, row counts and errors of a background job (e.g. an Excel import)."""
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    return job
+
 @router.get("/template")
 async def get_excel_template():
     """Generate and return sample Excel template."""
@@ -66,12 +88,16 @@ async def reset_database(data: AdminCheckRequest):
         raise HTTPException(status_code=403, detail="Not authorized")
     
     from ..database import engine, Base
+    from ..migrations import run_migrations
+    from ..search import drop_fts
     from ..seeder import seed_categories
     
     # Drop all tables
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.drop_all)
+        await drop_fts(conn)
         await conn.run_sync(Base.metadata.create_all)
+        await run_migrations(conn)
         
     # Re-seed
     await seed_categories()
@@ -7,6 +7,8 @@ from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
+from .. import search_index
+from ..cache import invalidate_products
 from ..database import get_db
 from ..models import Category, Subcategory
 from ..schemas import (
@@ -113,9 +115,11 @@ async def delete_category(category_id: int, db: AsyncSession = Depends(get_db)):
         # Delete products
         for product in db_category.products:
             await db.delete(product)
+            search_index.index.remove(product.id)
     
     await db.delete(db_category)
     await db.commit()
+    invalidate_products()
     return MessageResponse(message="Категория удалена")
 
 
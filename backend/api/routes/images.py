@@ -1,145 +1,319 @@
 """
 Image proxy route for serving Telegram images.
 """
+import asyncio
+import logging
 import os
+import tempfile
+from pathlib import Path
+from typing import Dict, Optional
+
 import httpx
-from fastapi import APIRouter, HTTPException, UploadFile, File
-from fastapi.responses import StreamingResponse
+from fastapi import APIRouter, HTTPException, Query, UploadFile, File
+from fastapi.responses import FileResponse, StreamingResponse
+from sqlalchemy import func, select, union, update
 from dotenv import load_dotenv
 
+from .. import http_client, image_cache, imaging, uploads
+from ..cache import telegram_file_paths
+from ..database import AsyncSessionLocal
+from ..models import Product, ProductImage
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/api/images", tags=["images"])
 
 BOT_TOKEN = os.getenv("BOT_TOKEN", "")
 
 
+# Parallel getFile calls while prewarming, kept low for Bot API rate limits
+PREWARM_CONCURRENCY = 4
+
+# Images downloaded and measured in parallel while filling in dimensions
+DESCRIBE_CONCURRENCY = 2
+
+# Failed tries per image before it is left without dimensions for good
+DESCRIBE_ATTEMPTS = 3
+
+# Seconds a description waits for a full imaging pool before giving up
+DESCRIBE_BUSY_WAIT = 30
+
+
+def is_telegram_file_id(value: Optional[str]) -> bool:
+    """Image references that are Telegram file_ids, not URLs or local paths."""
+    return bool(value) and not value.startswith(("http", "/", "assets/"))
+
+
 async def get_telegram_file_path(file_id: str) -> str:
-    """Get file path from Telegram API."""
-    async with httpx.AsyncClient() as client:
-        response = await client.get(
-            f"https://api.telegram.org/bot{BOT_TOKEN}/getFile",
-            params={"file_id": file_id}
-        )
-        data = response.json()
-        
-        if not data.get("ok"):
-            raise HTTPException(status_code=404, detail="Файл не найден")
-        
-        return data["result"]["file_path"]
+    """Get file path from Telegram API (cached for most of its lifetime)."""
+    file_path = telegram_file_paths.get(file_id)
+    if file_path:
+        return file_path
+    
+    response = await http_client.get_client().get(
+        f"{http_client.TELEGRAM_API_URL}/bot{BOT_TOKEN}/getFile",
+        params={"file_id": file_id}
+    )
+    data = response.json()
+    
+    if not data.get("ok"):
+        raise HTTPException(status_code=404, detail="Файл не найден")
+    
+    file_path = data["result"]["file_path"]
+    telegram_file_paths.set(file_id, file_path)
+    return file_path
 
 
-@router.get("/{file_id}")
-async def get_image(file_id: str):
+async def prewarm_file_paths() -> None:
     """
-    Proxy endpoint to serve images from Telegram.
-    Uses file_id to fetch and stream the image.
+    Resolve file paths of every product image that isn't on disk yet, so
+    first views skip the getFile round trip. Run in the background at startup.
     """
     if not BOT_TOKEN:
-        raise HTTPException(status_code=500, detail="Bot token not configured")
+        return
     
-    try:
-        file_path = await get_telegram_file_path(file_id)
-        file_url = f"https://api.telegram.org/file/bot{BOT_TOKEN}/{file_path}"
-        
-        async with httpx.AsyncClient() as client:
-            response = await client.get(file_url)
-            
-            if response.status_code != 200:
-                raise HTTPException(status_code=404, detail="Не удалось загрузить изображение")
-            
-            # Determine content type
-            content_type = response.headers.get("content-type", "image/jpeg")
-            
-            return StreamingResponse(
-                iter([response.content]),
-                media_type=content_type,
-                headers={
-                    "Cache-Control": "public, max-age=86400"  # Cache for 24 hours
-                }
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            union(
+                select(ProductImage.file_id),
+                select(Product.image_file_id),
             )
+        )
+        file_ids = [
+            file_id for file_id in result.scalars().all()
+            if is_telegram_file_id(file_id) and file_id not in image_cache.cache
+        ]
+    
+    semaphore = asyncio.Semaphore(PREWARM_CONCURRENCY)
+    
+    async def resolve(file_id: str) -> bool:
+        async with semaphore:
+            try:
+                await get_telegram_file_path(file_id)
+                return True
+            except (HTTPException, httpx.HTTPError, ValueError):
+                return False
     
+    resolved = sum(await asyncio.gather(*(resolve(file_id) for file_id in file_ids)))
+    logger.info(f"Prewarmed {resolved}/{len(file_ids)} Telegram file paths")
+
+
+async def open_telegram_file(file_id: str) -> image_cache.Upstream:
+    """Start downloading a file from Telegram, returning before the body arrives."""
+    client = http_client.get_client()
+    try:
+        file_path = await get_telegram_file_path(file_id)
+        file_url = f"{http_client.TELEGRAM_API_URL}/file/bot{BOT_TOKEN}/{file_path}"
+        response = await client.send(client.build_request("GET", file_url), stream=True)
     except httpx.RequestError:
         raise HTTPException(status_code=502, detail="Ошибка подключения к Telegram")
+    
+    # Closing the response hands its connection back to the shared pool
+    if response.status_code != 200:
+        await response.aclose()
+        raise HTTPException(status_code=404, detail="Не удалось загрузить изображение")
+    
+    return response.headers.get("content-type", "image/jpeg"), response.aiter_bytes(), response.aclose
+
+
+def _download(file_id: str) -> image_cache.Download:
+    """The (possibly already running) download of a Telegram file into the cache."""
+    if not BOT_TOKEN:
+        raise HTTPException(status_code=500, detail="Bot token not configured")
+    return image_cache.cache.download(file_id, lambda: open_telegram_file(file_id))
+
+
+async def _original(file_id: str) -> image_cache.Entry:
+    """The full-size Telegram file from the disk cache, downloading it if needed."""
+    entry = image_cache.cache.get(file_id)
+    if entry is not None:
+        return entry
+    download = _download(file_id)
+    try:
+        return await download.result()
+    except httpx.HTTPError:
+        raise HTTPException(status_code=502, detail="Ошибка подключения к Telegram")
+
+
+async def _variant(file_id: str, size: str) -> Optional[image_cache.Entry]:
+    """WebP of the image scaled for `size`, made once and cached; None if not an image."""
+    key = f"{file_id}?size={size}"
+    entry = image_cache.cache.get(key)
+    if entry is not None:
+        return entry
+    
+    original, _ = await _original(file_id)
+    
+    async def resize():
+        data = await imaging.run(imaging.webp_variant, original, imaging.IMAGE_SIZES[size])
+        return data, "image/webp"
+    
+    try:
+        return await image_cache.cache.fetch(key, resize)
+    except (imaging.ImageProcessingError, imaging.ImagingBusy):
+        # Not an image, or the pool is saturated: the original will do
+        return None
+
+
+async def _describe_file(path: Path) -> Dict:
+    """imaging.describe_image in the pool, waiting a while for room in it."""
+    for _ in range(DESCRIBE_BUSY_WAIT):
+        try:
+            return await imaging.run(imaging.describe_image, path)
+        except imaging.ImagingBusy:
+            # Background work: let uploads and resizes drain first
+            await asyncio.sleep(1)
+    return await imaging.run(imaging.describe_image, path)
+
+
+async def _describe_telegram_file(file_id: str) -> Dict:
+    """
+    Describe a Telegram original through a temp file. It is not put in the
+    image cache: a startup pass over the catalog would evict the variants
+    that are actually served.
+    """
+    if file_id in image_cache.cache:
+        path, _ = image_cache.cache.get(file_id)
+        return await _describe_file(path)
+    
+    _, chunks, close = await open_telegram_file(file_id)
+    fd, tmp = tempfile.mkstemp(prefix="describe-")
+    try:
+        try:
+            with os.fdopen(fd, "wb") as f:
+                async for chunk in chunks:
+                    f.write(chunk)
+        finally:
+            await close()
+        return await _describe_file(Path(tmp))
+    finally:
+        Path(tmp).unlink(missing_ok=True)
+
+
+async def describe_image(file_id: Optional[str]) -> Optional[Dict]:
+    """
+    Width, height and LQIP of a product image: from its upload manifest,
+    the uploaded file, or the Telegram original. None for images that
+    aren't ours, like external URLs.
+    """
+    manifest = uploads.read_manifest(file_id)
+    if manifest is not None and "lqip" in manifest:
+        return {key: manifest[key] for key in uploads.IMAGE_INFO}
+    
+    path = uploads.local_path(file_id)
+    if path is not None:
+        return await _describe_file(path)
+    if not is_telegram_file_id(file_id) or not BOT_TOKEN:
+        return None
+    return await _describe_telegram_file(file_id)
+
+
+async def describe_product_images(product_id: Optional[int] = None) -> None:
+    """
+    Store width, height and LQIP on ProductImage rows that don't have them
+    yet: those of one product after it is saved, or all of them at startup.
+    Failures are counted on the row; images that can't be described at all
+    (not ours, not an image) and those that failed DESCRIBE_ATTEMPTS times
+    aren't tried again.
+    """
+    query = select(ProductImage.id, ProductImage.file_id).where(
+        ProductImage.lqip.is_(None),
+        func.coalesce(ProductImage.describe_attempts, 0) < DESCRIBE_ATTEMPTS,
+    )
+    if product_id is not None:
+        query = query.where(ProductImage.product_id == product_id)
+    async with AsyncSessionLocal() as session:
+        rows = (await session.execute(query)).all()
+    
+    semaphore = asyncio.Semaphore(DESCRIBE_CONCURRENCY)
+    
+    async def describe(image_id: int, file_id: Optional[str]) -> bool:
+        async with semaphore:
+            try:
+                info = await describe_image(file_id)
+            except (HTTPException, httpx.HTTPError, imaging.ImagingBusy, OSError):
+                # Maybe temporary: count the try
+                info = {"describe_attempts": func.coalesce(ProductImage.describe_attempts, 0) + 1}
+            except imaging.ImageProcessingError:
+                info = None
+        if info is None:
+            # Never going to work: no more tries
+            info = {"describe_attempts": DESCRIBE_ATTEMPTS}
+        async with AsyncSessionLocal() as session:
+            await session.execute(update(ProductImage).where(ProductImage.id == image_id).values(**info))
+            await session.commit()
+        return "lqip" in info
+    
+    described = sum(await asyncio.gather(*(describe(image_id, file_id) for image_id, file_id in rows)))
+    if rows:
+        logger.info(f"Described {described}/{len(rows)} product images")
+
+
+@router.get("/{file_id}")
+async def get_image(
+    file_id: str,
+    size: Optional[str] = Query(None, description="small, medium or large; omit for the original")
+):
+    """
+    Proxy endpoint to serve images from Telegram.
+    The first request streams the file from Telegram while it is written
+    into the disk cache (concurrent first views read along); repeat views
+    are served from disk. With `size`, a WebP scaled to that size is
+    served instead, generated on first request and cached as well.
+    """
+    headers = {
+        "Cache-Control": "public, max-age=86400"  # Cache for 24 hours
+    }
+    
+    if size in imaging.IMAGE_SIZES:
+        entry = await _variant(file_id, size)
+        if entry is not None:
+            path, content_type = entry
+            return FileResponse(path, media_type=content_type, headers=headers)
+    
+    entry = image_cache.cache.get(file_id)
+    if entry is None:
+        download = _download(file_id)
+        content_type = await download.started()
+        if not download.done:
+            return StreamingResponse(download.reader(), media_type=content_type, headers=headers)
+        entry = await _original(file_id)
+    
+    path, content_type = entry
+    return FileResponse(path, media_type=content_type, headers=headers)
 
 
 @router.post("/upload")
 async def upload_image(file: UploadFile = File(...)):
     """
     Загрузка изображения с автоматическим сжатием и конвертацией в WebP.
-    Создаёт основное фото (макс. 1200px) и превью (300px).
+    Создаёт набор размеров (по умолчанию 150/300/600/1200px) для srcset;
+    основное фото — самый крупный размер, превью — 300px.
     """
     try:
-        from pathlib import Path
-        from PIL import Image
-        import io
-        import uuid
-        
-        # Определяем директорию для сохранения
-        is_docker = os.path.exists("/data")
-        
-        if is_docker:
-            upload_dir = Path("/data/uploads")
-        else:
-            current_file = Path(__file__).resolve()
-            backend_root = current_file.parent.parent.parent
-            upload_dir = backend_root / "static" / "uploads"
-        
-        os.makedirs(upload_dir, exist_ok=True)
-        
         # Читаем файл в память
         contents = await file.read()
         
-        # Открываем через Pillow
+        # Имя — хеш содержимого: повторная загрузка того же фото не
+        # обрабатывается заново. Сжатие — в пуле потоков, не блокируя event loop
         try:
-            img = Image.open(io.BytesIO(contents))
-        except Exception:
+            manifest = await uploads.store_upload(contents)
+        except imaging.ImagingBusy:
+            raise HTTPException(
+                status_code=429,
+                detail="Сервер занят обработкой изображений, повторите позже",
+                headers={"Retry-After": "2"}
+            )
+        except imaging.ImageProcessingError:
             raise HTTPException(status_code=400, detail="Невозможно открыть файл как изображение")
         
-        # Конвертируем RGBA в RGB (WebP не всегда хорошо работает с прозрачностью)
-        if img.mode in ('RGBA', 'LA', 'P'):
-            background = Image.new('RGB', img.size, (255, 255, 255))
-            if img.mode == 'P':
-                img = img.convert('RGBA')
-            background.paste(img, mask=img.split()[-1] if img.mode == 'RGBA' else None)
-            img = background
-        elif img.mode != 'RGB':
-            img = img.convert('RGB')
-        
-        # Генерируем уникальное имя
-        unique_id = str(uuid.uuid4())
-        
-        # === Основное фото (максимум 1200px по широкой стороне) ===
-        main_img = img.copy()
-        max_size = 1200
-        if main_img.width > max_size or main_img.height > max_size:
-            main_img.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
-        
-        main_filename = f"{unique_id}.webp"
-        main_path = upload_dir / main_filename
-        main_img.save(main_path, "WEBP", quality=85, optimize=True)
-        
-        # === Превью (300px для каталога) ===
-        thumb_img = img.copy()
-        thumb_size = 300
-        thumb_img.thumbnail((thumb_size, thumb_size), Image.Resampling.LANCZOS)
-        
-        thumb_filename = f"{unique_id}_thumb.webp"
-        thumb_path = upload_dir / thumb_filename
-        thumb_img.save(thumb_path, "WEBP", quality=80, optimize=True)
-        
-        # Формируем URL для ответа
-        if is_docker:
-            url_path = f"/uploads/{main_filename}"
-            thumb_url = f"/uploads/{thumb_filename}"
-        else:
-            url_path = f"/static/uploads/{main_filename}"
-            thumb_url = f"/static/uploads/{thumb_filename}"
-        
         return {
-            "url": url_path,
-            "file_id": url_path,
-            "thumbnail": thumb_url
+            "url": manifest["url"],
+            "file_id": manifest["url"],
+            "thumbnail": manifest["thumb_url"],
+            "variants": manifest["variants"]
         }
         
     except HTTPException:
@@ -1,40 +1,108 @@
 """
 Orders API routes with cart validation and order management.
 """
-from typing import Optional
-from fastapi import APIRouter, Depends, HTTPException, Query, BackgroundTasks
-from sqlalchemy import select
+from datetime import datetime
+from typing import AsyncIterator, Dict, Iterable, List, Mapping, NamedTuple, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, insert, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
-from ..database import get_db
+from .. import outbox, stats
+from ..cache import cart_products
+from ..database import get_db, AsyncSessionLocal
 from ..models import Product, Order, OrderItem
+from ..stock import reserve_stock, total_packs
 from ..schemas import (
-    CartValidateRequest, CartValidateResponse, CartValidateError,
-    OrderCreate, OrderResponse, OrderListResponse, MessageResponse
+    CartItem, CartValidateRequest, CartValidateResponse, CartValidateError,
+    OrderCreate, OrderResponse, OrderItemResponse, OrderListResponse, MessageResponse
 )
 from ..notifier import notify_new_order
+from ..pagination import decode_cursor, keyset_condition, split_page
 
 router = APIRouter(prefix="/api", tags=["orders"])
 
+# Items and their product names come in two batched SELECTs per request,
+# however many orders or lines there are
+ORDER_LOAD_OPTIONS = (
+    selectinload(Order.items)
+    .selectinload(OrderItem.product)
+    .load_only(Product.name)
+)
 
-@router.post("/cart/validate", response_model=CartValidateResponse)
-async def validate_cart(
-    cart: CartValidateRequest,
-    db: AsyncSession = Depends(get_db)
-):
+# Rows per SELECT while streaming an export
+EXPORT_BATCH_SIZE = 500
+
+
+def _order_response(order: Order) -> OrderResponse:
+    """Serialize an order loaded with ORDER_LOAD_OPTIONS."""
+    return OrderResponse(
+        id=order.id,
+        telegram_user_id=order.telegram_user_id,
+        customer_name=order.customer_name,
+        customer_organization=order.customer_organization,
+        customer_phone=order.customer_phone,
+        total_amount=float(order.total_amount),
+        status=order.status,
+        created_at=order.created_at,
+        items=[
+            OrderItemResponse(
+                id=item.id,
+                product_id=item.product_id,
+                product_name=item.product.name if item.product else "Удалённый товар",
+                quantity_packs=item.quantity_packs,
+                quantity_pieces=item.quantity_pieces,
+                price_per_unit=float(item.price_per_unit),
+                subtotal=float(item.subtotal)
+            )
+            for item in order.items
+        ]
+    )
+
+
+class ProductSnapshot(NamedTuple):
+    """Fields of a product that cart validation needs."""
+    id: int
+    name: str
+    price_per_unit: float
+    pieces_per_pack: int
+    min_order_packs: int
+    in_stock: Optional[int]
+
+    @classmethod
+    def of(cls, product: Product) -> "ProductSnapshot":
+        return cls(
+            id=product.id,
+            name=product.name,
+            price_per_unit=float(product.price_per_unit),
+            pieces_per_pack=product.pieces_per_pack,
+            min_order_packs=product.min_order_packs,
+            in_stock=product.in_stock,
+        )
+
+
+async def load_cart_products(db: AsyncSession, product_ids: Iterable[int]) -> Dict[int, Product]:
+    """All active products of a cart in a single IN (...) query."""
+    ids = set(product_ids)
+    if not ids:
+        return {}
+    result = await db.execute(
+        select(Product).where(Product.id.in_(ids), Product.active == True)
+    )
+    return {product.id: product for product in result.scalars().all()}
+
+
+def check_cart(items: List[CartItem], products: Mapping[int, ProductSnapshot]) -> CartValidateResponse:
     """
-    Validate cart items before checkout.
+    Validate cart lines against already loaded products (ORM rows or snapshots).
     Checks if quantities are valid multiples of pack sizes and products are in stock.
     """
     errors = []
     total_amount = 0.0
     
-    for item in cart.items:
-        result = await db.execute(
-            select(Product).where(Product.id == item.product_id, Product.active == True)
-        )
-        product = result.scalar_one_or_none()
+    for item in items:
+        product = products.get(item.product_id)
         
         if not product:
             errors.append(CartValidateError(
@@ -74,21 +142,45 @@ async def validate_cart(
     )
 
 
+@router.post("/cart/validate", response_model=CartValidateResponse)
+async def validate_cart(
+    cart: CartValidateRequest,
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Validate cart items before checkout.
+    Products are read from a few-seconds snapshot cache, since the Mini App
+    re-validates while the cart is open; checkout re-checks fresh data.
+    """
+    snapshots = {}
+    missing = []
+    for product_id in {item.product_id for item in cart.items}:
+        snapshot = cart_products.get(product_id)
+        if snapshot is None:
+            missing.append(product_id)
+        else:
+            snapshots[product_id] = snapshot
+    
+    for product in (await load_cart_products(db, missing)).values():
+        snapshot = ProductSnapshot.of(product)
+        cart_products.set(product.id, snapshot)
+        snapshots[product.id] = snapshot
+    
+    return check_cart(cart.items, snapshots)
+
+
 @router.post("/orders", response_model=OrderResponse)
 async def create_order(
     order_data: OrderCreate,
-    background_tasks: BackgroundTasks,
     db: AsyncSession = Depends(get_db)
 ):
     """
     Create a new order.
-    Validates all items and calculates totals.
+    Validates all items, reserves stock atomically and calculates totals.
     """
-    # Validate cart first
-    cart_request = CartValidateRequest(
-        items=[{"product_id": item.product_id, "quantity_packs": item.quantity_packs} for item in order_data.items]
-    )
-    validation = await validate_cart(cart_request, db)
+    # Validate cart first, against fresh rows that are reused below
+    products = await load_cart_products(db, (item.product_id for item in order_data.items))
+    validation = check_cart(order_data.items, products)
     
     if not validation.valid:
         raise HTTPException(
@@ -99,6 +191,22 @@ async def create_order(
             }
         )
     
+    # Reserve stock for every line in one conditional UPDATE; this is the
+    # transaction's first write, so concurrent checkouts can't oversell
+    quantities = total_packs(order_data.items)
+    shortages = await reserve_stock(db, quantities)
+    if shortages:
+        await db.rollback()
+        raise HTTPException(
+            status_code=409,
+            detail={
+                "message": "Недостаточно товара на складе",
+                "errors": [e.model_dump() for e in shortages]
+            }
+        )
+    for product_id in quantities:
+        cart_products.pop(product_id)
+    
     # Create order
     db_order = Order(
         telegram_user_id=order_data.telegram_user_id,
@@ -111,78 +219,50 @@ async def create_order(
     db.add(db_order)
     await db.flush()  # Get order ID
     
-    # Create order items
+    # Create order items (one executemany; ids are read back with the order)
+    order_items = []
     for item in order_data.items:
-        result = await db.execute(select(Product).where(Product.id == item.product_id))
-        product = result.scalar_one()
+        product = products[item.product_id]
         
         pieces = item.quantity_packs * product.pieces_per_pack
         subtotal = pieces * float(product.price_per_unit)
         
-        db_item = OrderItem(
-            order_id=db_order.id,
-            product_id=product.id,
-            quantity_packs=item.quantity_packs,
-            quantity_pieces=pieces,
-            price_per_unit=float(product.price_per_unit),
-            subtotal=subtotal
-        )
-        db.add(db_item)
-        
-        # Update stock if tracked
-        if product.in_stock is not None:
-            product.in_stock -= item.quantity_packs
+        order_items.append({
+            "order_id": db_order.id,
+            "product_id": product.id,
+            "quantity_packs": item.quantity_packs,
+            "quantity_pieces": pieces,
+            "price_per_unit": float(product.price_per_unit),
+            "subtotal": subtotal
+        })
+    await db.execute(insert(OrderItem), order_items)
+    await stats.record_order(db, db_order, order_items)
+    
+    # Admin notification goes into the outbox in this same transaction
+    order_info = {
+        "id": db_order.id,
+        "customer_name": db_order.customer_name,
+        "customer_organization": db_order.customer_organization,
+        "customer_phone": db_order.customer_phone,
+        "total_amount": float(db_order.total_amount)
+    }
+    items_data = [
+        {**item, "product_name": products[item["product_id"]].name}
+        for item in order_items
+    ]
+    notify_new_order(db, order_info, items_data)
     
     await db.commit()
+    outbox.wake()
     
     # Fetch complete order with items
     result = await db.execute(
         select(Order)
-        .options(selectinload(Order.items))
+        .options(ORDER_LOAD_OPTIONS)
         .where(Order.id == db_order.id)
     )
     order = result.scalar_one()
-    
-    # Build response with product names
-    order_response = OrderResponse(
-        id=order.id,
-        telegram_user_id=order.telegram_user_id,
-        customer_name=order.customer_name,
-        customer_organization=order.customer_organization,
-        customer_phone=order.customer_phone,
-        total_amount=float(order.total_amount),
-        status=order.status,
-        created_at=order.created_at,
-        items=[]
-    )
-    
-    items_data = []
-    for item in order.items:
-        product_result = await db.execute(select(Product).where(Product.id == item.product_id))
-        product = product_result.scalar_one()
-        item_dict = {
-            "id": item.id,
-            "product_id": item.product_id,
-            "product_name": product.name,
-            "quantity_packs": item.quantity_packs,
-            "quantity_pieces": item.quantity_pieces,
-            "price_per_unit": float(item.price_per_unit),
-            "subtotal": float(item.subtotal)
-        }
-        order_response.items.append(item_dict)
-        items_data.append(item_dict)
-        
-    # Send notification in background
-    order_info = {
-        "id": order.id,
-        "customer_name": order.customer_name,
-        "customer_organization": order.customer_organization,
-        "customer_phone": order.customer_phone,
-        "total_amount": float(order.total_amount)
-    }
-    background_tasks.add_task(notify_new_order, order_info, items_data)
-    
-    return order_response
+    return _order_response(order)
 
 
 @router.get("/orders/me", response_model=OrderListResponse)
@@ -193,42 +273,13 @@ async def get_my_orders(
     """Get orders for a specific Telegram user."""
     result = await db.execute(
         select(Order)
-        .options(selectinload(Order.items))
+        .options(ORDER_LOAD_OPTIONS)
         .where(Order.telegram_user_id == telegram_user_id)
         .order_by(Order.created_at.desc())
     )
     orders = result.scalars().all()
     
-    order_responses = []
-    for order in orders:
-        order_resp = OrderResponse(
-            id=order.id,
-            telegram_user_id=order.telegram_user_id,
-            customer_name=order.customer_name,
-            customer_organization=order.customer_organization,
-            customer_phone=order.customer_phone,
-            total_amount=float(order.total_amount),
-            status=order.status,
-            created_at=order.created_at,
-            items=[]
-        )
-        
-        for item in order.items:
-            product_result = await db.execute(select(Product).where(Product.id == item.product_id))
-            product = product_result.scalar_one_or_none()
-            order_resp.items.append({
-                "id": item.id,
-                "product_id": item.product_id,
-                "product_name": product.name if product else "Удалённый товар",
-                "quantity_packs": item.quantity_packs,
-                "quantity_pieces": item.quantity_pieces,
-                "price_per_unit": float(item.price_per_unit),
-                "subtotal": float(item.subtotal)
-            })
-        
-        order_responses.append(order_resp)
-    
-    return OrderListResponse(orders=order_responses)
+    return OrderListResponse(orders=[_order_response(order) for order in orders])
 
 
 @router.put("/orders/{order_id}/status", response_model=MessageResponse)
@@ -248,94 +299,128 @@ async def update_order_status(
     if not order:
         raise HTTPException(status_code=404, detail="Заказ не найден")
     
-    order.status = status
+    # Only switch from the status just read, so a concurrent change can't
+    # move the order's totals in the stats rollups twice
+    old_status = order.status
+    result = await db.execute(
+        update(Order)
+        .where(Order.id == order_id, Order.status == old_status)
+        .values(status=status)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount == 0:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Статус заказа уже изменён, обновите данные")
+    await stats.record_status_change(db, order, old_status, status)
     await db.commit()
     
     return MessageResponse(message=f"Статус заказа #{order_id} изменён на '{status}'")
 
 
-@router.get("/orders/{order_id}", response_model=OrderResponse)
-async def get_order(order_id: int, db: AsyncSession = Depends(get_db)):
-    """Get a single order by ID."""
-    result = await db.execute(
+def _order_filters(
+    status: Optional[str],
+    date_from: Optional[datetime],
+    date_to: Optional[datetime],
+) -> list:
+    """WHERE clauses shared by the admin list, its count and the export."""
+    filters = []
+    if status:
+        filters.append(Order.status == status)
+    if date_from:
+        filters.append(Order.created_at >= date_from)
+    if date_to:
+        filters.append(Order.created_at < date_to)
+    return filters
+
+
+def _orders_page(filters: list, limit: int, cursor: Optional[str] = None):
+    """Newest-first page of orders, seeking past `cursor` through ix_orders_*."""
+    if cursor:
+        value, last_id = decode_cursor(cursor, 2)
+        # First: given two upper bounds on created_at (the cursor, date_to), SQLite
+        # seeks with the first one, and the cursor is the tighter of the two
+        filters = [keyset_condition(Order.created_at, Order.id, value, last_id, descending=True), *filters]
+    return (
         select(Order)
-        .options(selectinload(Order.items))
-        .where(Order.id == order_id)
+        .options(ORDER_LOAD_OPTIONS)
+        .where(*filters)
+        .order_by(Order.created_at.desc(), Order.id.desc())
+        .limit(limit + 1)
     )
-    order = result.scalar_one_or_none()
-    
-    if not order:
-        raise HTTPException(status_code=404, detail="Заказ не найден")
-    
-    order_resp = OrderResponse(
-        id=order.id,
-        telegram_user_id=order.telegram_user_id,
-        customer_name=order.customer_name,
-        customer_organization=order.customer_organization,
-        customer_phone=order.customer_phone,
-        total_amount=float(order.total_amount),
-        status=order.status,
-        created_at=order.created_at,
-        items=[]
-    )
-    
-    for item in order.items:
-        product_result = await db.execute(select(Product).where(Product.id == item.product_id))
-        product = product_result.scalar_one_or_none()
-        order_resp.items.append({
-            "id": item.id,
-            "product_id": item.product_id,
-            "product_name": product.name if product else "Удалённый товар",
-            "quantity_packs": item.quantity_packs,
-            "quantity_pieces": item.quantity_pieces,
-            "price_per_unit": float(item.price_per_unit),
-            "subtotal": float(item.subtotal)
-        })
-    
-    return order_resp
 
 
 @router.get("/orders", response_model=OrderListResponse)
 async def get_all_orders(
     status: Optional[str] = Query(None, description="Filter by status"),
+    date_from: Optional[datetime] = Query(None, description="Created at or after (UTC)"),
+    date_to: Optional[datetime] = Query(None, description="Created before (UTC)"),
+    limit: int = Query(50, ge=1, le=200, description="Orders per page"),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from next_cursor"),
+    include_total: bool = Query(False, description="Also count all matching orders"),
     db: AsyncSession = Depends(get_db)
 ):
-    """Get all orders (admin only)."""
-    query = select(Order).options(selectinload(Order.items)).order_by(Order.created_at.desc())
+    """
+    Get orders newest first, one page at a time (admin only).
+    Pass `cursor` from the previous response's `next_cursor` for the next page.
+    """
+    filters = _order_filters(status, date_from, date_to)
     
-    if status:
-        query = query.where(Order.status == status)
+    total = None
+    if include_total:
+        total = (await db.execute(select(func.count(Order.id)).where(*filters))).scalar()
     
-    result = await db.execute(query)
-    orders = result.scalars().all()
+    result = await db.execute(_orders_page(filters, limit, cursor))
+    orders, next_cursor = split_page(result.scalars().all(), limit, key=lambda o: o.created_at)
     
-    order_responses = []
-    for order in orders:
-        order_resp = OrderResponse(
-            id=order.id,
-            telegram_user_id=order.telegram_user_id,
-            customer_name=order.customer_name,
-            customer_organization=order.customer_organization,
-            customer_phone=order.customer_phone,
-            total_amount=float(order.total_amount),
-            status=order.status,
-            created_at=order.created_at,
-            items=[]
-        )
-        
-        for item in order.items:
-            product_result = await db.execute(select(Product).where(Product.id == item.product_id))
-            product = product_result.scalar_one_or_none()
-            order_resp.items.append({
-                "id": item.id,
-                "product_id": item.product_id,
-                "product_name": product.name if product else "Удалённый товар",
-                "quantity_packs": item.quantity_packs,
-                "quantity_pieces": item.quantity_pieces,
-                "price_per_unit": float(item.price_per_unit),
-                "subtotal": float(item.subtotal)
-            })
-        
-        order_responses.append(order_resp)
+    return OrderListResponse(
+        orders=[_order_response(order) for order in orders],
+        total=total,
+        next_cursor=next_cursor
+    )
+
+
+async def _export_lines(filters: list) -> AsyncIterator[str]:
+    """
+    One JSON document per order, read in EXPORT_BATCH_SIZE keyset batches.
+    Uses its own session: the request's session is closed once streaming starts.
+    """
+    cursor = None
+    async with AsyncSessionLocal() as session:
+        while True:
+            result = await session.execute(_orders_page(filters, EXPORT_BATCH_SIZE, cursor))
+            orders, cursor = split_page(result.scalars().all(), EXPORT_BATCH_SIZE, key=lambda o: o.created_at)
+            yield "".join(_order_response(order).model_dump_json() + "\n" for order in orders)
+            # Keep memory flat: nothing from earlier batches stays in the identity map
+            session.expunge_all()
+            if cursor is None:
+                break
+
+
+@router.get("/orders/export")
+async def export_orders(
+    status: Optional[str] = Query(None, description="Filter by status"),
+    date_from: Optional[datetime] = Query(None, description="Created at or after (UTC)"),
+    date_to: Optional[datetime] = Query(None, description="Created before (UTC)"),
+):
+    """Stream every matching order as NDJSON, newest first (admin only)."""
+    return StreamingResponse(
+        _export_lines(_order_filters(status, date_from, date_to)),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="orders.ndjson"'}
+    )
+
+
+@router.get("/orders/{order_id}", response_model=OrderResponse)
+async def get_order(order_id: int, db: AsyncSession = Depends(get_db)):
+    """Get a single order by ID."""
+    result = await db.execute(
+        select(Order)
+        .options(ORDER_LOAD_OPTIONS)
+        .where(Order.id == order_id)
+    )
+    order = result.scalar_one_or_none()
+    
+    if not order:
+        raise HTTPException(status_code=404, detail="Заказ не найден")
     
-    return OrderListResponse(orders=order_responses)
+    return _order_response(order)
@@ -2,93 +2,220 @@
 Products API routes with filtering, sorting, and pagination.
 """
 from typing import Optional
+import asyncio
 import shutil
 import os
-from fastapi import APIRouter, Depends, HTTPException, Query, UploadFile, File
-from ..excel_processor import process_excel_import
+import tempfile
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, UploadFile, File
+from ..excel_processor import import_job
+from ..price_list import SUPPORTED_EXTENSIONS
 from sqlalchemy import select, func, or_
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from ..cache import invalidate_products, product_counts
+from ..uploads import image_fields
+from .. import jobs, search, search_index
+from .images import describe_product_images
 from ..database import get_db
+from ..pagination import decode_cursor, keyset_condition, split_page
 from sqlalchemy.orm import selectinload
 from ..models import Product, ProductImage
 from ..schemas import (
     ProductResponse, ProductCreate, ProductUpdate,
-    ProductListResponse, MessageResponse
+    ProductListResponse, MessageResponse, SuggestResponse, JobResponse
 )
 
 router = APIRouter(prefix="/api/products", tags=["products"])
 
 
+# Sort key column and direction for each `sort` value.
+# Rows are always tie-broken by id so that keyset cursors are stable.
+SORT_COLUMNS = {
+    "price_asc": (Product.price_per_unit, False),
+    "price_desc": (Product.price_per_unit, True),
+    "name_asc": (Product.name, False),
+    "name_desc": (Product.name, True),
+    "newest": (Product.created_at, True),
+    "oldest": (Product.created_at, False),
+}
+
+
+async def _ensure_sku_free(db: AsyncSession, sku: Optional[str], product_id: Optional[int] = None) -> None:
+    """Reject an article another product already has (a unique index lookup)."""
+    if sku is None:
+        return
+    query = select(Product.id).where(Product.sku == sku)
+    if product_id is not None:
+        query = query.where(Product.id != product_id)
+    if await db.scalar(query.limit(1)) is not None:
+        raise HTTPException(status_code=400, detail="Товар с таким артикулом уже существует")
+
+
+def _pages(total: Optional[int], limit: int) -> Optional[int]:
+    """Page count for a known total."""
+    if total is None:
+        return None
+    return (total + limit - 1) // limit if total > 0 else 1
+
+
 @router.get("", response_model=ProductListResponse)
 async def get_products(
     category: Optional[int] = Query(None, description="Filter by category ID"),
     subcategory: Optional[int] = Query(None, description="Filter by subcategory ID"),
-    q: Optional[str] = Query(None, description="Search by name"),
-    sort: Optional[str] = Query("newest", description="Sort: price_asc, price_desc, name_asc, name_desc, newest, oldest"),
+    q: Optional[str] = Query(None, description="Search by name, description or SKU"),
+    sort: Optional[str] = Query("newest", description="Sort: price_asc, price_desc, name_asc, name_desc, newest, oldest, relevance (with q)"),
     page: int = Query(1, ge=1, description="Page number"),
     limit: int = Query(20, ge=1, le=100, description="Items per page"),
+    cursor: Optional[str] = Query(None, description="Opaque cursor from next_cursor; overrides page"),
+    include_total: bool = Query(True, description="Return total/pages (skip for infinite scroll)"),
     db: AsyncSession = Depends(get_db)
 ):
     """
     Get products with filtering, sorting, and pagination.
+    Pass `cursor` (from the previous response's `next_cursor`) to seek
+    instead of using `page`, so deep pages cost the same as the first one.
     """
-    # Base query with eager loading of images
-    query = select(Product).options(selectinload(Product.images)).where(Product.active == True)
+    filters = [Product.active == True]
     
     # Apply filters
     if category:
-        query = query.where(Product.category_id == category)
+        filters.append(Product.category_id == category)
     
     if subcategory:
-        query = query.where(Product.subcategory_id == subcategory)
+        filters.append(Product.subcategory_id == subcategory)
     
+    rank_subquery = None
     if q:
-        search_term = f"%{q}%"
-        query = query.where(
-            or_(
-                Product.name.ilike(search_term),
-                Product.description.ilike(search_term)
+        match = search.build_match_query(q) if search.fts_enabled else None
+        if match:
+            rank_subquery = search.match_subquery(match)
+            search_filter = Product.id.in_(select(rank_subquery.c.product_id))
+            filters.append(search_filter)
+        else:
+            search_term = f"%{q}%"
+            filters.append(
+                or_(
+                    Product.name.ilike(search_term),
+                    Product.description.ilike(search_term)
+                )
             )
+    
+    # Base query with eager loading of images
+    query = select(Product).options(selectinload(Product.images)).where(*filters)
+    
+    # Count total (plain category listings are served from the cache)
+    total = None
+    if include_total:
+        cache_key = None if q else (category, subcategory)
+        total = product_counts.get(cache_key) if cache_key else None
+        if total is None:
+            total_result = await db.execute(select(func.count(Product.id)).where(*filters))
+            total = total_result.scalar() or 0
+            if cache_key:
+                product_counts.set(cache_key, total)
+    
+    # Ranked full-text results: best match first, offset pagination only
+    if sort == "relevance" and rank_subquery is not None:
+        query = (
+            select(Product)
+            .options(selectinload(Product.images))
+            .join(rank_subquery, rank_subquery.c.product_id == Product.id)
+            .where(*[f for f in filters if f is not search_filter])
+            .order_by(rank_subquery.c.rank, Product.id)
+            .offset((page - 1) * limit)
+            .limit(limit)
+        )
+        result = await db.execute(query)
+        products = result.scalars().all()
+        return ProductListResponse(
+            items=products,
+            total=total,
+            page=page,
+            limit=limit,
+            pages=_pages(total, limit)
         )
     
     # Apply sorting
-    sort_mapping = {
-        "price_asc": Product.price_per_unit.asc(),
-        "price_desc": Product.price_per_unit.desc(),
-        "name_asc": Product.name.asc(),
-        "name_desc": Product.name.desc(),
-        "newest": Product.created_at.desc(),
-        "oldest": Product.created_at.asc(),
-    }
-    order_clause = sort_mapping.get(sort, Product.created_at.desc())
-    query = query.order_by(order_clause)
-    
-    # Count total
-    count_query = select(func.count()).select_from(query.subquery())
-    total_result = await db.execute(count_query)
-    total = total_result.scalar() or 0
+    sort_column, descending = SORT_COLUMNS.get(sort, SORT_COLUMNS["newest"])
+    if descending:
+        query = query.order_by(sort_column.desc(), Product.id.desc())
+    else:
+        query = query.order_by(sort_column.asc(), Product.id.asc())
     
     # Apply pagination
-    offset = (page - 1) * limit
-    query = query.offset(offset).limit(limit)
+    if cursor:
+        value, last_id = decode_cursor(cursor, 2)
+        query = query.where(keyset_condition(sort_column, Product.id, value, last_id, descending))
+    else:
+        query = query.offset((page - 1) * limit)
+    query = query.limit(limit + 1)
     
     # Execute
     result = await db.execute(query)
-    products = result.scalars().all()
+    products, next_cursor = split_page(
+        result.scalars().all(), limit, key=lambda p: getattr(p, sort_column.key)
+    )
     
-    # Calculate pages
-    pages = (total + limit - 1) // limit if total > 0 else 1
+    return ProductListResponse(
+        items=products,
+        total=total,
+        page=None if cursor else page,
+        limit=limit,
+        pages=_pages(total, limit),
+        next_cursor=next_cursor
+    )
+
+
+@router.get("/search", response_model=ProductListResponse)
+async def search_products(
+    q: str = Query(..., min_length=1, description="Search query"),
+    category: Optional[int] = Query(None, description="Filter by category ID"),
+    subcategory: Optional[int] = Query(None, description="Filter by subcategory ID"),
+    page: int = Query(1, ge=1, description="Page number"),
+    limit: int = Query(20, ge=1, le=100, description="Items per page"),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Typo-tolerant catalog search with Russian word forms and prefix matching.
+    Served from the in-process index; only the requested page hits the DB.
+    """
+    if not search_index.index.ready:
+        return await get_products(
+            category=category, subcategory=subcategory, q=q, sort="relevance",
+            page=page, limit=limit, cursor=None, include_total=True, db=db
+        )
+    
+    ranked, total = search_index.index.search(q, category, subcategory, limit=page * limit)
+    page_ids = ranked[(page - 1) * limit:]
+    
+    products = []
+    if page_ids:
+        result = await db.execute(
+            select(Product)
+            .options(selectinload(Product.images))
+            .where(Product.id.in_(page_ids), Product.active == True)
+        )
+        by_id = {p.id: p for p in result.scalars().all()}
+        products = [by_id[pid] for pid in page_ids if pid in by_id]
     
     return ProductListResponse(
         items=products,
         total=total,
         page=page,
         limit=limit,
-        pages=pages
+        pages=_pages(total, limit)
     )
 
 
+@router.get("/suggest", response_model=SuggestResponse)
+async def suggest_products(
+    q: str = Query(..., min_length=1, description="Text typed so far"),
+    limit: int = Query(8, ge=1, le=20, description="Max suggestions")
+):
+    """Autocomplete the last word of the query from catalog vocabulary."""
+    return SuggestResponse(suggestions=search_index.index.suggest(q, limit))
+
+
 @router.get("/{product_id}", response_model=ProductResponse)
 async def get_product(product_id: int, db: AsyncSession = Depends(get_db)):
     """Get a single product by ID."""
@@ -108,10 +235,12 @@ async def get_product(product_id: int, db: AsyncSession = Depends(get_db)):
 @router.post("", response_model=ProductResponse)
 async def create_product(
     product: ProductCreate,
+    background_tasks: BackgroundTasks,
     db: AsyncSession = Depends(get_db)
 ):
     """Create a new product."""
     product_data = product.model_dump()
+    await _ensure_sku_free(db, product_data["sku"])
     images_ids = product_data.pop("images", []) or [] # Remove images from dict
     
     # Use first image as main for backward compatibility fields
@@ -129,48 +258,55 @@ async def create_product(
             img = ProductImage(
                 product_id=db_product.id,
                 file_id=file_id,
-                is_main=(idx == 0)
+                is_main=(idx == 0),
+                **image_fields(file_id)
             )
             db.add(img)
         await db.commit()
+        # Telegram photos are measured once downloaded, after the response
+        background_tasks.add_task(describe_product_images, db_product.id)
+    invalidate_products()
         
     # Always reload to ensure images relationship is loaded
     result = await db.execute(
         select(Product).options(selectinload(Product.images)).where(Product.id == db_product.id)
     )
     db_product = result.scalar_one()
+    search_index.index.upsert(db_product)
 
     return db_product
 
 
-@router.post("/import", response_model=MessageResponse)
+@router.post("/import", response_model=JobResponse, status_code=202)
 async def import_products(
-    file: UploadFile = File(...)
+    file: UploadFile = File(...),
+    dry_run: bool = Query(False, description="Only report what would change")
 ):
-    """Import products from Excel file."""
-    if not file.filename.endswith(('.xlsx', '.xls')):
-        raise HTTPException(status_code=400, detail="Only Excel files are allowed")
+    """
+    Start a price list import (Excel or CSV) in the background.
+    Returns the job; poll GET /api/admin/jobs/{id} for progress and the result.
+    With dry_run nothing is written and the result is the diff against the catalog.
+    """
+    if not file.filename.lower().endswith(SUPPORTED_EXTENSIONS):
+        raise HTTPException(status_code=400, detail="Only Excel or CSV files are allowed")
 
-    # Save to temp file
-    temp_file = f"temp_{file.filename}"
+    # The job deletes the file when it is done
+    fd, temp_file = tempfile.mkstemp(prefix="import_", suffix=os.path.splitext(file.filename)[1])
     try:
-        with open(temp_file, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        
-        result_msg = await process_excel_import(temp_file)
-        return MessageResponse(message=result_msg)
-        
+        with os.fdopen(fd, "wb") as buffer:
+            await asyncio.to_thread(shutil.copyfileobj, file.file, buffer)
     except Exception as e:
+        os.remove(temp_file)
         raise HTTPException(status_code=500, detail=f"Import failed: {str(e)}")
-    finally:
-        if os.path.exists(temp_file):
-            os.remove(temp_file)
+
+    return jobs.start("excel_import", lambda job: import_job(job, temp_file, dry_run))
 
 
 @router.put("/{product_id}", response_model=ProductResponse)
 async def update_product(
     product_id: int,
     product: ProductUpdate,
+    background_tasks: BackgroundTasks,
     db: AsyncSession = Depends(get_db)
 ):
     """Update a product."""
@@ -181,6 +317,8 @@ async def update_product(
         raise HTTPException(status_code=404, detail="Товар не найден")
     
     update_data = product.model_dump(exclude_unset=True)
+    if "sku" in update_data:
+        await _ensure_sku_free(db, update_data["sku"], product_id)
     
     # Handle images update if provided
     if "images" in update_data:
@@ -201,23 +339,28 @@ async def update_product(
                 img = ProductImage(
                     product_id=product_id,
                     file_id=file_id,
-                    is_main=(idx == 0)
+                    is_main=(idx == 0),
+                    **image_fields(file_id)
                 )
                 db.add(img)
             
             # Update legacy fields for compatibility
             update_data["image_file_id"] = new_images[0]
             # We don't have image_url here usually unless passed, but let's leave it.
+            background_tasks.add_task(describe_product_images, product_id)
 
     for key, value in update_data.items():
         setattr(db_product, key, value)
     
     await db.commit()
+    invalidate_products()
     await db.refresh(db_product)
     
     # Reload with images
     result = await db.execute(select(Product).options(selectinload(Product.images)).where(Product.id == product_id))
-    return result.scalar_one()
+    db_product = result.scalar_one()
+    search_index.index.upsert(db_product)
+    return db_product
 
 
 @router.delete("/{product_id}", response_model=MessageResponse)
@@ -232,5 +375,7 @@ async def delete_product(product_id: int, db: AsyncSession = Depends(get_db)):
     # Soft delete - just deactivate
     db_product.active = False
     await db.commit()
+    invalidate_products()
+    search_index.index.remove(product_id)
     
     return MessageResponse(message="Товар удалён", id=product_id)
@@ -1,9 +1,9 @@
 """
 Pydantic schemas for API request/response validation.
 """
-from datetime import datetime
-from typing import Optional, List
-from pydantic import BaseModel, Field
+from datetime import date, datetime
+from typing import Any, Dict, Optional, List
+from pydantic import BaseModel, Field, field_validator
 
 
 # --- Category Schemas ---
@@ -49,6 +49,11 @@ class CategoryTreeResponse(BaseModel):
 
 # --- Product Schemas ---
 
+def _blank_to_none(value):
+    """Articles are unique when set: an empty one is no article."""
+    return (value.strip() or None) if isinstance(value, str) else value
+
+
 class ProductBase(BaseModel):
     name: str
     description: Optional[str] = None
@@ -62,6 +67,11 @@ class ProductBase(BaseModel):
     in_stock: Optional[int] = None  # None = unlimited
     active: bool = True
 
+    @field_validator("sku", mode="before")
+    @classmethod
+    def _blank_sku(cls, value):
+        return _blank_to_none(value)
+
 
 class ProductCreate(ProductBase):
     category_id: int
@@ -85,6 +95,18 @@ class ProductUpdate(BaseModel):
     in_stock: Optional[int] = None
     active: Optional[bool] = None
 
+    @field_validator("sku", mode="before")
+    @classmethod
+    def _blank_sku(cls, value):
+        return _blank_to_none(value)
+
+
+
+class ImageVariant(BaseModel):
+    url: str
+    width: int
+    height: int
+    type: str = "image/webp"
 
 
 class ProductImageResponse(BaseModel):
@@ -92,6 +114,16 @@ class ProductImageResponse(BaseModel):
     file_id: Optional[str]
     image_url: Optional[str]
     is_main: bool
+    thumb_url: Optional[str] = None
+    variants: List[ImageVariant] = []
+    width: Optional[int] = None
+    height: Optional[int] = None
+    lqip: Optional[str] = None
+
+    @field_validator("variants", mode="before")
+    @classmethod
+    def _no_variants(cls, value):
+        return value or []
 
     class Config:
         from_attributes = True
@@ -112,10 +144,16 @@ class ProductResponse(ProductBase):
 class ProductListResponse(BaseModel):
     """Paginated product list response."""
     items: List[ProductResponse]
-    total: int
-    page: int
+    total: Optional[int] = None  # None when requested with include_total=false
+    page: Optional[int] = None  # None for cursor pages
     limit: int
-    pages: int
+    pages: Optional[int] = None
+    next_cursor: Optional[str] = None  # Pass back as `cursor` for the next page
+
+
+class SuggestResponse(BaseModel):
+    """Autocomplete suggestions for the search box."""
+    suggestions: List[str]
 
 
 # --- Cart Schemas ---
@@ -186,6 +224,38 @@ class OrderResponse(BaseModel):
 
 class OrderListResponse(BaseModel):
     orders: List[OrderResponse]
+    total: Optional[int] = None
+    next_cursor: Optional[str] = None
+
+
+# --- Stats Schemas ---
+
+class StatusStats(BaseModel):
+    orders: int
+    revenue: float
+
+
+class DayStats(BaseModel):
+    day: date
+    orders: int
+    revenue: float
+
+
+class TopProduct(BaseModel):
+    product_id: int
+    product_name: str
+    orders: int
+    quantity_packs: int
+    revenue: float
+
+
+class StatsResponse(BaseModel):
+    total_orders: int
+    revenue: float
+    by_status: Dict[str, StatusStats]
+    top_products: List[TopProduct]
+    daily: List[DayStats]
+    weekly: List[DayStats]
 
 
 # --- Admin Schemas ---
@@ -194,6 +264,25 @@ class AdminAuth(BaseModel):
     telegram_user_id: int
 
 
+class JobResponse(BaseModel):
+    """Background job state (api.jobs)."""
+    id: str
+    kind: str
+    status: str  # queued, running, done, failed
+    stage: Optional[str] = None
+    done: int
+    total: Optional[int] = None
+    progress: float
+    result: Optional[Dict[str, Any]] = None
+    errors: List[str] = []
+    error: Optional[str] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
 class MessageResponse(BaseModel):
     message: str
     id: Optional[int] = None
@@ -0,0 +1,97 @@
+"""
+SQLite FTS5 full-text index over product name, description and SKU.
+
+The index is a standalone FTS5 table kept in sync with `products` by
+triggers, so every write path (API, bot, Excel import, scripts) updates
+it without extra code. Text is stored with ё folded to е; unicode61
+takes care of case folding for Cyrillic.
+"""
+import logging
+import re
+from typing import Optional
+
+from sqlalchemy import column, select, table, text
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = "products_fts"
+
+# Set by ensure_fts(); when False the API falls back to ILIKE search
+fts_enabled = False
+
+fts = table(FTS_TABLE, column("rowid"), column("rank"))
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _fold(sql_expr: str) -> str:
+    return f"replace(replace(coalesce({sql_expr}, ''), 'ё', 'е'), 'Ё', 'Е')"
+
+
+_INSERT_ROW = (
+    f"INSERT INTO {FTS_TABLE}(rowid, name, description, sku) "
+    f"VALUES (new.id, {_fold('new.name')}, {_fold('new.description')}, {_fold('new.sku')});"
+)
+
+_DDL = [
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+    "USING fts5(name, description, sku, tokenize = 'unicode61 remove_diacritics 2')",
+    f"CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN {_INSERT_ROW} END",
+    f"CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN "
+    f"DELETE FROM {FTS_TABLE} WHERE rowid = old.id; END",
+    f"CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE OF name, description, sku ON products BEGIN "
+    f"DELETE FROM {FTS_TABLE} WHERE rowid = old.id; {_INSERT_ROW} END",
+]
+
+
+async def ensure_fts(conn) -> None:
+    """Create the FTS table and triggers, filling the index on first run."""
+    global fts_enabled
+    if conn.dialect.name != "sqlite":
+        return
+
+    exists = (await conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {"name": FTS_TABLE}
+    )).first()
+
+    try:
+        for statement in _DDL:
+            await conn.execute(text(statement))
+    except Exception as e:
+        # SQLite built without FTS5
+        logger.warning(f"Full-text search disabled: {e}")
+        return
+
+    if not exists:
+        await conn.execute(text(
+            f"INSERT INTO {FTS_TABLE}(rowid, name, description, sku) "
+            f"SELECT id, {_fold('name')}, {_fold('description')}, {_fold('sku')} FROM products"
+        ))
+    fts_enabled = True
+
+
+async def drop_fts(conn) -> None:
+    """Drop the FTS table (its triggers go away with `products`)."""
+    if conn.dialect.name == "sqlite":
+        await conn.execute(text(f"DROP TABLE IF EXISTS {FTS_TABLE}"))
+
+
+def build_match_query(q: str) -> Optional[str]:
+    """
+    Turn free user input into an FTS5 MATCH expression: every word must
+    match as a prefix. Words are quoted so FTS syntax in the input is inert.
+    """
+    words = _TOKEN_RE.findall(q.replace("ё", "е").replace("Ё", "Е"))
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def match_subquery(match: str):
+    """(product_id, rank) for every product matching; lower rank is better."""
+    return (
+        select(fts.c.rowid.label("product_id"), fts.c.rank.label("rank"))
+        .where(text(f"{FTS_TABLE} MATCH :match").bindparams(match=match))
+        .subquery()
+    )
@@ -0,0 +1,355 @@
+"""
+In-process catalog search index with Russian stemming, typo tolerance
+and prefix autocomplete.
+
+Built from the active products at API startup and updated in place by
+the product write paths. Lookups never touch the database: the routes
+only fetch the final page of products by id.
+
+A rebuild (build_index) makes a new SearchIndex in a worker thread and
+then replaces the module-level `index`, so callers always go through
+`search_index.index` rather than keeping a reference to the object.
+"""
+import asyncio
+import bisect
+import heapq
+import logging
+import re
+from collections import defaultdict
+from types import SimpleNamespace
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import select
+
+from .stemmer import stem
+
+logger = logging.getLogger(__name__)
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Field weights: SKU hits beat name hits beat description hits
+NAME_WEIGHT = 2.0
+SKU_WEIGHT = 3.0
+DESCRIPTION_WEIGHT = 1.0
+
+# Match-kind multipliers
+EXACT = 1.0
+PREFIX = 0.8
+STEM_PREFIX = 0.6
+FUZZY = 0.5
+
+FUZZY_MIN_SIMILARITY = 0.4
+MAX_PREFIX_EXPANSIONS = 50
+
+# A query word this short completes to a large part of the catalog. When
+# it is the rarest word of the query, only its most common completions,
+# up to about this many products, are kept, and an exact hit counts only
+# as a name or article word (in descriptions "с" or "в" are everywhere)
+SHORT_PREFIX_LENGTH = 3
+MAX_SHORT_PREFIX_POSTINGS = 2000
+
+# Product fields the index reads
+INDEXED_FIELDS = ("id", "name", "sku", "description", "category_id", "subcategory_id", "active")
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Lowercase words with ё folded to е."""
+    if not text:
+        return []
+    return _TOKEN_RE.findall(text.lower().replace("ё", "е"))
+
+
+def _sku_term(sku: str) -> str:
+    """Whole SKU as a single term; the space keeps it apart from word stems."""
+    return " " + sku.strip().lower()
+
+
+def trigrams(term: str) -> Set[str]:
+    padded = f"  {term} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class SearchIndex:
+    """Inverted index over product name, SKU and description."""
+
+    def __init__(self):
+        self.ready = False
+        # Writes made while a replacement index is being built, replayed
+        # onto it before it goes live: (product_id, product or None if removed)
+        self._journal: Optional[List[Tuple[int, Optional[SimpleNamespace]]]] = None
+        # stem -> {product_id: best field weight}
+        self.postings: Dict[str, Dict[int, float]] = defaultdict(dict)
+        # trigram -> stems containing it (typo tolerance)
+        self.trigram_stems: Dict[str, Set[str]] = defaultdict(set)
+        # surface word -> number of products using it, plus a sorted copy for prefixes
+        self.word_freq: Dict[str, int] = defaultdict(int)
+        self.words: List[str] = []
+        # product_id -> (category_id, subcategory_id, stems, words)
+        self.docs: Dict[int, Tuple[Optional[int], Optional[int], Set[str], Set[str]]] = {}
+
+    # --- Building ---
+
+    @classmethod
+    def build(cls, products: Iterable) -> "SearchIndex":
+        """
+        A new, ready index of the given active products. Touches nothing
+        shared, so it can run in a worker thread while the live index serves.
+        """
+        built = cls()
+        for product in products:
+            built._add(product)
+        built.words = sorted(w for w, n in built.word_freq.items() if n > 0)
+        built.ready = True
+        return built
+
+    def upsert(self, product) -> None:
+        """Index (or re-index) one product; inactive products are removed."""
+        if self._journal is not None:
+            # A copy: the ORM object may be expired by the time it is replayed
+            self._journal.append((product.id, SimpleNamespace(**{f: getattr(product, f) for f in INDEXED_FIELDS})))
+        if not self.ready:
+            return
+        self._remove(product.id)
+        if product.active:
+            for word in self._add(product):
+                pos = bisect.bisect_left(self.words, word)
+                if pos == len(self.words) or self.words[pos] != word:
+                    self.words.insert(pos, word)
+
+    def remove(self, product_id: int) -> None:
+        if self._journal is not None:
+            self._journal.append((product_id, None))
+        if self.ready:
+            self._remove(product_id)
+
+    def _remove(self, product_id: int) -> None:
+        doc = self.docs.pop(product_id, None)
+        if doc is None:
+            return
+        _, _, stems, words = doc
+        for term in stems:
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(product_id, None)
+                if not postings:
+                    del self.postings[term]
+        # Words with zero frequency stay in self.words and are skipped lazily
+        for word in words:
+            self.word_freq[word] -= 1
+
+    def _add(self, product) -> Set[str]:
+        stems: Set[str] = set()
+        words: Set[str] = set()
+        for text, weight in (
+            (product.name, NAME_WEIGHT),
+            (product.sku, SKU_WEIGHT),
+            (product.description, DESCRIPTION_WEIGHT),
+        ):
+            for word in tokenize(text):
+                term = stem(word)
+                postings = self.postings[term]
+                if postings.get(product.id, 0) < weight:
+                    postings[product.id] = weight
+                if term not in stems:
+                    stems.add(term)
+                    if len(postings) == 1:
+                        for gram in trigrams(term):
+                            self.trigram_stems[gram].add(term)
+                if weight != DESCRIPTION_WEIGHT:
+                    words.add(word)
+        if product.sku:
+            term = _sku_term(product.sku)
+            self.postings[term][product.id] = SKU_WEIGHT
+            stems.add(term)
+        for word in words:
+            self.word_freq[word] += 1
+        self.docs[product.id] = (product.category_id, product.subcategory_id, stems, words)
+        return words
+
+    # --- Lookup ---
+
+    def _prefix_words(self, prefix: str, limit: int) -> List[str]:
+        """Live surface words starting with prefix, most frequent first."""
+        start = bisect.bisect_left(self.words, prefix)
+        found = []
+        for word in self.words[start:]:
+            if not word.startswith(prefix):
+                break
+            if self.word_freq.get(word, 0) > 0:
+                found.append(word)
+        return heapq.nlargest(limit, found, key=lambda w: self.word_freq[w])
+
+    def _fuzzy_stems(self, term: str) -> List[Tuple[str, float]]:
+        """Stems whose trigram Jaccard similarity to term clears the threshold."""
+        grams = trigrams(term)
+        overlap: Dict[str, int] = defaultdict(int)
+        for gram in grams:
+            for candidate in self.trigram_stems.get(gram, ()):
+                overlap[candidate] += 1
+        matches = []
+        for candidate, shared in overlap.items():
+            similarity = shared / (len(grams) + len(candidate) + 1 - shared)
+            if similarity >= FUZZY_MIN_SIMILARITY and candidate in self.postings:
+                matches.append((candidate, similarity))
+        return matches
+
+    def _term_matches(self, word: str, is_last: bool) -> Dict[str, float]:
+        """Index stems matching one query word, with their match multiplier."""
+        term = stem(word)
+        matches: Dict[str, float] = {}
+        if term in self.postings:
+            matches[term] = EXACT
+
+        # Autocomplete: words may be unfinished prefixes, the last one most likely
+        limit = MAX_PREFIX_EXPANSIONS if is_last else MAX_PREFIX_EXPANSIONS // 5
+        for candidate in self._prefix_words(word, limit):
+            matches.setdefault(stem(candidate), PREFIX)
+
+        if not matches and len(term) >= 4:
+            # Diminutives and extra suffixes: "зонтик" -> "зонт"
+            for size in range(len(term) - 1, max(3, len(term) * 2 // 3) - 1, -1):
+                if term[:size] in self.postings:
+                    matches[term[:size]] = STEM_PREFIX
+                    break
+            # Typos: "аквашуз" / "матрсы"
+            for candidate, similarity in self._fuzzy_stems(term):
+                matches.setdefault(candidate, FUZZY * similarity)
+        return matches
+
+    def _short_prefix_matches(self, word: str, matches: Dict[str, float]) -> Dict[str, float]:
+        """matches of a short word cut to its most common completions (see SHORT_PREFIX_LENGTH)."""
+        kept: Dict[str, float] = {}
+        postings = 0
+        # Exact hit first, then completions most frequent first
+        for term, multiplier in matches.items():
+            if postings >= MAX_SHORT_PREFIX_POSTINGS:
+                break
+            if multiplier == EXACT and not self.word_freq.get(word):
+                continue
+            kept[term] = multiplier
+            postings += len(self.postings.get(term, ()))
+        return kept or matches
+
+    def search(
+        self,
+        q: str,
+        category: Optional[int] = None,
+        subcategory: Optional[int] = None,
+        limit: Optional[int] = None,
+    ) -> Tuple[List[int], int]:
+        """
+        Up to `limit` product ids ranked best first, plus the total number
+        of matches. Every query word has to match. A query led by a word
+        shorter than SHORT_PREFIX_LENGTH matches only its most common
+        completions, so the total is smaller than a full scan would give.
+        """
+        words = tokenize(q)
+        if not words:
+            return [], 0
+
+        # Whole-query SKU hit ("ART-123") wins outright
+        scores = dict(self.postings.get(_sku_term(q), {}))
+        if not scores:
+            scores = self._score(words)
+
+        if category or subcategory:
+            scores = {
+                pid: s for pid, s in scores.items()
+                if (not category or self.docs[pid][0] == category)
+                and (not subcategory or self.docs[pid][1] == subcategory)
+            }
+        # Best score first, then lowest id; plain tuples compare without a key function
+        ranked = [(-score, product_id) for product_id, score in scores.items()]
+        ranked = sorted(ranked) if limit is None else heapq.nsmallest(limit, ranked)
+        return [product_id for _, product_id in ranked], len(scores)
+
+    def _score(self, words: List[str]) -> Dict[int, float]:
+        """Score of every product matching all words."""
+        # Resolve every word to index terms, then intersect starting from
+        # the rarest word so frequent words only cost dict lookups.
+        word_terms = [
+            self._term_matches(word, i == len(words) - 1)
+            for i, word in enumerate(words)
+        ]
+        order = sorted(
+            range(len(words)),
+            key=lambda i: sum(len(self.postings.get(t, ())) for t in word_terms[i]),
+        )
+        first = word_terms[order[0]]
+        if len(words[order[0]]) < SHORT_PREFIX_LENGTH:
+            first = self._short_prefix_matches(words[order[0]], first)
+        if not first:
+            return {}
+
+        # Strongest match kind first: the first term fills the dict in one go
+        terms = sorted(first.items(), key=lambda item: -item[1])
+        term, multiplier = terms[0]
+        scores = {pid: weight * multiplier for pid, weight in self.postings.get(term, {}).items()}
+        for term, multiplier in terms[1:]:
+            for product_id, weight in self.postings.get(term, {}).items():
+                score = weight * multiplier
+                if scores.get(product_id, 0) < score:
+                    scores[product_id] = score
+
+        for i in order[1:]:
+            if not scores:
+                break
+            best: Dict[int, float] = {}
+            for term, multiplier in word_terms[i].items():
+                postings = self.postings.get(term, {})
+                # Key views intersect in C, walking the smaller side
+                for product_id in scores.keys() & postings.keys():
+                    score = postings[product_id] * multiplier
+                    if best.get(product_id, 0) < score:
+                        best[product_id] = score
+            scores = {product_id: scores[product_id] + score for product_id, score in best.items()}
+        return scores
+
+    def suggest(self, q: str, limit: int = 8) -> List[str]:
+        """Completions of the last word of q, keeping the words before it."""
+        words = tokenize(q)
+        if not words:
+            return []
+        head = " ".join(words[:-1])
+        completions = self._prefix_words(words[-1], limit)
+        return [f"{head} {word}" if head else word for word in completions]
+
+
+index = SearchIndex()
+
+# One rebuild at a time: each journals writes on the index it replaces
+_build_lock = asyncio.Lock()
+
+
+async def build_index() -> None:
+    """
+    Load active products, build a new index off the event loop and swap it
+    in. Searches keep using the old index meanwhile; product writes made
+    during the build are applied to both.
+    """
+    global index
+    from .database import AsyncSessionLocal
+    from .models import Product
+
+    async with _build_lock:
+        live = index
+        # Journal from before the query: a write committed after it is
+        # replayed, one committed before it is replayed harmlessly
+        live._journal = []
+        try:
+            async with AsyncSessionLocal() as session:
+                result = await session.execute(select(Product).where(Product.active == True))
+                products = result.scalars().all()
+
+            built = await asyncio.to_thread(SearchIndex.build, products)
+            # No await from here on, so no write slips in between replay and swap
+            for product_id, product in live._journal:
+                if product is None:
+                    built.remove(product_id)
+                else:
+                    built.upsert(product)
+            index = built
+        finally:
+            live._journal = None
+
+    logger.info(f"Search index built: {len(index.docs)} products, {len(index.postings)} terms")
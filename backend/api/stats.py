@@ -0,0 +1,189 @@
+"""
+Incrementally maintained order statistics.
+
+Every order adds its totals to two rollup tables when it is created and
+moves them between statuses when its status changes, in the same
+transaction as the order write. Reading stats then only touches the
+rollups, however many orders there are.
+"""
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import case, func, select, text
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import OrderItem, OrderStatsDaily, Product, ProductSales
+from .schemas import DayStats, StatsResponse, StatusStats, TopProduct
+
+# Statuses whose orders count as revenue
+REVENUE_STATUSES = ("accepted", "completed")
+
+
+async def _add_order(
+    db: AsyncSession,
+    day: date,
+    status: str,
+    total_amount: float,
+    lines: List[Tuple[int, int, float]],
+    sign: int,
+) -> None:
+    """Add (sign=1) or subtract (sign=-1) one order from the rollups."""
+    stmt = insert(OrderStatsDaily).values(
+        day=day, status=status, orders=sign, revenue=sign * total_amount
+    )
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=[OrderStatsDaily.day, OrderStatsDaily.status],
+        set_={
+            "orders": OrderStatsDaily.orders + stmt.excluded.orders,
+            "revenue": OrderStatsDaily.revenue + stmt.excluded.revenue,
+        },
+    ))
+
+    # Several lines may share a product; merge so each row is touched once
+    per_product: Dict[int, List] = {}
+    for product_id, packs, subtotal in lines:
+        row = per_product.setdefault(product_id, [0, 0.0])
+        row[0] += packs
+        row[1] += subtotal
+    if not per_product:
+        return
+    stmt = insert(ProductSales).values([
+        {
+            "product_id": product_id,
+            "status": status,
+            "orders": sign,
+            "quantity_packs": sign * packs,
+            "revenue": sign * subtotal,
+        }
+        for product_id, (packs, subtotal) in per_product.items()
+    ])
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=[ProductSales.product_id, ProductSales.status],
+        set_={
+            "orders": ProductSales.orders + stmt.excluded.orders,
+            "quantity_packs": ProductSales.quantity_packs + stmt.excluded.quantity_packs,
+            "revenue": ProductSales.revenue + stmt.excluded.revenue,
+        },
+    ))
+
+
+async def record_order(db: AsyncSession, order, items: List[dict]) -> None:
+    """Count a freshly created order; `items` are the inserted order_items rows."""
+    lines = [(i["product_id"], i["quantity_packs"], i["subtotal"]) for i in items]
+    await _add_order(db, order.created_at.date(), order.status, float(order.total_amount), lines, 1)
+
+
+async def record_status_change(db: AsyncSession, order, old_status: str, new_status: str) -> None:
+    """Move an order's totals from old_status to new_status."""
+    if old_status == new_status:
+        return
+    result = await db.execute(
+        select(OrderItem.product_id, OrderItem.quantity_packs, OrderItem.subtotal)
+        .where(OrderItem.order_id == order.id)
+    )
+    lines = [(product_id, packs, float(subtotal)) for product_id, packs, subtotal in result.all()]
+    day = order.created_at.date()
+    total_amount = float(order.total_amount)
+    await _add_order(db, day, old_status, total_amount, lines, -1)
+    await _add_order(db, day, new_status, total_amount, lines, 1)
+
+
+def backfill(sync_conn) -> None:
+    """Fill empty rollups from existing orders (first start after upgrade)."""
+    if sync_conn.execute(text("SELECT 1 FROM order_stats_daily LIMIT 1")).first():
+        return
+    sync_conn.execute(text("""
+        INSERT INTO order_stats_daily (day, status, orders, revenue)
+        SELECT date(created_at), status, count(*), sum(total_amount)
+        FROM orders GROUP BY date(created_at), status
+    """))
+    sync_conn.execute(text("DELETE FROM product_sales"))
+    sync_conn.execute(text("""
+        INSERT INTO product_sales (product_id, status, orders, quantity_packs, revenue)
+        SELECT oi.product_id, o.status, count(DISTINCT o.id), sum(oi.quantity_packs), sum(oi.subtotal)
+        FROM order_items oi JOIN orders o ON o.id = oi.order_id
+        GROUP BY oi.product_id, o.status
+    """))
+
+
+async def get_stats(db: AsyncSession, days: int = 30, top: int = 10, today: Optional[date] = None) -> StatsResponse:
+    """Totals, per-status breakdown, top products and daily/weekly revenue."""
+    today = today or datetime.utcnow().date()
+    since = today - timedelta(days=days - 1)
+    is_revenue = OrderStatsDaily.status.in_(REVENUE_STATUSES)
+
+    # Totals per status (the daily rollup is days x statuses rows)
+    result = await db.execute(
+        select(
+            OrderStatsDaily.status,
+            func.sum(OrderStatsDaily.orders),
+            func.sum(OrderStatsDaily.revenue),
+        ).group_by(OrderStatsDaily.status)
+    )
+    by_status = {
+        status: StatusStats(orders=orders or 0, revenue=round(float(revenue or 0), 2))
+        for status, orders, revenue in result.all()
+        if orders
+    }
+
+    # Per day over the window: every order counted, revenue from REVENUE_STATUSES
+    result = await db.execute(
+        select(
+            OrderStatsDaily.day,
+            func.sum(OrderStatsDaily.orders),
+            func.sum(case((is_revenue, OrderStatsDaily.revenue), else_=0)),
+        )
+        .where(OrderStatsDaily.day >= since)
+        .group_by(OrderStatsDaily.day)
+        .order_by(OrderStatsDaily.day)
+    )
+    daily = [
+        DayStats(day=day, orders=orders or 0, revenue=round(float(revenue or 0), 2))
+        for day, orders, revenue in result.all()
+    ]
+
+    # Weeks start on Monday; fold the daily rows already loaded
+    weekly: Dict[date, DayStats] = {}
+    for row in daily:
+        week = row.day - timedelta(days=row.day.weekday())
+        bucket = weekly.setdefault(week, DayStats(day=week, orders=0, revenue=0))
+        bucket.orders += row.orders
+        bucket.revenue = round(bucket.revenue + row.revenue, 2)
+
+    # Best sellers by revenue among accepted/completed orders
+    revenue = func.sum(ProductSales.revenue).label("revenue")
+    result = await db.execute(
+        select(
+            ProductSales.product_id,
+            Product.name,
+            func.sum(ProductSales.orders),
+            func.sum(ProductSales.quantity_packs),
+            revenue,
+        )
+        .outerjoin(Product, Product.id == ProductSales.product_id)
+        .where(ProductSales.status.in_(REVENUE_STATUSES))
+        .group_by(ProductSales.product_id)
+        .having(func.sum(ProductSales.quantity_packs) > 0)
+        .order_by(revenue.desc(), ProductSales.product_id)
+        .limit(top)
+    )
+    top_products = [
+        TopProduct(
+            product_id=product_id,
+            product_name=name or "Удалённый товар",
+            orders=orders,
+            quantity_packs=packs,
+            revenue=round(float(revenue), 2),
+        )
+        for product_id, name, orders, packs, revenue in result.all()
+    ]
+
+    return StatsResponse(
+        total_orders=sum(s.orders for s in by_status.values()),
+        revenue=round(sum(s.revenue for status, s in by_status.items() if status in REVENUE_STATUSES), 2),
+        by_status=by_status,
+        top_products=top_products,
+        daily=daily,
+        weekly=list(weekly.values()),
+    )
@@ -0,0 +1,135 @@
+"""
+Russian Snowball (Porter) stemmer.
+
+Pure-Python port of the Snowball "russian" algorithm, so the catalog
+search does not need an extra dependency. Words in other scripts are
+returned unchanged (lowercased).
+"""
+from functools import lru_cache
+from typing import Optional, Sequence
+
+VOWELS = set("аеиоуыэюя")
+
+PERFECTIVE_GERUND_1 = ("в", "вши", "вшись")  # preceded by а/я
+PERFECTIVE_GERUND_2 = ("ив", "ивши", "ившись", "ыв", "ывши", "ывшись")
+
+ADJECTIVE = (
+    "ее", "ие", "ые", "ое", "ими", "ыми", "ей", "ий", "ый", "ой", "ем", "им", "ым",
+    "ом", "его", "ого", "ему", "ому", "их", "ых", "ую", "юю", "ая", "яя", "ою", "ею",
+)
+
+PARTICIPLE_1 = ("ем", "нн", "вш", "ющ", "щ")  # preceded by а/я
+PARTICIPLE_2 = ("ивш", "ывш", "ующ")
+
+REFLEXIVE = ("ся", "сь")
+
+VERB_1 = (  # preceded by а/я
+    "ла", "на", "ете", "йте", "ли", "й", "л", "ем", "н", "ло", "но", "ет", "ют",
+    "ны", "ть", "ешь", "нно",
+)
+VERB_2 = (
+    "ила", "ыла", "ена", "ейте", "уйте", "ите", "или", "ыли", "ей", "уй", "ил",
+    "ыл", "им", "ым", "ен", "ило", "ыло", "ено", "ят", "ует", "уют", "ит", "ыт",
+    "ены", "ить", "ыть", "ишь", "ую", "ю",
+)
+
+NOUN = (
+    "а", "ев", "ов", "ие", "ье", "е", "иями", "ями", "ами", "еи", "ии", "и",
+    "ией", "ей", "ой", "ий", "й", "иям", "ям", "ием", "ем", "ам", "ом", "о", "у",
+    "ах", "иях", "ях", "ы", "ь", "ию", "ью", "ю", "ия", "ья", "я",
+)
+
+SUPERLATIVE = ("ейш", "ейше")
+DERIVATIONAL = ("ост", "ость")
+
+
+def _regions(word: str):
+    """Start offsets of RV and R2."""
+    rv = len(word)
+    for i, ch in enumerate(word):
+        if ch in VOWELS:
+            rv = i + 1
+            break
+
+    def after_vc(start: int) -> int:
+        for i in range(start + 1, len(word)):
+            if word[i] not in VOWELS and word[i - 1] in VOWELS:
+                return i + 1
+        return len(word)
+
+    r1 = after_vc(0)
+    r2 = after_vc(r1) if r1 < len(word) else len(word)
+    return rv, r2
+
+
+def _longest(word: str, start: int, plain: Sequence[str], after_a: Sequence[str] = ()) -> Optional[str]:
+    """
+    Longest ending found in word[start:]. Endings from `after_a` only
+    count when preceded by а/я inside the region (as in Snowball, a
+    failed condition does not fall back to a shorter ending).
+    """
+    best = None
+    for ending in (*plain, *after_a):
+        if word.endswith(ending) and len(word) - len(ending) >= start:
+            if best is None or len(ending) > len(best):
+                best = ending
+    if best is None:
+        return None
+    if best in after_a and best not in plain:
+        pos = len(word) - len(best) - 1
+        if pos < start or word[pos] not in "ая":
+            return None
+    return best
+
+
+@lru_cache(maxsize=100_000)
+def stem(word: str) -> str:
+    """Stem a single lowercase word."""
+    word = word.lower().replace("ё", "е")
+    if not any(ch in VOWELS for ch in word):
+        return word
+
+    rv, r2 = _regions(word)
+
+    # Step 1
+    ending = _longest(word, rv, PERFECTIVE_GERUND_2, PERFECTIVE_GERUND_1)
+    if ending:
+        word = word[:-len(ending)]
+    else:
+        ending = _longest(word, rv, REFLEXIVE)
+        if ending:
+            word = word[:-len(ending)]
+
+        ending = _longest(word, rv, ADJECTIVE)
+        if ending:
+            word = word[:-len(ending)]
+            participle = _longest(word, rv, PARTICIPLE_2, PARTICIPLE_1)
+            if participle:
+                word = word[:-len(participle)]
+        else:
+            ending = _longest(word, rv, VERB_2, VERB_1) or _longest(word, rv, NOUN)
+            if ending:
+                word = word[:-len(ending)]
+
+    # Step 2
+    if word.endswith("и") and len(word) - 1 >= rv:
+        word = word[:-1]
+
+    # Step 3
+    ending = _longest(word, r2, DERIVATIONAL)
+    if ending:
+        word = word[:-len(ending)]
+
+    # Step 4
+    if word.endswith("нн") and len(word) - 2 >= rv:
+        word = word[:-1]
+    else:
+        ending = _longest(word, rv, SUPERLATIVE)
+        if ending:
+            word = word[:-len(ending)]
+            if word.endswith("нн") and len(word) - 2 >= rv:
+                word = word[:-1]
+        elif word.endswith("ь") and len(word) - 1 >= rv:
+            word = word[:-1]
+
+    return word
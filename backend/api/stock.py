@@ -0,0 +1,67 @@
+"""
+Atomic stock reservation for checkout.
+
+All order lines are reserved with one conditional UPDATE, so concurrent
+checkouts can never oversell: the database only decrements rows that
+still have enough stock, and the caller rolls back if any line missed.
+"""
+from collections import defaultdict
+from typing import Dict, Iterable, List
+
+from sqlalchemy import case, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import Product
+from .schemas import CartValidateError
+
+
+def total_packs(items: Iterable) -> Dict[int, int]:
+    """Packs per product, merging repeated cart lines for the same product."""
+    quantities: Dict[int, int] = defaultdict(int)
+    for item in items:
+        quantities[item.product_id] += item.quantity_packs
+    return dict(quantities)
+
+
+async def reserve_stock(db: AsyncSession, quantities: Dict[int, int]) -> List[CartValidateError]:
+    """
+    Take `quantities` (product_id -> packs) out of tracked stock.
+
+    Runs as the first write of the caller's transaction, which makes
+    SQLite take the write lock before anything else. Products with
+    unlimited stock (in_stock IS NULL) are left alone. Returns one error
+    per line that could not be reserved; the caller must roll back then.
+    """
+    if not quantities:
+        return []
+
+    wanted = case(quantities, value=Product.id)
+    result = await db.execute(
+        update(Product)
+        .where(
+            Product.id.in_(quantities),
+            Product.in_stock.is_not(None),
+            Product.in_stock >= wanted,
+        )
+        .values(in_stock=Product.in_stock - wanted)
+        .returning(Product.id)
+        .execution_options(synchronize_session=False)
+    )
+    reserved = set(result.scalars().all())
+
+    # Lines not reserved are fine if the product doesn't track stock
+    missed = set(quantities) - reserved
+    if not missed:
+        return []
+    result = await db.execute(
+        select(Product.id, Product.name, Product.in_stock)
+        .where(Product.id.in_(missed), Product.in_stock.is_not(None))
+    )
+    return [
+        CartValidateError(
+            product_id=product_id,
+            product_name=name,
+            error=f"Недостаточно товара. Доступно: {in_stock} пачек"
+        )
+        for product_id, name, in_stock in result.all()
+    ]
@@ -0,0 +1,173 @@
+"""
+Storage of photos uploaded through the web admin.
+
+Every upload is stored as a set of resized files plus a small JSON
+manifest (`{name}.json`) describing them. Product images that reference
+an uploaded file get the manifest copied onto their ProductImage row, so
+product payloads carry the variants, dimensions and LQIP placeholder
+without touching the disk.
+
+Uploads are content-addressed: the name is the SHA-256 of the raw bytes,
+so the same photo uploaded for many products is processed and stored
+once. scripts/gc_uploads.py deletes sets no product refers to any more.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import tempfile
+from pathlib import Path
+from typing import Dict, Optional
+
+from . import imaging
+
+# Persistent volume in Docker, backend/static/uploads locally
+IS_DOCKER = os.path.exists("/data")
+if IS_DOCKER:
+    UPLOAD_DIR = Path("/data/uploads")
+    URL_PREFIX = "/uploads/"
+else:
+    UPLOAD_DIR = Path(__file__).resolve().parent.parent / "static" / "uploads"
+    URL_PREFIX = "/static/uploads/"
+# Elsewhere for scripts, which must not write into the served directory
+if os.getenv("UPLOAD_DIR"):
+    UPLOAD_DIR = Path(os.getenv("UPLOAD_DIR"))
+
+# Both prefixes appear in stored file_ids, depending on where they were uploaded
+_URL_PREFIXES = ("/uploads/", "/static/uploads/")
+
+# Image description stored on ProductImage (see imaging.describe_image)
+IMAGE_INFO = ("width", "height", "lqip")
+
+# Concurrent uploads of the same bytes share one processing job
+_inflight: Dict[str, "asyncio.Task[Dict]"] = {}
+
+
+def url_for(filename: str) -> str:
+    return f"{URL_PREFIX}{filename}"
+
+
+def set_name(filename: str) -> str:
+    """Upload set a stored file belongs to: `{name}_300.webp` -> `{name}`."""
+    return re.split(r"[_.]", filename, maxsplit=1)[0]
+
+
+def upload_set(file_id: Optional[str]) -> Optional[str]:
+    """Upload set name behind a stored file_id/URL, or None if it isn't an upload."""
+    if not file_id:
+        return None
+    for prefix in _URL_PREFIXES:
+        if file_id.startswith(prefix):
+            filename = file_id[len(prefix):]
+            if "/" in filename:
+                return None
+            return set_name(filename)
+    return None
+
+
+def store_image_set(contents: bytes, name: str) -> Dict:
+    """
+    Resize an uploaded photo into the width ladder and write its manifest.
+    Blocking: run it through imaging.run().
+    """
+    UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+    files = imaging.save_image_set(contents, UPLOAD_DIR, name)
+    variants = [
+        {"url": url_for(f["filename"]), "width": f["width"], "height": f["height"], "type": f["type"]}
+        for f in files
+    ]
+    webp = [v for v in variants if v["type"] == "image/webp"]
+    # Smallest rung that still covers the catalog preview size
+    thumb = next(
+        (v for v in reversed(webp) if max(v["width"], v["height"]) >= imaging.THUMB_SIDE),
+        webp[0]
+    )
+    manifest = {
+        "url": webp[0]["url"],
+        "thumb_url": thumb["url"],
+        "variants": variants,
+        "width": webp[0]["width"],
+        "height": webp[0]["height"],
+        # From the smallest rung: the placeholder is 16px anyway
+        "lqip": imaging.describe_image(local_path(webp[-1]["url"]))["lqip"],
+    }
+    # The manifest marks the set as complete, so it is written last and atomically
+    fd, tmp = tempfile.mkstemp(dir=UPLOAD_DIR, prefix=".", suffix=".json")
+    with os.fdopen(fd, "w") as f:
+        json.dump(manifest, f)
+    os.replace(tmp, UPLOAD_DIR / f"{name}.json")
+    return manifest
+
+
+def _read_set(name: str) -> Optional[Dict]:
+    try:
+        return json.loads((UPLOAD_DIR / f"{name}.json").read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def _refresh_set(name: str, manifest: Dict) -> bool:
+    """
+    Touch the files of a reused set: gc_uploads.py keeps unreferenced sets
+    younger than its grace period, and the product form using this one may
+    not be saved yet. False if some of them are gone (deleted meanwhile).
+    """
+    paths = [UPLOAD_DIR / f"{name}.json"] + [local_path(v["url"]) for v in manifest["variants"]]
+    try:
+        for path in paths:
+            os.utime(path)
+    except FileNotFoundError:
+        return False
+    return True
+
+
+async def store_upload(contents: bytes) -> Dict:
+    """
+    Manifest of the image set for these bytes, processing them only if
+    no identical photo was uploaded before. May raise imaging.ImagingBusy
+    or imaging.ImageProcessingError.
+    """
+    name = hashlib.sha256(contents).hexdigest()[:32]
+    manifest = _read_set(name)
+    if manifest is not None and _refresh_set(name, manifest):
+        return manifest
+
+    task = _inflight.get(name)
+    if task is None:
+        async def process() -> Dict:
+            try:
+                return await imaging.run(store_image_set, contents, name)
+            finally:
+                _inflight.pop(name, None)
+
+        task = asyncio.create_task(process())
+        _inflight[name] = task
+    return await asyncio.shield(task)
+
+
+def local_path(file_id: Optional[str]) -> Optional[Path]:
+    """File on disk behind an uploaded file_id, or None if it isn't an upload."""
+    if upload_set(file_id) is None:
+        return None
+    return UPLOAD_DIR / file_id.rsplit("/", 1)[1]
+
+
+def read_manifest(file_id: Optional[str]) -> Optional[Dict]:
+    """Manifest of the upload a file_id points at, if there is one."""
+    name = upload_set(file_id)
+    if name is None:
+        return None
+    return _read_set(name)
+
+
+def image_fields(file_id: Optional[str]) -> Dict:
+    """ProductImage column values for an image, from its upload manifest."""
+    manifest = read_manifest(file_id)
+    if manifest is None:
+        return {}
+    fields = {"thumb_url": manifest["thumb_url"], "variants": manifest["variants"]}
+    # Manifests written before dimensions were recorded lack these; the
+    # background fill in routes.images computes them instead
+    fields.update({key: manifest[key] for key in IMAGE_INFO if key in manifest})
+    return fields
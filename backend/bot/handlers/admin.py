@@ -1,6 +1,7 @@
 """
 Admin handlers with FSM for product/category management.
 """
+import asyncio
 import os
 from aiogram import Router, F, Dispatcher
 from aiogram.filters import Command, StateFilter
@@ -21,8 +22,8 @@ from ..utils import (
     is_admin, get_categories, get_products, get_product,
     create_product, update_product, delete_product,
     create_category, update_category, create_subcategory, delete_category,
-    get_orders, update_order_status,
-    format_product_info, format_order_info
+    get_orders, get_stats, update_order_status, start_import, get_job,
+    format_product_info, format_order_info, format_job_progress
 )
 
 load_dotenv()
@@ -31,6 +32,10 @@ router = Router()
 
 ADMIN_IDS = [int(x.strip()) for x in os.getenv("ADMIN_IDS", "").split(",") if x.strip()]
 
+# Seconds between import progress checks (and message edits), and when to stop waiting
+IMPORT_POLL_INTERVAL = 2
+IMPORT_POLL_TIMEOUT = 30 * 60
+
 
 # FSM States
 class AddProductStates(StatesGroup):
@@ -432,7 +437,7 @@ async def start_import_excel(callback: CallbackQuery, state: FSMContext):
     await state.set_state(AddProductStates.waiting_excel)
     await callback.message.edit_text(
         "📊 <b>Массовый импорт товаров из Excel</b>\n\n"
-        "1. Подготовьте файл .xlsx с колонками:\n"
+        "1. Подготовьте файл .xlsx или .csv с колонками:\n"
         "<i>Категория, Подкатегория, Наименование, Артикул, Цена (за 1 шт/₽), Кол-во в пачке (шт), Описание</i>\n\n"
         "2. Отправьте файл мне сообщением.",
         reply_markup=get_cancel_keyboard()
@@ -440,25 +445,46 @@ async def start_import_excel(callback: CallbackQuery, state: FSMContext):
 
 @router.message(AddProductStates.waiting_excel, F.document)
 async def process_excel_document(message: Message, state: FSMContext):
-    """Handle the uploaded Excel file."""
-    if not message.document.file_name.endswith(('.xlsx', '.xls')):
-        await message.answer("❌ Пожалуйста, отправьте файл в формате Excel (.xlsx)")
+    """Handle the uploaded Excel file: start an import job and show its progress."""
+    if not message.document.file_name.lower().endswith(('.xlsx', '.xls', '.csv')):
+        await message.answer("❌ Пожалуйста, отправьте файл в формате Excel (.xlsx) или CSV")
         return
 
-    wait_msg = await message.answer("⏳ Обрабатываю файл, пожалуйста, подождите...")
-    
-    # Download file
-    file_id = message.document.file_id
-    file = await message.bot.get_file(file_id)
-    file_path = f"data/imports/{message.document.file_name}"
-    os.makedirs("data/imports", exist_ok=True)
-    
-    await message.bot.download_file(file.file_path, file_path)
+    wait_msg = await message.answer("⏳ Загружаю файл...")
     
     try:
-        # Import logic
-        from api.excel_processor import process_excel_import
-        result_text = await process_excel_import(file_path)
+        # Download file into memory and hand it to the API, which imports it in the background
+        file = await message.bot.get_file(message.document.file_id)
+        content = await message.bot.download_file(file.file_path)
+        job = await start_import(message.document.file_name, content.read())
+        # Jobs have an `error` field of their own; request failures set it to True
+        if job.get("error") is True:
+            raise RuntimeError(job["detail"])
+        
+        shown = None
+        waited = 0
+        while job.get("status") not in ("done", "failed"):
+            text = format_job_progress(job)
+            if text != shown:
+                # Telegram rejects edits that don't change the text
+                await wait_msg.edit_text(text)
+                shown = text
+            await asyncio.sleep(IMPORT_POLL_INTERVAL)
+            waited += IMPORT_POLL_INTERVAL
+            if waited > IMPORT_POLL_TIMEOUT:
+                raise RuntimeError("импорт идёт слишком долго, проверьте результат позже")
+            job = await get_job(job["id"])
+            if job.get("error") is True:
+                raise RuntimeError(job["detail"])
+        
+        if job["status"] == "failed":
+            result_text = f"❌ Ошибка при обработке файла: {job.get('error')}"
+        else:
+            result_text = job["result"]["message"]
+        if job.get("errors"):
+            result_text += "\n\n⚠️ " + "\n".join(job["errors"][:10])
+            if len(job["errors"]) > 10:
+                result_text += f"\n... и ещё {len(job['errors']) - 10}"
         
         await wait_msg.delete()
         await message.answer(result_text, reply_markup=get_admin_menu_keyboard())
@@ -470,12 +496,6 @@ async def process_excel_document(message: Message, state: FSMContext):
             reply_markup=get_admin_menu_keyboard()
         )
     finally:
-        # Clean up file
-        if os.path.exists(file_path):
-            try:
-                os.remove(file_path)
-            except:
-                pass
         await state.clear()
 
 
@@ -520,7 +540,7 @@ async def process_find_query(message: Message, state: FSMContext):
 
 async def search_and_show_products(message: Message, query: str):
     """Search and display products."""
-    result = await get_products(q=query, limit=10)
+    result = await get_products(q=query, limit=10, sort="relevance")
     
     if "error" in result:
         await message.answer(
@@ -812,7 +832,7 @@ async def add_product_to_category(callback: CallbackQuery, state: FSMContext):
 @router.callback_query(F.data == "admin:new_orders")
 async def show_new_orders(callback: CallbackQuery):
     """Show new orders."""
-    result = await get_orders(status="new")
+    result = await get_orders(status="new", limit=10, include_total=True)
     
     if "error" in result:
         await callback.message.edit_text(
@@ -831,11 +851,11 @@ async def show_new_orders(callback: CallbackQuery):
         return
     
     await callback.message.edit_text(
-        f"📦 <b>Новые заказы:</b> {len(orders)}",
+        f"📦 <b>Новые заказы:</b> {result.get('total', len(orders))}",
         reply_markup=get_admin_menu_keyboard()
     )
     
-    for order in orders[:10]:
+    for order in orders:
         text = format_order_info(order)
         await callback.message.answer(
             text,
@@ -883,24 +903,33 @@ async def reject_order(callback: CallbackQuery):
 async def show_stats(callback: CallbackQuery):
     """Show statistics."""
     products_result = await get_products(limit=1)
-    orders_result = await get_orders()
     categories = await get_categories()
     
     total_products = products_result.get("total", 0) if "error" not in products_result else 0
-    orders = orders_result.get("orders", []) if "error" not in orders_result else []
     
-    new_orders = sum(1 for o in orders if o.get("status") == "new")
-    completed_orders = sum(1 for o in orders if o.get("status") == "completed")
-    total_revenue = sum(o.get("total_amount", 0) for o in orders if o.get("status") in ["accepted", "completed"])
+    stats = await get_stats(days=7, top=5)
+    if "error" in stats:
+        stats = {}
+    by_status = stats.get("by_status", {})
+    week_revenue = sum(day["revenue"] for day in stats.get("daily", []))
+    
+    top_text = ""
+    if stats.get("top_products"):
+        top_text = "\n\n🏆 <b>Топ товаров:</b>\n" + "\n".join(
+            f"{i}. {p['product_name']} — {p['quantity_packs']} пач., {p['revenue']:.2f}₽"
+            for i, p in enumerate(stats["top_products"], 1)
+        )
     
     await callback.message.edit_text(
         f"📊 <b>Статистика магазина</b>\n\n"
         f"📁 Категорий: {len(categories)}\n"
         f"📦 Товаров: {total_products}\n"
-        f"🛒 Всего заказов: {len(orders)}\n"
-        f"🆕 Новых заказов: {new_orders}\n"
-        f"✅ Выполненных: {completed_orders}\n"
-        f"💰 Выручка: {total_revenue:.2f}₽",
+        f"🛒 Всего заказов: {stats.get('total_orders', 0)}\n"
+        f"🆕 Новых заказов: {by_status.get('new', {}).get('orders', 0)}\n"
+        f"✅ Выполненных: {by_status.get('completed', {}).get('orders', 0)}\n"
+        f"💰 Выручка: {stats.get('revenue', 0):.2f}₽\n"
+        f"📅 За 7 дней: {week_revenue:.2f}₽"
+        f"{top_text}",
         reply_markup=get_admin_menu_keyboard()
     )
 
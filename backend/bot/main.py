@@ -16,6 +16,7 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from .handlers import user, admin
 from .handlers.admin import setup_admin_handlers
+from .utils import close_client, get_client
 
 load_dotenv()
 
@@ -42,6 +43,9 @@ async def main():
     # Setup admin handlers with FSM
     setup_admin_handlers(dp)
     
+    # Shared keep-alive client for calls to the shop API
+    get_client()
+    
     print("Telegram Shop Bot started!")
     print("Press Ctrl+C to stop")
     
@@ -49,6 +53,7 @@ async def main():
     try:
         await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
     finally:
+        await close_client()
         await bot.session.close()
 
 
@@ -12,6 +12,26 @@ API_URL = os.getenv("API_URL", "http://localhost:8000")
 ADMIN_IDS = [int(x.strip()) for x in os.getenv("ADMIN_IDS", "").split(",") if x.strip()]
 
 
+# One pooled client for all API calls, opened in main() and closed on exit
+API_LIMITS = httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=60)
+_client: Optional[httpx.AsyncClient] = None
+
+
+def get_client() -> httpx.AsyncClient:
+    """The shared API client, created on first use if main() didn't open it."""
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(timeout=30.0, limits=API_LIMITS)
+    return _client
+
+
+async def close_client() -> None:
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
 def is_admin(user_id: int) -> bool:
     """Check if user is an admin."""
     return user_id in ADMIN_IDS
@@ -26,22 +46,22 @@ async def api_request(
     """Make a request to the API."""
     url = f"{API_URL}{endpoint}"
     
-    async with httpx.AsyncClient(timeout=30.0) as client:
-        if method == "GET":
-            response = await client.get(url, params=params)
-        elif method == "POST":
-            response = await client.post(url, json=data)
-        elif method == "PUT":
-            response = await client.put(url, json=data, params=params)
-        elif method == "DELETE":
-            response = await client.delete(url, params=params)
-        else:
-            raise ValueError(f"Unsupported method: {method}")
-        
-        if response.status_code >= 400:
-            return {"error": True, "status": response.status_code, "detail": response.json().get("detail", "Error")}
-        
-        return response.json()
+    client = get_client()
+    if method == "GET":
+        response = await client.get(url, params=params)
+    elif method == "POST":
+        response = await client.post(url, json=data)
+    elif method == "PUT":
+        response = await client.put(url, json=data, params=params)
+    elif method == "DELETE":
+        response = await client.delete(url, params=params)
+    else:
+        raise ValueError(f"Unsupported method: {method}")
+    
+    if response.status_code >= 400:
+        return {"error": True, "status": response.status_code, "detail": response.json().get("detail", "Error")}
+    
+    return response.json()
 
 
 async def get_categories() -> List[Dict]:
@@ -57,10 +77,13 @@ async def get_products(
     subcategory: Optional[int] = None,
     q: Optional[str] = None,
     page: int = 1,
-    limit: int = 10
+    limit: int = 10,
+    sort: Optional[str] = None
 ) -> Dict:
     """Get products from API."""
     params = {"page": page, "limit": limit}
+    if sort:
+        params["sort"] = sort
     if category:
         params["category"] = category
     if subcategory:
@@ -115,19 +138,61 @@ async def delete_category(category_id: int) -> Dict:
     return await api_request("DELETE", f"/api/categories/{category_id}")
 
 
-async def get_orders(status: Optional[str] = None) -> Dict:
-    """Get orders from API."""
-    params = {}
+async def get_orders(
+    status: Optional[str] = None,
+    limit: int = 50,
+    cursor: Optional[str] = None,
+    include_total: bool = False
+) -> Dict:
+    """Get one page of orders (newest first) from API."""
+    params = {"limit": limit}
     if status:
         params["status"] = status
+    if cursor:
+        params["cursor"] = cursor
+    if include_total:
+        params["include_total"] = "true"
     return await api_request("GET", "/api/orders", params=params)
 
 
+async def get_stats(days: int = 30, top: int = 5) -> Dict:
+    """Get aggregated order statistics from API."""
+    return await api_request("GET", "/api/admin/stats", params={"days": days, "top": top})
+
+
+async def start_import(filename: str, content: bytes) -> Dict:
+    """Upload an Excel price list; returns the started import job."""
+    response = await get_client().post(f"{API_URL}/api/products/import", files={"file": (filename, content)})
+    if response.status_code >= 400:
+        return {"error": True, "status": response.status_code, "detail": response.json().get("detail", "Error")}
+    return response.json()
+
+
+async def get_job(job_id: str) -> Dict:
+    """Get background job progress and result."""
+    return await api_request("GET", f"/api/admin/jobs/{job_id}")
+
+
 async def update_order_status(order_id: int, status: str) -> Dict:
     """Update order status."""
     return await api_request("PUT", f"/api/orders/{order_id}/status", params={"status": status})
 
 
+JOB_STAGES = {
+    "parsing": "Читаю файл",
+    "writing": "Записываю товары",
+    "indexing": "Обновляю поиск",
+}
+
+
+def format_job_progress(job: Dict) -> str:
+    """Progress line for a running import job."""
+    text = f"⏳ {JOB_STAGES.get(job.get('stage'), 'В очереди')}..."
+    if job.get("total"):
+        text += f"\n{job['done']} из {job['total']} строк ({job['progress'] * 100:.0f}%)"
+    return text
+
+
 def format_product_info(product: Dict) -> str:
     """Format product info for display."""
     pieces = product.get("pieces_per_pack", 1)
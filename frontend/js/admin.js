@@ -438,10 +438,17 @@ const Admin = {
             formData.append('file', files[i]);
 
             try {
-                const response = await fetch(`${API.baseUrl}/images/upload`, {
-                    method: 'POST',
-                    body: formData
-                });
+                let response;
+                // The server answers 429 while its image queue is full; wait and retry
+                for (let attempt = 0; attempt < 5; attempt++) {
+                    response = await fetch(`${API.baseUrl}/images/upload`, {
+                        method: 'POST',
+                        body: formData
+                    });
+                    if (response.status !== 429) break;
+                    const retryAfter = parseInt(response.headers.get('Retry-After') || '2', 10);
+                    await new Promise(resolve => setTimeout(resolve, retryAfter * 1000));
+                }
                 const data = await response.json();
                 if (data.file_id) {
                     this.currentProductImages.push(data.file_id);
@@ -543,14 +550,60 @@ const Admin = {
         status.textContent = 'Загрузка...';
         const formData = new FormData();
         formData.append('file', file);
+        const dryRun = document.getElementById('dryRunInput').checked;
 
         try {
-            const response = await fetch(`${API.baseUrl}/products/import`, { method: 'POST', body: formData });
-            const res = await response.json();
-            status.textContent = res.message || 'Готово';
+            const response = await fetch(`${API.baseUrl}/products/import?dry_run=${dryRun}`, { method: 'POST', body: formData });
+            let job = await response.json();
+            if (!response.ok) {
+                status.textContent = 'Ошибка: ' + (job.detail || response.status);
+                return;
+            }
+
+            // The import runs in the background; follow its progress
+            const stages = {
+                parsing: 'Чтение файла', comparing: 'Сравнение с каталогом',
+                writing: 'Запись товаров', indexing: 'Обновление поиска'
+            };
+            while (job.status === 'queued' || job.status === 'running') {
+                const stage = stages[job.stage] || 'В очереди';
+                status.textContent = job.total
+                    ? `${stage}: ${job.done} из ${job.total} (${Math.round(job.progress * 100)}%)`
+                    : `${stage}...`;
+                await new Promise(resolve => setTimeout(resolve, 1000));
+                job = await (await fetch(`${API.baseUrl}/admin/jobs/${job.id}`)).json();
+            }
+
+            status.textContent = job.status === 'done'
+                ? job.result.message
+                : 'Ошибка: ' + job.error;
+            if (job.status === 'done' && job.result.dry_run) {
+                status.textContent += this.formatImportDiff(job.result);
+            }
+            if (job.errors && job.errors.length) {
+                status.textContent += '\n' + job.errors.join('\n');
+            }
+            if (!dryRun) this.loadProducts();
         } catch (e) {
             status.textContent = 'Ошибка: ' + e;
         }
+    },
+
+    // Examples from a dry run report, one line each
+    formatImportDiff(result) {
+        const fields = {
+            name: 'название', category_id: 'категория', subcategory_id: 'подкатегория', sku: 'артикул',
+            price_per_unit: 'цена', pieces_per_pack: 'в пачке', description: 'описание'
+        };
+        const lines = [];
+        result.samples.added.forEach(name => lines.push(`+ ${name}`));
+        result.samples.changed.forEach(change => {
+            const diff = Object.entries(change.fields)
+                .map(([field, [before, after]]) => `${fields[field]}: ${before ?? '—'} → ${after ?? '—'}`);
+            lines.push(`~ ${change.name} (${diff.join('; ')})`);
+        });
+        result.samples.missing.forEach(name => lines.push(`− ${name} (нет в файле)`));
+        return lines.length ? '\n\nПримеры:\n' + lines.join('\n') : '';
     }
 };
 
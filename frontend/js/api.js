@@ -47,19 +47,51 @@ const API = {
         search = '',
         sort = 'newest',
         page = 1,
-        limit = 12
+        limit = 12,
+        cursor = null,
+        includeTotal = true
     } = {}) {
         const params = new URLSearchParams();
         if (category) params.append('category', category);
         if (subcategory) params.append('subcategory', subcategory);
         if (search) params.append('q', search);
         params.append('sort', sort);
-        params.append('page', page);
+        if (cursor) params.append('cursor', cursor);
+        else params.append('page', page);
         params.append('limit', limit);
+        if (!includeTotal) params.append('include_total', 'false');
 
         return this.request(`/products?${params.toString()}`);
     },
 
+    /**
+     * Ranked catalog search (word forms, typos, prefixes)
+     */
+    async searchProducts({
+        query,
+        category = null,
+        subcategory = null,
+        page = 1,
+        limit = 12
+    }) {
+        const params = new URLSearchParams();
+        params.append('q', query);
+        if (category) params.append('category', category);
+        if (subcategory) params.append('subcategory', subcategory);
+        params.append('page', page);
+        params.append('limit', limit);
+
+        return this.request(`/products/search?${params.toString()}`);
+    },
+
+    /**
+     * Autocomplete suggestions for the search box
+     */
+    async suggestProducts(query, limit = 8) {
+        const params = new URLSearchParams({ q: query, limit });
+        return this.request(`/products/suggest?${params.toString()}`);
+    },
+
     /**
      * Get single product
      */
@@ -125,6 +157,17 @@ const API = {
 
         // Telegram file_id - get via API proxy
         return `${this.baseUrl}/images/${fileIdOrUrl}?size=${size}`;
+    },
+
+    /**
+     * srcset of an uploaded product image's resized variants ('' if it has none)
+     */
+    getImageSrcset(image, type = 'image/webp') {
+        if (!image || !image.variants || image.variants.length === 0) return '';
+        return image.variants
+            .filter(v => v.type === type)
+            .map(v => `${this.getImageUrl(v.url)} ${v.width}w`)
+            .join(', ');
     }
 };
 
@@ -7,6 +7,7 @@ const Catalog = {
     currentCategory: null,
     currentSubcategory: null,
     currentPage: 1,
+    nextCursor: null,
     hasMore: true,
     isLoading: false,
     searchQuery: '',
@@ -354,6 +355,7 @@ const Catalog = {
 
         if (reset) {
             this.currentPage = 1;
+            this.nextCursor = null;
             this.products = [];
             this.hasMore = true;
             this.showSkeletonLoading();
@@ -364,18 +366,32 @@ const Catalog = {
         document.getElementById('noProducts').style.display = 'none';
 
         try {
-            const data = await API.getProducts({
-                category: this.currentCategory,
-                subcategory: this.currentSubcategory,
-                search: this.searchQuery,
-                sort: this.sortBy,
-                page: this.currentPage,
-                limit: this.itemsPerPage
-            });
+            // Text search goes to the ranked, typo-tolerant endpoint
+            const data = this.searchQuery
+                ? await API.searchProducts({
+                    query: this.searchQuery,
+                    category: this.currentCategory,
+                    subcategory: this.currentSubcategory,
+                    page: this.currentPage,
+                    limit: this.itemsPerPage
+                })
+                : await API.getProducts({
+                    category: this.currentCategory,
+                    subcategory: this.currentSubcategory,
+                    sort: this.sortBy,
+                    page: this.currentPage,
+                    limit: this.itemsPerPage,
+                    cursor: this.nextCursor,
+                    includeTotal: false
+                });
 
             const products = data.items || data.products || (Array.isArray(data) ? data : []);
 
-            if (products.length < this.itemsPerPage) {
+            this.nextCursor = data.next_cursor || null;
+            const lastPage = this.searchQuery
+                ? this.currentPage >= (data.pages || 1)
+                : (data.items && !this.nextCursor);
+            if (products.length < this.itemsPerPage || lastPage) {
                 this.hasMore = false;
             }
 
@@ -416,6 +432,21 @@ const Catalog = {
         this.loadProducts(false);
     },
 
+    /**
+     * width/height and blurred inline preview of a product image, so it is
+     * laid out and shows something before the file arrives ('' if unknown)
+     */
+    imagePlaceholderAttrs(image) {
+        let attrs = '';
+        if (image?.width && image?.height) {
+            attrs += `width="${image.width}" height="${image.height}" `;
+        }
+        if (image?.lqip) {
+            attrs += `style="background-image: url('${image.lqip}')"`;
+        }
+        return attrs;
+    },
+
     /**
      * Render products grid
      */
@@ -424,6 +455,10 @@ const Catalog = {
 
         const html = products.map(product => {
             const qtyInCart = this.getProductQtyInCart(product.id);
+            const mainImage = product.images?.[0];
+            // Uploaded photos come in several widths; let the browser pick the smallest that fits
+            const srcset = API.getImageSrcset(mainImage);
+            const avifSrcset = API.getImageSrcset(mainImage, 'image/avif');
             const badgeHtml = product.badge ?
                 `<span class="product-badge ${product.badge.type || 'hit'}">${product.badge.text || product.badge}</span>` : '';
 
@@ -431,14 +466,19 @@ const Catalog = {
             <div class="product-card" data-id="${product.id}">
                 ${badgeHtml}
                 <div class="product-image-wrapper">
+                    <picture>
+                    ${avifSrcset ? `<source type="image/avif" srcset="${avifSrcset}" sizes="(max-width: 600px) 50vw, 300px">` : ''}
                     <img 
                         class="product-image skeleton" 
-                        src="${API.getImageUrl(product.images?.[0]?.file_id || product.images?.[0]?.image_url || product.image_file_id || product.image_url, 'small')}"
+                        src="${mainImage?.thumb_url ? API.getImageUrl(mainImage.thumb_url) : API.getImageUrl(mainImage?.file_id || mainImage?.image_url || product.image_file_id || product.image_url, 'small')}"
+                        ${srcset ? `srcset="${srcset}" sizes="(max-width: 600px) 50vw, 300px"` : ''}
+                        ${this.imagePlaceholderAttrs(mainImage)}
                         alt="${product.name}"
                         loading="lazy"
-                        onload="this.classList.remove('skeleton'); this.classList.add('loaded');"
-                        onerror="this.onerror=null; this.classList.remove('skeleton'); this.classList.add('loaded'); this.src='assets/placeholder.svg'"
+                        onload="this.classList.remove('skeleton'); this.classList.add('loaded'); this.style.backgroundImage = '';"
+                        onerror="this.onerror=null; this.removeAttribute('srcset'); this.classList.remove('skeleton'); this.classList.add('loaded'); this.src='assets/placeholder.svg'"
                     >
+                    </picture>
                     <!-- Cart Button on Image (Bottom Right) -->
                     <button class="card-add-btn" onclick="Catalog.addToCartFromCard(${product.id}); event.stopPropagation();">
                          <svg width="20" height="20" viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2">
@@ -551,8 +591,10 @@ const Catalog = {
         const hasMultipleImages = product.images && product.images.length > 1;
 
         let imageSources = [];
+        let placeholders = [];
         if (product.images && product.images.length > 0) {
             imageSources = product.images.map(img => API.getImageUrl(img.file_id || img.image_url, 'large'));
+            placeholders = product.images.map(img => this.imagePlaceholderAttrs(img));
         } else {
             imageSources = [API.getImageUrl(product.image_file_id || product.image_url || product.image, 'large')];
         }
@@ -561,8 +603,8 @@ const Catalog = {
             imagesHtml = `
                 <div class="product-images-container">
                     <div class="product-images-slider">
-                        ${imageSources.map(src => `
-                            <img class="product-detail-image" src="${src}" alt="${product.name}" loading="lazy">
+                        ${imageSources.map((src, i) => `
+                            <img class="product-detail-image" src="${src}" ${placeholders[i] || ''} alt="${product.name}" loading="lazy" onload="this.style.backgroundImage = '';">
                         `).join('')}
                     </div>
                     <div class="slider-dots">
@@ -573,7 +615,7 @@ const Catalog = {
         } else {
             imagesHtml = `
                 <div class="product-images-container">
-                    <img class="product-detail-image" src="${imageSources[0]}" alt="${product.name}" onerror="this.src='assets/placeholder.svg'">
+                    <img class="product-detail-image" src="${imageSources[0]}" ${placeholders[0] || ''} alt="${product.name}" onload="this.style.backgroundImage = '';" onerror="this.src='assets/placeholder.svg'">
                 </div>
              `;
         }
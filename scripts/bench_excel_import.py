@@ -0,0 +1,91 @@
+"""
+Benchmark: Excel price list import on a synthetic workbook.
+
+Writes a workbook with the import's columns (50k rows by default, spread
+over 20 categories and 200 subcategories) and the same data as CSV, then
+runs the import job on them against a throwaway SQLite database: first
+into an empty catalog (all inserts), then again (nothing changed, so
+only parsing and the diff against the catalog remain). Parsing
+and writing overlap, so each run prints its total time, plus the peak
+memory of the parser process.
+
+Usage:
+    python scripts/bench_excel_import.py [rows]
+"""
+import asyncio
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+# Throwaway database, set before the app is imported
+_tmp_dir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(_tmp_dir, 'bench.db')}"
+
+# Add parent directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+import pandas as pd
+from sqlalchemy import func, select
+
+from api import jobs
+from api.database import init_db, AsyncSessionLocal
+from api.excel_processor import import_job
+from api.models import Product
+
+
+def make_price_list(rows: int) -> pd.DataFrame:
+    random.seed(42)
+    return pd.DataFrame({
+        'Категория': [f"Категория {i % 20}" for i in range(rows)],
+        'Подкатегория': [f"Подкатегория {i % 200}" for i in range(rows)],
+        'Наименование': [f"Товар {i} {random.choice(['красный', 'синий', 'большой'])}" for i in range(rows)],
+        'Артикул': [f"ART-{i:06d}" for i in range(rows)],
+        'Цена (за 1 шт/₽)': [round(random.uniform(5, 500), 2) for _ in range(rows)],
+        'Кол-во в пачке (шт)': [random.choice([1, 6, 12, 24]) for _ in range(rows)],
+        'Описание': [f"Описание товара {i}" if i % 3 else None for i in range(rows)],
+    })
+
+
+async def run(path: str, label: str) -> None:
+    # The job deletes its file
+    copy = f"{path}.run{os.path.splitext(path)[1]}"
+    shutil.copy(path, copy)
+    started = time.perf_counter()
+    result = await import_job(jobs.Job("excel_import"), copy)
+    elapsed = time.perf_counter() - started
+    # ru_maxrss of finished children: the parser process (KB on Linux)
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024
+    print(f"{label:<12} {elapsed:6.2f} s   parser peak {peak:5.0f} MB   "
+          f"added {result['added']}, updated {result['updated']}")
+
+
+async def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    xlsx = os.path.join(_tmp_dir, "price_list.xlsx")
+    csv = os.path.join(_tmp_dir, "price_list.csv")
+
+    started = time.perf_counter()
+    frame = make_price_list(rows)
+    frame.to_excel(xlsx, index=False)
+    frame.to_csv(csv, index=False, sep=";")
+    print(f"Workbook: {rows} rows, {os.path.getsize(xlsx) / 1024 / 1024:.1f} MB "
+          f"(written in {time.perf_counter() - started:.1f} s)")
+
+    await init_db()
+    await run(xlsx, "xlsx insert")
+    await run(xlsx, "xlsx update")
+    await run(csv, "csv update")
+
+    async with AsyncSessionLocal() as session:
+        total = await session.scalar(select(func.count()).select_from(Product))
+    print(f"Products in catalog: {total}")
+
+
+if __name__ == "__main__":
+    if os.name == 'nt':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    asyncio.run(main())
@@ -0,0 +1,147 @@
+"""
+Benchmark: image proxy throughput on cache misses, shared vs per-call HTTP client.
+
+Starts a local HTTPS stand-in for the Telegram Bot API (self-signed
+certificate, made with the openssl CLI) and points the API at it. Every
+request asks for a new file_id, so each one does a getFile call and a file
+download upstream. The run is done twice: with the shared pooled client
+(api.http_client) and with a fresh httpx.AsyncClient per call, which is
+how images.py and notifier.py used to work. Prints requests/s and latency.
+
+The stand-in is plain uvicorn, so it speaks HTTP/1.1 only: this measures
+connection and TLS session reuse. Against api.telegram.org the shared
+client also negotiates HTTP/2, and real round trips make each saved
+handshake cost far more than on localhost.
+
+Usage:
+    python scripts/bench_image_proxy.py [requests] [concurrency]
+"""
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+# Throwaway database, image cache and certificate, set before the app is imported
+_tmp_dir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(_tmp_dir, 'bench.db')}"
+os.environ["IMAGE_CACHE_DIR"] = os.path.join(_tmp_dir, "image_cache")
+os.environ["BOT_TOKEN"] = "bench"
+
+_port = None
+with socket.socket() as _sock:
+    _sock.bind(("127.0.0.1", 0))
+    _port = _sock.getsockname()[1]
+os.environ["TELEGRAM_API_URL"] = f"https://localhost:{_port}"
+
+CERT = os.path.join(_tmp_dir, "cert.pem")
+KEY = os.path.join(_tmp_dir, "key.pem")
+subprocess.run(
+    ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1",
+     "-subj", "/CN=localhost", "-addext", "subjectAltName=DNS:localhost",
+     "-keyout", KEY, "-out", CERT],
+    check=True, capture_output=True
+)
+# httpx trusts this bundle instead of certifi's for every client it creates
+os.environ["SSL_CERT_FILE"] = CERT
+
+# Add parent directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+import httpx
+import uvicorn
+
+from api import http_client
+from api.database import init_db
+from api.main import app
+
+PHOTO = os.urandom(120 * 1024)  # about a Telegram-compressed photo
+
+
+async def fake_telegram(scope, receive, send):
+    """getFile and file download endpoints of the Bot API."""
+    if scope["type"] != "http":
+        return
+    if "/getFile" in scope["path"]:
+        body = b'{"ok": true, "result": {"file_path": "photos/file.jpg"}}'
+        content_type = b"application/json"
+    else:
+        body = PHOTO
+        content_type = b"image/jpeg"
+    await send({"type": "http.response.start", "status": 200,
+                "headers": [(b"content-type", content_type), (b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+async def run(client, label, requests, concurrency, quiet=False):
+    latencies = []
+    queue = asyncio.Queue()
+    for i in range(requests):
+        queue.put_nowait(f"{label}-{i}")
+
+    async def worker():
+        while not queue.empty():
+            file_id = queue.get_nowait()
+            started = time.perf_counter()
+            response = await client.get(f"/api/images/{file_id}")
+            latencies.append((time.perf_counter() - started) * 1000)
+            assert response.status_code == 200 and len(response.content) == len(PHOTO), response.status_code
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    if quiet:
+        return
+    print(f"{label:<12} {requests / elapsed:7.1f} req/s   p50 {statistics.median(latencies):6.1f} ms   "
+          f"p99 {percentile(latencies, 99):6.1f} ms")
+
+
+async def main():
+    requests = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    server = uvicorn.Server(uvicorn.Config(
+        fake_telegram, host="127.0.0.1", port=_port,
+        ssl_certfile=CERT, ssl_keyfile=KEY, log_level="warning"
+    ))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    await init_db()
+    print(f"{requests} cache misses, {concurrency} in parallel, {len(PHOTO) // 1024} KB per image")
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        await run(client, "warmup", concurrency * 2, concurrency, quiet=True)
+        await run(client, "shared", requests, concurrency)
+        await http_client.close()
+
+        # The old way: a new client, connection and TLS handshake per call
+        opened = []
+
+        def fresh_client():
+            opened.append(httpx.AsyncClient())
+            return opened[-1]
+
+        http_client.get_client = fresh_client
+        await run(client, "per-call", requests, concurrency)
+        for c in opened:
+            await c.aclose()
+
+    server.should_exit = True
+    await serving
+
+
+if __name__ == "__main__":
+    if os.name == 'nt':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    asyncio.run(main())
@@ -0,0 +1,93 @@
+"""
+Benchmark: catalog search index lookups on a large synthetic catalog.
+
+Builds the in-process search index (api.search_index) from generated
+souvenir-shop products: a noun, an adjective, a resort town and a model
+code in every name, the same kind of words in two of three descriptions,
+so common words match thousands of products. Times /search and /suggest
+lookups: whole words, unfinished prefixes down to one letter, typos and
+an article. Prints the median and worst of several runs per query.
+
+Usage:
+    python scripts/bench_search.py [products]
+"""
+import os
+import random
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+
+# Add parent directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from api.search_index import SearchIndex
+
+NOUNS = (
+    "кружка магнит футболка брелок тарелка кепка панама полотенце сумка "
+    "шоппер открытка блокнот ручка чашка стакан бейсболка тапочки сланцы "
+    "матрас круг жилет нарукавники зонт очки маска ласты лежак коврик "
+    "мяч ведерко лопатка крем спрей статуэтка шкатулка колокольчик "
+    "подставка значок"
+).split()
+ADJECTIVES = (
+    "сувенирная надувной детский пляжный большой маленький синий красный "
+    "зеленый яркий складной морской летний керамическая белая"
+).split()
+TOWNS = (
+    "Сочи Адлер Анапа Геленджик Туапсе Ялта Алушта Евпатория Кисловодск "
+    "Пятигорск Абхазия Гагра Лазаревское Хоста Дагомыс"
+).split()
+
+QUERIES = (
+    "кружка сочи", "магнит анапа", "футболка", "надувной круг",
+    "к", "м", "с", "кр", "су", "кру", "сувенир",
+    "кружки", "зонтик", "кружк сочи", "матрсы", "ART-012345",
+)
+SUGGESTIONS = ("к", "кр", "кружка с", "магнит")
+
+RUNS = 7
+
+
+def make_products(count: int):
+    random.seed(42)
+    products = []
+    for i in range(1, count + 1):
+        noun, adjective, town = random.choice(NOUNS), random.choice(ADJECTIVES), random.choice(TOWNS)
+        description = f"{adjective} {noun} с видом на {town}, {random.randint(100, 900)} мл" if i % 3 else None
+        products.append(SimpleNamespace(
+            # Model codes like "с512" give every letter hundreds of completions
+            id=i, name=f"{noun} {adjective} {town} {random.choice('скмп')}{random.randint(100, 999)}",
+            sku=f"ART-{i:06d}",
+            description=description, category_id=i % 20, subcategory_id=None, active=True,
+        ))
+    return products
+
+
+def timed(fn, *args, **kwargs):
+    """Median and worst of RUNS calls in ms, plus the last result."""
+    times = []
+    for _ in range(RUNS):
+        started = time.perf_counter()
+        result = fn(*args, **kwargs)
+        times.append((time.perf_counter() - started) * 1000)
+    return statistics.median(times), max(times), result
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    started = time.perf_counter()
+    index = SearchIndex.build(make_products(count))
+    print(f"{count} products, {len(index.postings)} terms, built in {time.perf_counter() - started:.1f} s\n")
+
+    for q in QUERIES:
+        median, worst, (_, total) = timed(index.search, q, limit=20)
+        print(f"search  {q!r:<16} {median:6.2f} ms  max {worst:6.2f} ms  {total:6} matches")
+    for q in SUGGESTIONS:
+        median, worst, completions = timed(index.suggest, q)
+        print(f"suggest {q!r:<16} {median:6.2f} ms  max {worst:6.2f} ms  {completions[:3]}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
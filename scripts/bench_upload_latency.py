@@ -0,0 +1,134 @@
+"""
+Benchmark: catalog latency while a bulk photo upload is running.
+
+Runs the API in-process against a throwaway SQLite database and upload
+directory, measures GET /api/products latency on its own, then again
+while a bulk upload of large photos hits /api/images/upload. Prints
+p50/p99 for both runs and the upload status codes (429 = image queue
+full, client retries).
+
+Usage:
+    python scripts/bench_upload_latency.py [uploads] [parallel_uploads]
+    python scripts/bench_upload_latency.py --blocking   # old behaviour: Pillow on the event loop
+"""
+import asyncio
+import io
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+# Throwaway database and upload directory, set before the app is imported
+_tmp_dir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(_tmp_dir, 'bench.db')}"
+os.environ["UPLOAD_DIR"] = os.path.join(_tmp_dir, "uploads")
+
+# Add parent directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+import httpx
+from PIL import Image
+
+from api import imaging
+from api.database import init_db, AsyncSessionLocal
+from api.main import app
+from api.models import Category, Product
+
+CATALOG_REQUESTS = 300
+
+
+def make_photo() -> bytes:
+    """A 4000x3000 noisy JPEG, roughly what a phone camera produces."""
+    img = Image.effect_noise((4000, 3000), 64).convert("RGB")
+    output = io.BytesIO()
+    img.save(output, "JPEG", quality=90)
+    return output.getvalue()
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+async def seed():
+    await init_db()
+    async with AsyncSessionLocal() as session:
+        category = Category(name="Bench")
+        session.add(category)
+        await session.flush()
+        session.add_all([
+            Product(name=f"Товар {i}", category_id=category.id, price_per_unit=10 + i % 50)
+            for i in range(500)
+        ])
+        await session.commit()
+
+
+async def catalog_latencies(client):
+    latencies = []
+    for i in range(CATALOG_REQUESTS):
+        started = time.perf_counter()
+        response = await client.get("/api/products", params={"limit": 20, "page": 1 + i % 10})
+        latencies.append((time.perf_counter() - started) * 1000)
+        assert response.status_code == 200, response.text
+    return latencies
+
+
+async def bulk_upload(client, photo, uploads, parallel):
+    codes = {}
+    queue = asyncio.Queue()
+    for i in range(uploads):
+        # Bytes after the JPEG end marker make every upload a new photo, so
+        # none is answered from a set already stored under the same hash
+        queue.put_nowait(photo + i.to_bytes(4, "big"))
+
+    async def worker():
+        while not queue.empty():
+            contents = queue.get_nowait()
+            while True:
+                response = await client.post("/api/images/upload", files={"file": ("photo.jpg", contents, "image/jpeg")})
+                codes[response.status_code] = codes.get(response.status_code, 0) + 1
+                if response.status_code != 429:
+                    break
+                await asyncio.sleep(float(response.headers.get("Retry-After", 1)))
+
+    await asyncio.gather(*(worker() for _ in range(parallel)))
+    return codes
+
+
+def report(label, latencies):
+    print(f"{label:<22} p50 {statistics.median(latencies):7.1f} ms   "
+          f"p99 {percentile(latencies, 99):7.1f} ms   max {max(latencies):7.1f} ms")
+
+
+async def main():
+    args = [a for a in sys.argv[1:] if not a.startswith("--")]
+    uploads = int(args[0]) if args else 24
+    parallel = int(args[1]) if len(args) > 1 else 8
+
+    if "--blocking" in sys.argv:
+        async def run_inline(fn, *fn_args, **kwargs):
+            return fn(*fn_args, **kwargs)
+        imaging.run = run_inline
+
+    await seed()
+    photo = make_photo()
+    print(f"Photo: {len(photo) / 1024 / 1024:.1f} MB, {uploads} uploads, {parallel} in parallel, "
+          f"pool {imaging.MAX_WORKERS} workers / {imaging.MAX_PENDING} queued")
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=300) as client:
+        await catalog_latencies(client)  # warm up
+        report("catalog idle", await catalog_latencies(client))
+
+        upload = asyncio.create_task(bulk_upload(client, photo, uploads, parallel))
+        await asyncio.sleep(0.05)
+        report("catalog during upload", await catalog_latencies(client))
+        codes = await upload
+    print(f"Upload responses: {codes}")
+
+
+if __name__ == "__main__":
+    if os.name == 'nt':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    asyncio.run(main())
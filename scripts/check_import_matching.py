@@ -0,0 +1,105 @@
+"""
+Check: how the price list import matches rows to existing products.
+
+Runs the import job on small CSV price lists against a throwaway SQLite
+database and checks that:
+- a product without an article, listed under two articles, is kept for
+  the first one and the second becomes a new product;
+- a file without the Артикул column, or with an empty cell, keeps the
+  article a product already has;
+- a product matched by article is renamed and moved, not duplicated.
+Fails (exit 1) if any of them doesn't hold.
+
+Usage:
+    python scripts/check_import_matching.py
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+# Throwaway database, set before the app is imported
+_tmp_dir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(_tmp_dir, 'check.db')}"
+
+# Add parent directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from sqlalchemy import select
+
+from api import jobs
+from api.database import init_db, AsyncSessionLocal
+from api.excel_processor import import_job
+from api.models import Category, Product
+
+
+async def run_import(header, *rows):
+    path = os.path.join(_tmp_dir, "price_list.csv")
+    with open(path, "w", encoding="utf-8") as f:
+        for row in (header, *rows):
+            f.write(";".join(row) + "\n")
+    return await import_job(jobs.Job("excel_import"), path)
+
+
+async def products(name=None):
+    async with AsyncSessionLocal() as session:
+        query = select(Product).order_by(Product.id)
+        if name is not None:
+            query = query.where(Product.name == name)
+        return (await session.execute(query)).scalars().all()
+
+
+async def main():
+    await init_db()
+    async with AsyncSessionLocal() as session:
+        category = Category(name="Одежда")
+        session.add(category)
+        await session.flush()
+        session.add_all([
+            # Imported before articles were stored
+            Product(name="Шорты", category_id=category.id, price_per_unit=100),
+            # Article set by hand in the admin
+            Product(name="Панама", category_id=category.id, price_per_unit=50, sku="KEEP-ME"),
+            Product(name="Кепка", category_id=category.id, price_per_unit=70, sku="CAP-1"),
+        ])
+        await session.commit()
+
+    failures = []
+
+    def check(ok, message):
+        print(("✅ " if ok else "❌ ") + message)
+        if not ok:
+            failures.append(message)
+
+    header = ["Категория", "Наименование", "Артикул", "Цена (за 1 шт/₽)"]
+    result = await run_import(header, ["Одежда", "Шорты", "SH-S", "110"], ["Одежда", "Шорты", "SH-M", "120"])
+    shorts = await products("Шорты")
+    check(
+        sorted(p.sku for p in shorts) == ["SH-M", "SH-S"] and (result["added"], result["updated"]) == (1, 1),
+        f"Two articles of one legacy product: {[(p.id, p.sku) for p in shorts]}, "
+        f"added {result['added']}, updated {result['updated']}"
+    )
+
+    await run_import(["Категория", "Наименование", "Цена (за 1 шт/₽)"], ["Одежда", "Панама", "55"])
+    await run_import(header, ["Одежда", "Панама", "", "60"])
+    (panama,) = await products("Панама")
+    check(
+        panama.sku == "KEEP-ME" and float(panama.price_per_unit) == 60,
+        f"Article kept without the column or the cell: {panama.sku}, price {panama.price_per_unit}"
+    )
+
+    await run_import(header, ["Головные уборы", "Кепка летняя", "CAP-1", "75"])
+    caps = [p for p in await products() if p.sku == "CAP-1"]
+    check(
+        len(caps) == 1 and caps[0].name == "Кепка летняя" and float(caps[0].price_per_unit) == 75,
+        f"Renamed and moved by article: {[(p.id, p.name, p.category_id) for p in caps]}"
+    )
+
+    print("✅ Import matching holds" if not failures else f"❌ {len(failures)} check(s) failed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    if os.name == 'nt':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,163 @@
+"""
+Index audit: runs EXPLAIN QUERY PLAN over the SQL the API actually emits.
+
+Drives the read endpoints in-process (no server needed), records every
+SELECT they send to the database and explains each one. Exits with
+status 1 if any statement does a full table scan, or if a cursor page
+walks its index from the start instead of seeking to the cursor.
+
+Usage:
+    python scripts/explain_queries.py            # against DATABASE_URL
+    python scripts/explain_queries.py --verbose  # print every plan
+"""
+import asyncio
+import os
+import sys
+
+# Add parent directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from dotenv import load_dotenv
+load_dotenv()
+
+import httpx
+from sqlalchemy import event, select
+
+from api.database import engine, init_db, AsyncSessionLocal
+from api.main import app
+from api.models import Category, Order, Product, Subcategory
+
+SORTS = ["newest", "oldest", "price_asc", "price_desc", "name_asc", "name_desc"]
+
+# Small lookup and rollup tables that endpoints read whole on purpose
+ALLOWED_SCANS = {"categories", "order_stats_daily", "product_sales"}
+
+
+async def pick_ids():
+    """Real ids to put into filters so the planner sees realistic queries."""
+    async with AsyncSessionLocal() as session:
+        category_id = (await session.execute(select(Category.id).limit(1))).scalar() or 1
+        subcategory_id = (await session.execute(select(Subcategory.id).limit(1))).scalar() or 1
+        product_id = (await session.execute(select(Product.id).limit(1))).scalar() or 1
+        order = (await session.execute(select(Order).limit(1))).scalar()
+    return category_id, subcategory_id, product_id, order
+
+
+async def drive_endpoints(call):
+    """Hit every hot read path through `call(label, method, url, **kwargs)`."""
+    category_id, subcategory_id, product_id, order = await pick_ids()
+
+    for sort in SORTS:
+        for label, params in (
+            ("all", {}),
+            ("category", {"category": category_id}),
+            ("subcategory", {"subcategory": subcategory_id}),
+        ):
+            params = {**params, "sort": sort, "limit": 5}
+            response = await call(f"products {label} {sort}", "GET", "/api/products", params=params)
+            cursor = response.json().get("next_cursor")
+            if cursor:
+                await call(f"products {label} {sort} cursor", "GET", "/api/products", params={**params, "cursor": cursor})
+
+    await call("products fts", "GET", "/api/products", params={"q": "мяч", "sort": "relevance"})
+    await call("products search", "GET", "/api/products/search", params={"q": "мяч"})
+    await call("product", "GET", f"/api/products/{product_id}")
+    await call("categories", "GET", "/api/categories")
+    await call("cart validate", "POST", "/api/cart/validate",
+               json={"items": [{"product_id": product_id, "quantity_packs": 1}]})
+    for label, params in (
+        ("orders", {}),
+        ("orders status", {"status": "new"}),
+        ("orders dates", {"date_from": "2024-01-01T00:00:00", "date_to": "2030-01-01T00:00:00"}),
+    ):
+        response = await call(label, "GET", "/api/orders", params={**params, "limit": 2})
+        cursor = response.json().get("next_cursor")
+        if cursor:
+            await call(f"{label} cursor", "GET", "/api/orders", params={**params, "limit": 2, "cursor": cursor})
+    await call("orders new", "GET", "/api/orders", params={"status": "new", "include_total": "true"})
+    await call("orders export", "GET", "/api/orders/export", params={"status": "new"})
+    await call("stats", "GET", "/api/admin/stats")
+    if order:
+        await call("orders me", "GET", "/api/orders/me", params={"telegram_user_id": order.telegram_user_id})
+        await call("order", "GET", f"/api/orders/{order.id}")
+
+
+def full_scans(plan_rows, statement: str):
+    """
+    Plan lines that walk a whole table. An index walk cut short by LIMIT
+    (keyset pages) is fine; virtual FTS tables and ALLOWED_SCANS are skipped.
+    """
+    limited = " LIMIT " in statement.upper()
+    scans = []
+    for *_, detail in plan_rows:
+        if not detail.startswith("SCAN ") or "VIRTUAL TABLE" in detail:
+            continue
+        table = detail.split()[1]
+        if table in ALLOWED_SCANS or table == "CONSTANT":
+            continue
+        if limited and "INDEX" in detail:
+            continue
+        scans.append(detail)
+    return scans
+
+
+def seeks(plan_rows) -> bool:
+    """Whether the plan seeks a range of an index (the keyset condition)."""
+    return any(
+        detail.startswith("SEARCH ") and ("<?" in detail or ">?" in detail)
+        for *_, detail in plan_rows
+    )
+
+
+async def main():
+    verbose = "--verbose" in sys.argv
+    await init_db()
+
+    captured = []
+    current = {"label": None}
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if current["label"] and statement.lstrip().upper().startswith("SELECT"):
+            captured.append((current["label"], statement, parameters))
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://audit") as client:
+        async def call(label, method, url, **kwargs):
+            current["label"] = label
+            response = await client.request(method, url, **kwargs)
+            if response.status_code >= 500:
+                print(f"⚠️ {label}: HTTP {response.status_code}")
+            return response
+
+        event.listen(engine.sync_engine, "before_cursor_execute", record)
+        try:
+            await drive_endpoints(call)
+        finally:
+            event.remove(engine.sync_engine, "before_cursor_execute", record)
+
+    failures = 0
+    seen = set()
+    async with engine.connect() as conn:
+        for label, statement, parameters in captured:
+            if (label, statement) in seen:
+                continue
+            seen.add((label, statement))
+            plan = (await conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)).all()
+            scans = full_scans(plan, statement)
+            if "cursor" in label and " LIMIT " in statement.upper() and not seeks(plan):
+                scans.append("no range seek to the cursor")
+            if scans:
+                failures += 1
+                print(f"❌ {label}: {'; '.join(scans)}")
+                print(f"   {' '.join(statement.split())[:300]}")
+            elif verbose:
+                print(f"✅ {label}: {'; '.join(row[-1] for row in plan)}")
+
+    print(f"\nChecked {len(seen)} statements, {failures} with full table scans.")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    if os.name == 'nt':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    sys.exit(asyncio.run(main()))
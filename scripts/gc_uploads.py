@@ -0,0 +1,99 @@
+"""
+Garbage-collect uploaded photos no product refers to any more.
+
+Counts references to every upload set (ProductImage.file_id, thumb_url
+and variants, plus the legacy Product.image_file_id / image_url) and
+deletes the files of sets with zero references. Sets younger than
+--min-age-hours are kept: their product form may not be saved yet.
+Uploading the same photo again touches its files, so the grace period
+restarts for a reused set too.
+
+Usage:
+    python scripts/gc_uploads.py                    # dry run, prints what would go
+    python scripts/gc_uploads.py --delete           # actually delete
+    python scripts/gc_uploads.py --delete --min-age-hours 48
+"""
+import asyncio
+import os
+import sys
+import time
+from collections import Counter, defaultdict
+
+# Add parent directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from sqlalchemy import select
+
+from api.database import AsyncSessionLocal
+from api.models import Product, ProductImage
+from api.uploads import UPLOAD_DIR, set_name, upload_set
+
+
+async def count_references() -> Counter:
+    """Upload set name -> number of rows referring to it."""
+    refs = Counter()
+    async with AsyncSessionLocal() as session:
+        result = await session.execute(
+            select(ProductImage.file_id, ProductImage.thumb_url, ProductImage.variants)
+        )
+        for file_id, thumb_url, variants in result.all():
+            names = {upload_set(file_id), upload_set(thumb_url)}
+            names.update(upload_set(v.get("url")) for v in variants or [])
+            refs.update(name for name in names if name)
+
+        result = await session.execute(select(Product.image_file_id, Product.image_url))
+        for file_id, image_url in result.all():
+            names = {upload_set(file_id), upload_set(image_url)}
+            refs.update(name for name in names if name)
+    return refs
+
+
+async def main():
+    delete = "--delete" in sys.argv
+    min_age_hours = 24.0
+    if "--min-age-hours" in sys.argv:
+        min_age_hours = float(sys.argv[sys.argv.index("--min-age-hours") + 1])
+
+    if not UPLOAD_DIR.exists():
+        print(f"No upload directory at {UPLOAD_DIR}")
+        return 0
+
+    refs = await count_references()
+
+    # Files grouped by set; temp files of interrupted writes are their own set
+    sets = defaultdict(list)
+    for path in UPLOAD_DIR.iterdir():
+        if path.is_file():
+            sets[set_name(path.name) if not path.name.startswith(".") else path.name].append(path)
+
+    cutoff = time.time() - min_age_hours * 3600
+    freed = removed_sets = kept_young = 0
+    for name, paths in sorted(sets.items()):
+        if refs[name]:
+            continue
+        if max(p.stat().st_mtime for p in paths) > cutoff:
+            kept_young += 1
+            continue
+        size = sum(p.stat().st_size for p in paths)
+        print(f"{'🗑️ ' if delete else '  '}{name}: {len(paths)} files, {size / 1024:.0f} KB")
+        if delete:
+            for path in paths:
+                path.unlink(missing_ok=True)
+        freed += size
+        removed_sets += 1
+
+    referenced = sum(1 for name in sets if refs[name])
+    print(f"\nUpload sets: {len(sets)} on disk, {referenced} referenced, "
+          f"{kept_young} unreferenced but younger than {min_age_hours:g}h")
+    action = "Deleted" if delete else "Would delete (pass --delete)"
+    print(f"{action}: {removed_sets} sets, {freed / 1024 / 1024:.1f} MB")
+    return 0
+
+
+if __name__ == "__main__":
+    if os.name == 'nt':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,86 @@
+"""
+Concurrency check for atomic stock reservation.
+
+Creates a throwaway SQLite database, puts a limited stock on one SKU
+and fires hundreds of parallel checkouts at it through the real
+/api/orders endpoint. Fails (exit 1) on any oversell or lost update.
+
+Usage:
+    python scripts/stress_stock_reservation.py [orders] [stock] [packs_per_order]
+"""
+import asyncio
+import os
+import sys
+import tempfile
+
+# Throwaway database, set before the app is imported
+_tmp_dir = tempfile.mkdtemp()
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.join(_tmp_dir, 'stress.db')}"
+os.environ.pop("BOT_TOKEN", None)
+
+# Add parent directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "backend"))
+
+import httpx
+from sqlalchemy import func, select
+
+from api.database import init_db, AsyncSessionLocal
+from api.main import app
+from api.models import Category, OrderItem, Product
+
+
+async def main():
+    orders = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    stock = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    packs = int(sys.argv[3]) if len(sys.argv) > 3 else 1
+
+    await init_db()
+    async with AsyncSessionLocal() as session:
+        category = Category(name="Stress")
+        session.add(category)
+        await session.flush()
+        product = Product(name="Hot SKU", category_id=category.id, price_per_unit=10, in_stock=stock)
+        unlimited = Product(name="Unlimited SKU", category_id=category.id, price_per_unit=5)
+        session.add_all([product, unlimited])
+        await session.commit()
+        product_id, unlimited_id = product.id, unlimited.id
+
+    async def checkout(client, n):
+        return await client.post("/api/orders", json={
+            "customer_name": f"Buyer {n}",
+            "customer_phone": "+70000000000",
+            "telegram_user_id": n,
+            "items": [
+                {"product_id": product_id, "quantity_packs": packs},
+                {"product_id": unlimited_id, "quantity_packs": 1},
+            ],
+        })
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://stress", timeout=120) as client:
+        responses = await asyncio.gather(*(checkout(client, n) for n in range(orders)))
+
+    codes = {}
+    for response in responses:
+        codes[response.status_code] = codes.get(response.status_code, 0) + 1
+
+    async with AsyncSessionLocal() as session:
+        left = (await session.execute(select(Product.in_stock).where(Product.id == product_id))).scalar()
+        sold = (await session.execute(
+            select(func.coalesce(func.sum(OrderItem.quantity_packs), 0)).where(OrderItem.product_id == product_id)
+        )).scalar()
+
+    accepted = codes.get(200, 0)
+    expected = min(orders, stock // packs)
+    print(f"Responses: {codes}")
+    print(f"Stock: {stock} -> {left}, packs sold: {sold}, accepted orders: {accepted} (expected {expected})")
+
+    ok = left >= 0 and sold + left == stock and accepted == expected and set(codes) <= {200, 400, 409}
+    print("✅ No oversell" if ok else "❌ Stock reservation is not atomic")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    if os.name == 'nt':
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    sys.exit(asyncio.run(main()))